@@ -2,8 +2,13 @@ import os
 import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from services.metrics import metrics
+from services.llm_backends import llm_backends
+from services.llm_limiter import llm_limiter
+from services.single_flight import single_flight
 
 # Configure logging for debug mode
 logging.basicConfig(level=logging.DEBUG)
@@ -21,7 +26,82 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 # Configure upload and download folders
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['DOWNLOAD_FOLDER'] = 'downloads'
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max request size
+app.config['MAX_UPLOAD_FILE_BYTES'] = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))  # Per uploaded file
+
+# Configure the cache of exported PDF/Word reports (stored under DOWNLOAD_FOLDER/exports)
+app.config['EXPORT_CACHE_MAX_AGE_SECONDS'] = int(os.environ.get("EXPORT_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+app.config['EXPORT_CACHE_MAX_BYTES'] = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Configure data retention (`flask storage gc`); 0 disables a limit
+app.config['SESSION_RETENTION_DAYS'] = int(os.environ.get("SESSION_RETENTION_DAYS", "30"))  # Sessions not updated for this long are deleted
+app.config['UPLOAD_ORPHAN_GRACE_SECONDS'] = int(os.environ.get("UPLOAD_ORPHAN_GRACE_SECONDS", "900"))  # Unreferenced uploads younger than this are kept
+app.config['ARTIFACT_RETENTION_DAYS'] = int(os.environ.get("ARTIFACT_RETENTION_DAYS", "30"))  # Parsed results of deleted uploads
+app.config['BATCH_OUTPUT_RETENTION_DAYS'] = int(os.environ.get("BATCH_OUTPUT_RETENTION_DAYS", "0"))  # Folders under downloads/batches
+app.config['UPLOAD_QUOTA_BYTES'] = int(os.environ.get("UPLOAD_QUOTA_BYTES", str(20 * 1024 * 1024 * 1024)))
+
+# Configure the WeasyPrint renderer process pool (0 workers renders in the request thread)
+app.config['PDF_RENDER_WORKERS'] = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+app.config['PDF_RENDER_MAX_QUEUED'] = int(os.environ.get("PDF_RENDER_MAX_QUEUED", "8"))
+app.config['PDF_RENDER_QUEUE_TIMEOUT'] = float(os.environ.get("PDF_RENDER_QUEUE_TIMEOUT", "30"))  # seconds
+
+# Configure the in-process prompt cache (how often each process checks for prompts saved elsewhere)
+app.config['PROMPT_CACHE_CHECK_SECONDS'] = float(os.environ.get("PROMPT_CACHE_CHECK_SECONDS", "2"))
+
+# Configure background analysis jobs (set JOB_INLINE_WORKERS=0 and run `flask run-worker` for a separate pool)
+app.config['JOB_INLINE_WORKERS'] = int(os.environ.get("JOB_INLINE_WORKERS", "2"))
+app.config['JOB_POLL_INTERVAL'] = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))  # seconds
+app.config['JOB_STALE_SECONDS'] = int(os.environ.get("JOB_STALE_SECONDS", "600"))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+app.config['JOB_PARTIAL_FLUSH_SECONDS'] = float(os.environ.get("JOB_PARTIAL_FLUSH_SECONDS", "0.5"))  # streamed output write interval
+app.config['JOB_STREAM_POLL_INTERVAL'] = float(os.environ.get("JOB_STREAM_POLL_INTERVAL", "0.25"))  # server-sent events poll interval
+
+# Configure batch runs (`flask batch run MANIFEST`)
+app.config['BATCH_CONCURRENCY'] = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+app.config['BATCH_ITEMS_PER_MINUTE'] = float(os.environ.get("BATCH_ITEMS_PER_MINUTE", "0"))  # 0 = unlimited
+
+# Configure the LLM response cache
+app.config['LLM_CACHE_ENABLED'] = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+app.config['LLM_CACHE_TTL_SECONDS'] = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+app.config['LLM_CACHE_MAX_ENTRIES'] = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+app.config['LLM_CACHE_MAX_BYTES'] = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Configure the LLM backend: "openai" calls the API (or OPENAI_BASE_URL), "record" also saves every
+# response under LLM_RECORDINGS_FOLDER and "replay" answers from those recordings without the network
+app.config['LLM_MODEL'] = os.environ.get("LLM_MODEL", "gpt-4o")
+app.config['LLM_BACKEND'] = os.environ.get("LLM_BACKEND", "openai")
+app.config['LLM_RECORDINGS_FOLDER'] = os.environ.get("LLM_RECORDINGS_FOLDER", "llm_recordings")
+app.config['LLM_REPLAY_SPEED'] = float(os.environ.get("LLM_REPLAY_SPEED", "0"))  # 1 replays at the recorded response times
+app.config['LLM_REPLAY_MATCH'] = os.environ.get("LLM_REPLAY_MATCH", "exact")  # "loose" reuses a recording of the same kind of call
+
+# Configure LLM rate limits shared by all processes through LLM_LIMITER_FOLDER (set them to the account's
+# quota; 0 disables a limit), retries of 429s, timeouts and 5xx errors, and the circuit breaker
+app.config['LLM_LIMITER_FOLDER'] = os.environ.get("LLM_LIMITER_FOLDER", "llm_limiter")
+app.config['LLM_REQUESTS_PER_MINUTE'] = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0"))
+app.config['LLM_TOKENS_PER_MINUTE'] = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "0"))
+app.config['LLM_RATE_LIMIT_MAX_WAIT_SECONDS'] = float(os.environ.get("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "300"))
+app.config['LLM_REQUEST_TIMEOUT_SECONDS'] = float(os.environ.get("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+app.config['LLM_MAX_RETRIES'] = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+app.config['LLM_RETRY_BASE_SECONDS'] = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "1"))
+app.config['LLM_RETRY_MAX_SECONDS'] = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "60"))
+app.config['LLM_CIRCUIT_FAILURE_THRESHOLD'] = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))  # consecutive failures
+app.config['LLM_CIRCUIT_RESET_SECONDS'] = float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Configure coalescing of identical in-flight work (PDF extraction, LLM calls, analysis jobs, reports) across
+# processes: the first caller does the work and later callers wait up to SINGLE_FLIGHT_WAIT_SECONDS for its result
+app.config['SINGLE_FLIGHT_FOLDER'] = os.environ.get("SINGLE_FLIGHT_FOLDER", "single_flight")
+app.config['SINGLE_FLIGHT_WAIT_SECONDS'] = float(os.environ.get("SINGLE_FLIGHT_WAIT_SECONDS", "900"))
+
+# Configure chunked transcript analysis
+app.config['LLM_CHUNK_TOKENS'] = int(os.environ.get("LLM_CHUNK_TOKENS", "4000"))  # Max transcript tokens per LLM call
+app.config['LLM_MAX_PARALLEL_CALLS'] = int(os.environ.get("LLM_MAX_PARALLEL_CALLS", "4"))
+
+# Configure PDF extraction (values above 1 split large transcripts across worker processes)
+app.config['PDF_EXTRACT_WORKERS'] = int(os.environ.get("PDF_EXTRACT_WORKERS", "1"))
+
+# Configure metrics (each process writes its totals under METRICS_FOLDER; /metrics adds them up)
+app.config['METRICS_FOLDER'] = os.environ.get("METRICS_FOLDER", "metrics")
+app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///equity_research.db")
@@ -37,10 +117,65 @@ db.init_app(app)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
 
+metrics.configure(app.config['METRICS_FOLDER'], app.config['METRICS_FLUSH_SECONDS'])
+llm_backends.configure(
+    app.config['LLM_BACKEND'],
+    recordings_folder=app.config['LLM_RECORDINGS_FOLDER'],
+    replay_speed=app.config['LLM_REPLAY_SPEED'],
+    replay_match=app.config['LLM_REPLAY_MATCH'],
+    request_timeout=app.config['LLM_REQUEST_TIMEOUT_SECONDS']
+)
+llm_limiter.configure(
+    app.config['LLM_LIMITER_FOLDER'],
+    requests_per_minute=app.config['LLM_REQUESTS_PER_MINUTE'],
+    tokens_per_minute=app.config['LLM_TOKENS_PER_MINUTE'],
+    max_wait_seconds=app.config['LLM_RATE_LIMIT_MAX_WAIT_SECONDS'],
+    max_retries=app.config['LLM_MAX_RETRIES'],
+    retry_base_seconds=app.config['LLM_RETRY_BASE_SECONDS'],
+    retry_max_seconds=app.config['LLM_RETRY_MAX_SECONDS'],
+    failure_threshold=app.config['LLM_CIRCUIT_FAILURE_THRESHOLD'],
+    reset_seconds=app.config['LLM_CIRCUIT_RESET_SECONDS']
+)
+single_flight.configure(app.config['SINGLE_FLIGHT_FOLDER'], app.config['SINGLE_FLIGHT_WAIT_SECONDS'])
+
+def add_missing_columns():
+    """Add nullable columns introduced after a table was first created (create_all skips existing tables)"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            logging.info(f"Added column {table.name}.{column.name}")
+
+def add_missing_indexes():
+    """Create indexes introduced after a table was first created"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
+                logging.info(f"Added index {index.name}")
+
 with app.app_context():
-    # Import models and routes
+    # Import models, routes and CLI commands
     import models
     import routes
+    import commands
+    
+    # Stream uploaded files straight into the upload store while the request is parsed
+    from services.artifact_store import UploadRequest
+    app.request_class = UploadRequest
     
     # Create all database tables
     db.create_all()
+    add_missing_columns()
+    add_missing_indexes()
@@ -0,0 +1,79 @@
+"""
+Benchmark Word export: converting the rendered HTML versus writing from report data
+
+Run from the project folder:
+
+    python benchmarks/bench_docx_export.py --line-items 50 --repeat 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.report_generator import ReportGenerator
+
+
+def make_report_inputs(line_items):
+    """Build synthetic financial data and transcript analysis of a realistic size"""
+    financial_data = {
+        'line_items': [
+            {'line_item': f'Metric {i}', 'previous_value': 1000.0 + i, 'estimate': 1100.0 + i}
+            for i in range(line_items)
+        ]
+    }
+    paragraph = "Management discussed demand trends, pricing, cost discipline and capital allocation in detail. " * 8
+    transcript_analysis = {
+        'management_commentary': '\n\n'.join([paragraph] * 3),
+        'strategic_themes': '\n\n'.join([paragraph] * 2),
+        'risks_and_tailwinds': '\n\n'.join([paragraph] * 2),
+        'qa_insights': '\n\n'.join([paragraph] * 3),
+        'financial_highlights': paragraph,
+        'market_dynamics': paragraph
+    }
+    return financial_data, transcript_analysis
+
+
+def time_export(export, repeat):
+    """Return the median export time in milliseconds and the size of the last file"""
+    timings = []
+    file_path = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        file_path = export()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], os.path.getsize(file_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--line-items', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    report_generator = ReportGenerator()
+    financial_data, transcript_analysis = make_report_inputs(args.line_items)
+    report_data = report_generator.build_report_data('Example Corp', 'Q3 2025', financial_data, transcript_analysis)
+    html_report = report_generator.render_html(report_data)
+
+    with tempfile.TemporaryDirectory() as html_folder, tempfile.TemporaryDirectory() as data_folder:
+        html_ms, html_size = time_export(
+            lambda: report_generator.export_to_docx(html_report, 'Example Corp', 'Q3 2025', html_folder),
+            args.repeat
+        )
+        data_ms, data_size = time_export(
+            lambda: report_generator.export_to_docx(html_report, 'Example Corp', 'Q3 2025', data_folder, report_data=report_data),
+            args.repeat
+        )
+
+    print(f"{args.line_items} line items, median of {args.repeat} runs")
+    print(f"  HTML conversion:  {html_ms:8.1f} ms  {html_size:>8} bytes (financial table flattened)")
+    print(f"  From report data: {data_ms:8.1f} ms  {data_size:>8} bytes (with financial table)")
+    print(f"  Speedup: {html_ms / data_ms:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""
+Benchmark the document pipeline end to end on synthetic inputs
+
+Run from the project folder:
+
+    python benchmarks/run_benchmarks.py --save-baseline            # record a baseline
+    python benchmarks/run_benchmarks.py                            # compare against it
+    python benchmarks/run_benchmarks.py --scenario excel_parse --rows 20000 --repeat 3
+
+Scenarios cover Excel parsing, PDF text extraction, transcript cleaning and section
+extraction, transcript analysis and report generation (with a stub LLM), HTML rendering
+and PDF/Word export. Results are written as JSON; when a baseline file exists each
+scenario's median is compared with it and the run exits with status 1 if any scenario is
+slower than the baseline by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+PROJECT_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+sys.path.insert(0, PROJECT_FOLDER)
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+import synthetic
+
+DEFAULT_RESULTS_PATH = os.path.join(BENCHMARK_FOLDER, 'results', 'latest.json')
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_FOLDER, 'results', 'baseline.json')
+
+# Bump when scenarios change in a way that makes older result files incomparable
+RESULTS_FORMAT_VERSION = 1
+
+# Registered scenarios in run order: name -> setup function
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a scenario; its setup receives the BenchmarkInputs and returns (run callable, units)"""
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+
+class BenchmarkInputs:
+    """Synthetic inputs generated on first use and shared by all scenarios"""
+
+    def __init__(self, args, folder):
+        self.args = args
+        self.folder = folder
+        self._cache = {}
+
+    def _get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def workbook_path(self):
+        return self._get('workbook', lambda: synthetic.make_workbook(
+            os.path.join(self.folder, 'model.xlsx'),
+            rows=self.args.rows, columns=self.args.columns, sheets=self.args.sheets, seed=self.args.seed
+        ))
+
+    @property
+    def transcript_path(self):
+        return self._get('transcript', lambda: synthetic.make_transcript_pdf(
+            os.path.join(self.folder, 'transcript.pdf'), pages=self.args.pages, seed=self.args.seed
+        ))
+
+    @property
+    def page_count(self):
+        return self._get('page_count', lambda: len(self.raw_pages))
+
+    @property
+    def raw_pages(self):
+        from services.pdf_processor import PDFProcessor
+        return self._get('raw_pages', lambda: PDFProcessor()._extract_raw_pages(self.transcript_path))
+
+    @property
+    def raw_text(self):
+        return self._get('raw_text', lambda: '\n\n'.join(self.raw_pages))
+
+    @property
+    def clean_text(self):
+        from services.pdf_processor import PDFProcessor
+        return self._get('clean_text', lambda: PDFProcessor()._clean_transcript_text(self.raw_text))
+
+    @property
+    def sections(self):
+        from services.pdf_processor import PDFProcessor
+        return self._get('sections', lambda: PDFProcessor().extract_sections(self.clean_text))
+
+    @property
+    def financial_data(self):
+        return self._get('financial_data', lambda: synthetic.make_financial_data(self.args.line_items, self.args.seed))
+
+    @property
+    def transcript_analysis(self):
+        return self._get('transcript_analysis', lambda: synthetic.make_transcript_analysis(seed=self.args.seed))
+
+    @property
+    def report_data(self):
+        from services.report_generator import ReportGenerator
+        return self._get('report_data', lambda: ReportGenerator().build_report_data(
+            'Example Corp', 'Q3 2025', self.financial_data, self.transcript_analysis
+        ))
+
+    @property
+    def html_report(self):
+        from services.report_generator import ReportGenerator
+        return self._get('html_report', lambda: ReportGenerator().render_html(self.report_data))
+
+
+@scenario('excel_parse')
+def excel_parse(inputs):
+    """Load the model workbook in full and extract line items"""
+    from services.excel_processor import ExcelProcessor
+    processor = ExcelProcessor(streaming=False)
+    path = inputs.workbook_path
+    return lambda: processor.process_excel(path), {'rows': inputs.args.rows, 'bytes': os.path.getsize(path)}
+
+
+@scenario('excel_parse_streaming')
+def excel_parse_streaming(inputs):
+    """Extract line items in read-only streaming mode (used for workbooks of 5MB or more)"""
+    from services.excel_processor import ExcelProcessor
+    processor = ExcelProcessor(streaming=True)
+    path = inputs.workbook_path
+    return lambda: processor.process_excel(path), {'rows': inputs.args.rows, 'bytes': os.path.getsize(path)}
+
+
+@scenario('pdf_extract')
+def pdf_extract(inputs):
+    """Extract raw page text from the transcript PDF in this process"""
+    from services.pdf_processor import PDFProcessor
+    processor = PDFProcessor(workers=1)
+    path = inputs.transcript_path
+    return lambda: processor._extract_raw_pages(path), {'pages': inputs.page_count, 'bytes': os.path.getsize(path)}
+
+
+@scenario('transcript_clean')
+def transcript_clean(inputs):
+    """Clean extracted transcript text (artifacts, hyphenation, whitespace)"""
+    from services.pdf_processor import PDFProcessor
+    processor = PDFProcessor()
+    raw_text = inputs.raw_text
+    return lambda: processor._clean_transcript_text(raw_text), {'pages': inputs.page_count, 'bytes': len(raw_text.encode('utf-8'))}
+
+
+@scenario('section_extraction')
+def section_extraction(inputs):
+    """Split cleaned transcript text into prepared remarks, Q&A and safe harbor sections"""
+    from services.pdf_processor import PDFProcessor
+    processor = PDFProcessor()
+    clean_text = inputs.clean_text
+    return lambda: processor.extract_sections(clean_text), {'pages': inputs.page_count, 'bytes': len(clean_text.encode('utf-8'))}
+
+
+@scenario('transcript_analysis')
+def transcript_analysis(inputs):
+    """Chunk the transcript, analyze every chunk with the stub LLM and merge the results"""
+    from services.llm_analyzer import LLMAnalyzer
+    analyzer = LLMAnalyzer()
+    clean_text, sections = inputs.clean_text, inputs.sections
+    return (
+        lambda: analyzer.analyze_transcript(clean_text, 'Example Corp', 'Q3 2025', sections=sections),
+        {'pages': inputs.page_count}
+    )
+
+
+@scenario('report_generation')
+def report_generation(inputs):
+    """Build the report model from scratch (stub LLM sections included) and render the HTML"""
+    from services.llm_analyzer import AsyncLLMAnalyzer
+    from services.report_generator import ReportGenerator
+    generator = ReportGenerator()
+    analyzer = AsyncLLMAnalyzer()
+    financial_data, analysis = inputs.financial_data, inputs.transcript_analysis
+    return (
+        lambda: generator.generate_report_with_data('Example Corp', 'Q3 2025', financial_data, analysis, llm_analyzer=analyzer),
+        {'rows': len(financial_data['line_items'])}
+    )
+
+
+@scenario('html_render')
+def html_render(inputs):
+    """Render the full report template from report data"""
+    from services.report_generator import ReportGenerator
+    generator = ReportGenerator()
+    report_data = inputs.report_data
+    return lambda: generator.render_html(report_data), {'rows': len(inputs.financial_data['line_items'])}
+
+
+@scenario('pdf_export')
+def pdf_export(inputs):
+    """Render the report HTML to PDF with WeasyPrint"""
+    from services.report_generator import ReportGenerator
+    generator = ReportGenerator()
+    html_report = inputs.html_report
+    folder = os.path.join(inputs.folder, 'pdf')
+    os.makedirs(folder, exist_ok=True)
+    return lambda: generator.export_to_pdf(html_report, 'Example Corp', 'Q3 2025', folder), {'bytes': len(html_report.encode('utf-8'))}
+
+
+@scenario('docx_export')
+def docx_export(inputs):
+    """Write the Word report from report data"""
+    from services.report_generator import ReportGenerator
+    generator = ReportGenerator()
+    html_report, report_data = inputs.html_report, inputs.report_data
+    folder = os.path.join(inputs.folder, 'docx')
+    os.makedirs(folder, exist_ok=True)
+    return (
+        lambda: generator.export_to_docx(html_report, 'Example Corp', 'Q3 2025', folder, report_data=report_data),
+        {'rows': len(inputs.financial_data['line_items'])}
+    )
+
+
+def time_scenario(run, repeat, warmup):
+    """Run a scenario warmup + repeat times; returns timing statistics in milliseconds"""
+    for _ in range(warmup):
+        run()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'stdev_ms': round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0
+    }
+
+
+def run_scenarios(names, inputs, args):
+    """Time each named scenario; a scenario that fails is reported with its error instead"""
+    results = {}
+    for name in names:
+        try:
+            run, units = SCENARIOS[name](inputs)
+            result = time_scenario(run, args.repeat, args.warmup)
+        except Exception as e:
+            results[name] = {'error': str(e)}
+            print(f"  {name:<24} failed: {str(e)}")
+            continue
+
+        seconds = result['median_ms'] / 1000
+        result['units'] = units
+        result['throughput'] = {
+            f"{unit}_per_second": round(amount / seconds, 1) for unit, amount in units.items() if seconds > 0
+        }
+        results[name] = result
+        rates = ', '.join(f"{rate:,.0f} {unit.replace('_per_second', '')}/s" for unit, rate in result['throughput'].items())
+        print(f"  {name:<24} {result['median_ms']:>10.1f} ms median  ({result['min_ms']:.1f}-{result['max_ms']:.1f})  {rates}")
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance, min_delta_ms):
+    """Print each scenario's change against the baseline; returns the names of regressed scenarios"""
+    if baseline.get('format_version') != RESULTS_FORMAT_VERSION:
+        print("Baseline was written by an incompatible version of the benchmarks; not comparing")
+        return []
+    if baseline.get('parameters') != results['parameters']:
+        print("Warning: baseline was recorded with different parameters; timings may not be comparable")
+
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created', 'unknown')} (tolerance {tolerance:.0%}):")
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if 'error' in result or not previous or 'error' in previous:
+            continue
+        change = result['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        status = 'ok'
+        # Sub-millisecond scenarios swing by large percentages on timer noise alone
+        if change > tolerance and result['median_ms'] - previous['median_ms'] >= min_delta_ms:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -tolerance:
+            status = 'faster'
+        print(f"  {name:<24} {previous['median_ms']:>10.1f} -> {result['median_ms']:>10.1f} ms  {change:+7.1%}  {status}")
+    return regressions
+
+
+def write_json(path, payload):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as results_file:
+        json.dump(payload, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
+
+
+def load_app(work_folder, args):
+    """
+    Import the Flask app with its database, uploads and metrics in work_folder, the LLM response
+    cache off and the stub LLM backend
+    """
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_folder, 'benchmark.db')}"
+    os.environ['LLM_CACHE_ENABLED'] = 'false'
+    os.environ['PDF_RENDER_WORKERS'] = str(args.pdf_render_workers)
+    os.environ['METRICS_FOLDER'] = os.path.join(work_folder, 'metrics')
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.chdir(work_folder)
+
+    from app import app
+    from services.llm_backends import llm_backends
+    llm_backends.register('stub', synthetic.StubBackend)
+    llm_backends.configure('stub')
+
+    # Keep per-call log lines out of the timings and the output
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run (repeatable; default all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per scenario')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before timing')
+    parser.add_argument('--rows', type=int, default=2000, help='Line item rows in the model sheet')
+    parser.add_argument('--columns', type=int, default=12, help='Columns in the model sheet')
+    parser.add_argument('--sheets', type=int, default=4, help='Worksheets in the workbook')
+    parser.add_argument('--pages', type=int, default=300, help='Approximate transcript pages')
+    parser.add_argument('--line-items', type=int, default=50, help='Line items in the report')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pdf-render-workers', type=int, default=0,
+                        help='PDF renderer processes (0 renders in the benchmark process)')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help='Where to write the results JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline results JSON to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Also write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed slowdown of a scenario median before it counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='Slowdowns smaller than this many milliseconds never count as regressions')
+    parser.add_argument('--keep-inputs', action='store_true', help='Keep the generated input files')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    names = args.scenario or list(SCENARIOS)
+
+    work_folder = tempfile.mkdtemp(prefix='equity-research-bench-')
+    try:
+        app = load_app(work_folder, args)
+        inputs = BenchmarkInputs(args, work_folder)
+
+        print(f"Generating inputs in {work_folder}")
+        start = time.perf_counter()
+        if any(name.startswith('excel') for name in names):
+            inputs.workbook_path
+        if any(name not in ('html_render', 'pdf_export', 'docx_export', 'report_generation') for name in names):
+            inputs.transcript_path
+        print(f"  done in {time.perf_counter() - start:.1f}s")
+
+        print(f"Running {len(names)} scenario(s), median of {args.repeat} run(s):")
+        with app.app_context():
+            scenario_results = run_scenarios(names, inputs, args)
+    finally:
+        # Stop writing metrics into the work folder before it is removed
+        from services.metrics import metrics
+        metrics.configure(None)
+        if args.keep_inputs:
+            print(f"Inputs kept in {work_folder}")
+        else:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count()
+        },
+        'parameters': {
+            'rows': args.rows, 'columns': args.columns, 'sheets': args.sheets, 'pages': args.pages,
+            'line_items': args.line_items, 'seed': args.seed, 'repeat': args.repeat,
+            'pdf_render_workers': args.pdf_render_workers
+        },
+        'scenarios': scenario_results
+    }
+    write_json(output_path, results)
+    print(f"\nResults written to {output_path}")
+
+    regressions = []
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path) as baseline_file:
+            regressions = compare_with_baseline(
+                results, json.load(baseline_file), args.tolerance, args.min_delta_ms
+            )
+
+    if args.save_baseline:
+        write_json(baseline_path, results)
+        print(f"Baseline written to {baseline_path}")
+
+    if regressions:
+        print(f"\n{len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
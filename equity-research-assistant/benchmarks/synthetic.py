@@ -0,0 +1,309 @@
+"""
+Synthetic inputs for the benchmarks: sell-side Excel models, earnings call transcript PDFs,
+transcript analyses and a stub LLM backend
+
+Everything is generated from a seed, so the same arguments always produce the same files.
+"""
+import json
+import random
+import textwrap
+import fitz  # PyMuPDF
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from services.llm_backends import LLMBackend
+
+# Rows the parser recognises as key metrics, and filler rows it has to skip
+MODEL_METRICS = [
+    'Total Revenue', 'Gross Profit', 'Gross Margin', 'Adjusted EBITDA', 'Operating Income',
+    'Net Income', 'Diluted EPS', 'Operating Cash Flow', 'Free Cash Flow', 'Total Debt'
+]
+MODEL_FILLER = [
+    'Units shipped', 'Average selling price', 'Headcount', 'Days sales outstanding', 'Capex',
+    'Share count (diluted)', 'Tax rate', 'Inventory turns', 'Backlog', 'R&D expense', 'SG&A expense'
+]
+REGIONS = ['North America', 'EMEA', 'APAC', 'LatAm']
+
+# Sell-side number formats: currency with parenthesised negatives, plain thousands, percentages
+CURRENCY_FORMAT = '$#,##0_);$(#,##0)'
+NUMBER_FORMAT = '#,##0.0'
+PERCENT_FORMAT = '0.0%'
+
+TRANSCRIPT_WORDS = (
+    'revenue growth margin demand pricing customers pipeline backlog guidance quarter year '
+    'investment capacity supply chain inventory cost discipline productivity expansion segment '
+    'services software hardware subscription renewal bookings operating leverage cash flow '
+    'capital allocation buyback dividend balance sheet liquidity headwinds tailwinds currency '
+    'macro environment enterprise consumer channel partners launch roadmap platform adoption'
+).split()
+SPEAKERS = [
+    ('Jane Smith', 'Chief Executive Officer'),
+    ('Robert Chen', 'Chief Financial Officer'),
+    ('Maria Lopez', 'Head of Investor Relations')
+]
+ANALYSTS = [
+    ('David Park', 'Morgan Stanley'),
+    ('Sarah Kim', 'Goldman Sachs'),
+    ('Tom Walsh', 'JPMorgan'),
+    ('Priya Nair', 'Bank of America')
+]
+
+# Page layout for generated transcripts
+LINES_PER_PAGE = 58
+LINE_WIDTH = 95
+
+# Canned LLM output covering the transcript analysis and risk analysis fields
+STUB_ANALYSIS = {
+    'financial_highlights': 'Revenue grew 12% year over year to $4.2 billion, ahead of consensus.',
+    'management_commentary': 'Management pointed to strong enterprise demand and improving supply.',
+    'strategic_themes': 'Platform consolidation; subscription transition; operating discipline.',
+    'risks_and_tailwinds': 'Currency headwinds and elevated inventory, offset by pricing tailwinds.',
+    'qa_insights': 'Analysts focused on gross margin sustainability and the capex outlook.',
+    'market_dynamics': 'Competitive intensity is stable; demand is recovering in EMEA.',
+    'guidance_outlook': 'Full-year revenue guidance raised by 2% at the midpoint.',
+    'key_risks': ['Currency volatility', 'Inventory build', 'Enterprise budget scrutiny'],
+    'risk_mitigation': 'Hedging programme and tighter purchasing commitments.',
+    'positive_factors': ['Pricing power', 'Recurring revenue mix'],
+    'overall_risk_rating': 'Medium'
+}
+STUB_SUMMARY = (
+    'Example Corp delivered a solid quarter with revenue and margins ahead of estimates. '
+    'Management raised guidance on enterprise demand while flagging currency headwinds.'
+)
+
+
+def _period_headers(columns):
+    """Quarter headers ending with the estimate and actual columns the parser looks for"""
+    headers = []
+    year, quarter = 2025, 3
+    for _ in range(max(0, columns - 3)):
+        quarter -= 1
+        if quarter == 0:
+            year, quarter = year - 1, 4
+        headers.append(f'Q{quarter} {year}A')
+    return list(reversed(headers)) + ['Q3 2025 Estimate', 'Q3 2025 Actual']
+
+
+def _model_cell(worksheet, value, number_format):
+    cell = WriteOnlyCell(worksheet, value=value)
+    cell.number_format = number_format
+    return cell
+
+
+def make_workbook(path, rows=2000, columns=12, sheets=4, seed=0):
+    """
+    Write a sell-side style earnings model
+    The 'Model' sheet holds rows x columns of line items; a share of the values are stored as
+    formatted text such as "$(1,234)" and "1,234.5", as pasted-in figures often are.
+    Other sheets (cover, segment and valuation tabs) pad the workbook to the given sheet count.
+    Returns the path
+    """
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+
+    cover = workbook.create_sheet('Cover')
+    cover.append(['Example Corp (EXM) - Quarterly Earnings Model'])
+    cover.append(['Analyst', 'Equity Research'])
+    cover.append(['Rating', 'Overweight'])
+
+    model = workbook.create_sheet('Model')
+    model.append(['Example Corp - Income Statement and Cash Flow ($ in millions, except per share)'])
+    model.append([])
+    model.append(['Line Item'] + _period_headers(columns - 1))
+
+    for row_index in range(rows):
+        if row_index % 25 == 24:
+            model.append([])
+            continue
+
+        if rng.random() < 0.2:
+            name = rng.choice(MODEL_METRICS)
+            if rng.random() < 0.5:
+                name = f'{name} - {rng.choice(REGIONS)}'
+        else:
+            name = f'{rng.choice(MODEL_FILLER)} - {rng.choice(REGIONS)}'
+
+        base = rng.uniform(-500, 5000)
+        row = [name]
+        for column in range(columns - 1):
+            value = round(base * (1 + rng.uniform(-0.08, 0.12)) * (1 + column * 0.02), 1)
+            kind = rng.random()
+            if kind < 0.15:
+                # Pasted figures: "$(1,234)" for negatives, "$1,234" otherwise
+                text = f'{abs(value):,.0f}'
+                row.append(f'$({text})' if value < 0 else f'${text}')
+            elif kind < 0.25:
+                row.append(f'{value:,.1f}')
+            elif kind < 0.3:
+                row.append(_model_cell(model, round(rng.uniform(0, 0.6), 3), PERCENT_FORMAT))
+            elif kind < 0.32:
+                row.append(None)
+            else:
+                row.append(_model_cell(model, value, CURRENCY_FORMAT if kind < 0.7 else NUMBER_FORMAT))
+        model.append(row)
+
+    extra_sheets = ['Segments', 'Assumptions', 'Valuation', 'Balance Sheet', 'Cash Flow', 'Consensus']
+    for sheet_index in range(max(0, sheets - 2)):
+        name = extra_sheets[sheet_index % len(extra_sheets)]
+        if sheet_index >= len(extra_sheets):
+            name = f'{name} {sheet_index // len(extra_sheets) + 1}'
+        worksheet = workbook.create_sheet(name)
+        worksheet.append(['Item'] + _period_headers(columns - 1))
+        for row_index in range(max(10, rows // 10)):
+            worksheet.append(
+                [f'{rng.choice(MODEL_FILLER)} {row_index}'] +
+                [_model_cell(worksheet, round(rng.uniform(0, 1000), 1), NUMBER_FORMAT) for _ in range(columns - 1)]
+            )
+
+    workbook.save(path)
+    return path
+
+
+def _sentence(rng):
+    words = [rng.choice(TRANSCRIPT_WORDS) for _ in range(rng.randint(10, 24))]
+    # Some figures in the text, formatted as they are read out on calls
+    if rng.random() < 0.3:
+        words.insert(rng.randint(1, len(words) - 1), f'${rng.randint(1, 900)}.{rng.randint(0, 9)} million')
+    return ' '.join(words).capitalize() + rng.choice(['.', '.', '.', '?'])
+
+
+def _speaker_paragraph(rng, in_qa):
+    """One speaker turn: an analyst or an executive during Q&A, an executive before it"""
+    if in_qa and rng.random() < 0.4:
+        analyst, firm = rng.choice(ANALYSTS)
+        speaker = f'{analyst} - {firm}'
+    else:
+        name, title = rng.choice(SPEAKERS)
+        speaker = f'{name} - {title}'
+    return f'{speaker}: ' + ' '.join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def _wrap_paragraph(rng, paragraph):
+    """Wrap a paragraph into lines, hyphenating some line ends the way typeset transcripts do"""
+    wrapped = textwrap.wrap(paragraph, LINE_WIDTH)
+    lines = []
+    for index, line in enumerate(wrapped):
+        next_line = wrapped[index + 1] if index + 1 < len(wrapped) else ''
+        head, _, rest = next_line.partition(' ')
+        if rest and len(head) > 5 and rng.random() < 0.1:
+            cut = len(head) // 2
+            line = f'{line} {head[:cut]}-'
+            wrapped[index + 1] = f'{head[cut:]} {rest}'
+        lines.append(line.replace(', ', ',  ') if rng.random() < 0.05 else line)
+    return lines
+
+
+def make_transcript_pdf(path, pages=300, seed=0):
+    """
+    Write an earnings call transcript PDF with the given number of pages
+    Pages carry the artifacts the cleaner removes: "Page X of Y" footers, copyright lines,
+    words hyphenated across lines and ragged spacing. The call opens with a safe harbor
+    statement and prepared remarks, and the Q&A session takes the last 55% of the pages
+    Returns the path
+    """
+    rng = random.Random(seed)
+    body_lines = LINES_PER_PAGE - 4
+    total_lines = pages * body_lines
+    # PyMuPDF drops empty lines when extracting, so paragraph breaks are lines holding a space
+    blank = ' '
+
+    lines = []
+    for heading, paragraph in (
+        ('FORWARD-LOOKING STATEMENTS', 'This call contains forward-looking statements within the meaning of the '
+                                       'safe harbor provisions. Actual results may differ materially from those '
+                                       'expressed or implied.'),
+        ('PREPARED REMARKS', 'Operator: Good afternoon and welcome to the third quarter earnings call.')
+    ):
+        lines += [heading, blank] + _wrap_paragraph(rng, paragraph) + [blank]
+
+    in_qa = False
+    while len(lines) < total_lines:
+        if not in_qa and len(lines) >= total_lines * 0.45:
+            in_qa = True
+            lines += ['QUESTIONS AND ANSWERS', blank]
+        lines += _wrap_paragraph(rng, _speaker_paragraph(rng, in_qa)) + [blank]
+    lines = lines[:total_lines]
+
+    doc = fitz.open()
+    for page_index in range(pages):
+        page = doc.new_page()
+        page_lines = ['Example Corp (EXM) Q3 2025 Earnings Call Transcript', blank]
+        page_lines += lines[page_index * body_lines:(page_index + 1) * body_lines]
+        page_lines += [blank, f'Page {page_index + 1} of {pages}', '© 2025 Transcript Provider. All rights reserved.']
+        page.insert_text((40, 40), '\n'.join(page_lines), fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_financial_data(line_items=50, seed=0):
+    """Financial data in the shape ExcelProcessor returns"""
+    rng = random.Random(seed)
+    items = []
+    for index in range(line_items):
+        previous = round(rng.uniform(100, 5000), 1)
+        items.append({
+            'line_item': f'{MODEL_METRICS[index % len(MODEL_METRICS)]} - {REGIONS[index % len(REGIONS)]}',
+            'previous_value': previous,
+            'estimate': round(previous * rng.uniform(0.95, 1.15), 1),
+            'actual': None,
+            'all_values': [previous]
+        })
+    return {'line_items': items, 'metadata': {'total_rows': line_items, 'total_columns': 4}}
+
+
+def make_transcript_analysis(paragraphs=3, seed=0):
+    """A transcript analysis with multi-paragraph fields, as the LLM returns for a long call"""
+    rng = random.Random(seed)
+    analysis = {}
+    for field in ('management_commentary', 'strategic_themes', 'risks_and_tailwinds', 'qa_insights',
+                  'financial_highlights', 'market_dynamics', 'guidance_outlook'):
+        analysis[field] = '\n\n'.join(
+            ' '.join(_sentence(rng) for _ in range(6)) for _ in range(paragraphs)
+        )
+    return analysis
+
+
+class _Record:
+    """Attribute access over keyword arguments, standing in for OpenAI response objects"""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _stub_response(kwargs):
+    """Canned completion for a chat completions request: JSON when JSON was requested, else prose"""
+    response_format = kwargs.get('response_format') or {}
+    content = json.dumps(STUB_ANALYSIS) if response_format.get('type') == 'json_object' else STUB_SUMMARY
+    prompt_tokens = sum(len(message['content']) for message in kwargs.get('messages', [])) // 4
+    usage = _Record(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4)
+    return content, usage
+
+
+def _stub_stream(content, usage):
+    for start in range(0, len(content), 16):
+        yield _Record(choices=[_Record(delta=_Record(content=content[start:start + 16]))], usage=None)
+    yield _Record(choices=[], usage=usage)
+
+
+class _StubCompletions:
+    def create(self, stream=False, **kwargs):
+        content, usage = _stub_response(kwargs)
+        if stream:
+            return _stub_stream(content, usage)
+        return _Record(choices=[_Record(message=_Record(content=content))], usage=usage)
+
+
+class _AsyncStubCompletions:
+    async def create(self, **kwargs):
+        content, usage = _stub_response(kwargs)
+        return _Record(choices=[_Record(message=_Record(content=content))], usage=usage)
+
+
+class StubBackend(LLMBackend):
+    """LLM backend whose clients answer instantly with canned content"""
+
+    def create_client(self):
+        return _Record(chat=_Record(completions=_StubCompletions()))
+
+    def create_async_client(self):
+        return _Record(chat=_Record(completions=_AsyncStubCompletions()))
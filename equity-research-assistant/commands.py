@@ -0,0 +1,113 @@
+import click
+from app import app, db
+from models import ResearchSession, LineItem
+from services.job_queue import JobWorkerPool
+from services.batch_runner import BatchRunner
+from services.storage_retention import RetentionManager
+
+@app.cli.command('run-worker')
+@click.option('--workers', default=2, show_default=True, help='Number of concurrent worker threads')
+def run_worker(workers):
+    """Run a dedicated pool of background analysis job workers"""
+    pool = JobWorkerPool.from_config(app, num_workers=workers)
+    click.echo(f"Starting {workers} job worker(s). Press Ctrl+C to stop.")
+    pool.run_forever()
+
+@app.cli.group('batch')
+def batch():
+    """Process many companies from a manifest without the browser"""
+
+@batch.command('run')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-id', default=None, help='Batch to create or resume (default: manifest name and date)')
+@click.option('--concurrency', type=int, default=None, help='Number of companies processed at once (default: BATCH_CONCURRENCY)')
+@click.option('--rate', type=float, default=None, help='Maximum companies started per minute (default: BATCH_ITEMS_PER_MINUTE)')
+@click.option('--output', type=click.Path(file_okay=False), default=None, help='Folder for the exported reports')
+@click.option('--retry-failed', is_flag=True, help='Also retry items that failed in an earlier run')
+def batch_run(manifest, batch_id, concurrency, rate, output, retry_failed):
+    """Run the research pipeline for every entry in a CSV or JSON manifest"""
+    runner = BatchRunner(app, concurrency=concurrency, items_per_minute=rate, output_folder=output)
+    batch_id, added = runner.create_batch(manifest, batch_id)
+    click.echo(f"Batch {batch_id}: {added} new item(s). Processing with {runner.concurrency} worker(s)...")
+
+    counts = runner.run(batch_id, retry_failed=retry_failed)
+    click.echo(f"Batch {batch_id} finished: {counts['completed']} completed, {counts['failed']} failed, {counts['pending']} pending")
+    if counts['failed']:
+        click.echo(f"Run `flask batch status {batch_id}` for error details.")
+
+@batch.command('status')
+@click.argument('batch_id')
+def batch_status(batch_id):
+    """Show the per-company status of a batch"""
+    status = BatchRunner(app).status(batch_id)
+    if not status['items']:
+        raise click.ClickException(f"No batch found with id {batch_id}")
+
+    for item in status['items']:
+        detail = item['error'] if item['status'] == 'failed' else (item['stage'] or '')
+        click.echo(f"{item['status']:<10} {item['company_name']:<30} {item['quarter']:<10} {detail}")
+    counts = status['counts']
+    click.echo(f"{counts['completed']} completed, {counts['failed']} failed, {counts['running']} running, {counts['pending']} pending")
+
+@app.cli.group('data')
+def data():
+    """Query and maintain the normalized research data"""
+
+@data.command('metric')
+@click.argument('metric')
+@click.option('--quarter', default=None, help='Only sessions for this quarter, e.g. "Q3 2025"')
+@click.option('--company', default=None, help='Only sessions for this company')
+def data_metric(metric, quarter, company):
+    """List a metric (e.g. Revenue) across all research sessions"""
+    rows = LineItem.query_metric(metric, quarter=quarter, company_name=company)
+    if not rows:
+        raise click.ClickException(f"No line items found for {metric}")
+
+    for company_name, session_quarter, line_item in rows:
+        click.echo(
+            f"{company_name or '':<30} {session_quarter or '':<10} "
+            f"previous={line_item.previous_value} estimate={line_item.estimate} actual={line_item.actual}"
+        )
+
+@data.command('reindex')
+def data_reindex():
+    """Rebuild line item and analysis section rows from the sessions' stored JSON"""
+    reindexed = 0
+    for research_session in ResearchSession.query.all():
+        research_session.set_financial_data(research_session.get_financial_data())
+        research_session.set_transcript_analysis(research_session.get_transcript_analysis())
+        reindexed += 1
+    db.session.commit()
+    click.echo(f"Reindexed {reindexed} session(s)")
+
+@app.cli.group('storage')
+def storage():
+    """Retention and disk usage of uploads and exported reports"""
+
+@storage.command('gc')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting anything')
+def storage_gc(dry_run):
+    """Expire old sessions and delete orphaned uploads, stale parsed data and expired exports"""
+    stats = RetentionManager().collect(dry_run=dry_run)
+    prefix = 'Would remove' if dry_run else 'Removed'
+    click.echo(f"{prefix} {stats['sessions']} expired session(s) and {stats['artifacts']} parsed artifact(s)")
+    click.echo(f"{prefix} {stats['upload_files']} upload file(s) ({stats['upload_bytes'] // 1024}KB)")
+    click.echo(f"{prefix} {stats['download_files']} download file(s) ({stats['download_bytes'] // 1024}KB)")
+
+@storage.command('compact')
+def storage_compact():
+    """Move files into the sharded layout, remove empty folders and recount upload usage"""
+    stats = RetentionManager().compact()
+    click.echo(
+        f"Migrated {stats['migrated_uploads']} legacy upload(s) and {stats['migrated_exports']} export(s), "
+        f"removed {stats['removed_folders']} empty folder(s)"
+    )
+    click.echo(f"Uploads: {stats['upload_files']} file(s), {stats['upload_bytes'] // (1024 * 1024)}MB")
+
+@storage.command('usage')
+def storage_usage():
+    """Show disk usage against the configured limits"""
+    usage = RetentionManager().usage()
+    quota = f"{usage['upload_quota_bytes'] // (1024 * 1024)}MB" if usage['upload_quota_bytes'] else 'unlimited'
+    click.echo(f"Uploads: {usage['upload_files']} file(s), {usage['upload_bytes'] // (1024 * 1024)}MB of {quota}")
+    click.echo(f"Exports: {usage['export_files']} file(s), {usage['export_bytes'] // (1024 * 1024)}MB of {usage['export_max_bytes'] // (1024 * 1024)}MB")
@@ -1,9 +1,17 @@
 from app import db
 from datetime import datetime
+from flask import current_app
+from sqlalchemy.orm import column_property, deferred
 import json
+import time
+import threading
 
 class ResearchSession(db.Model):
     """Model to store research session data across multiple steps"""
+    __table_args__ = (
+        db.Index('ix_research_session_quarter_company', 'quarter', 'company_name'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(255), unique=True, nullable=False)
     company_name = db.Column(db.String(255), nullable=True)
@@ -11,56 +19,304 @@ class ResearchSession(db.Model):
     excel_filename = db.Column(db.String(255), nullable=True)
     pdf_filename = db.Column(db.String(255), nullable=True)
     summary_filename = db.Column(db.String(255), nullable=True)
-    financial_data = db.Column(db.Text, nullable=True)  # JSON string
-    transcript_analysis = db.Column(db.Text, nullable=True)  # JSON string
-    final_report = db.Column(db.Text, nullable=True)
+    excel_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of uploaded file content
+    pdf_hash = db.Column(db.String(64), nullable=True)
+    summary_hash = db.Column(db.String(64), nullable=True)
+    # Large columns are deferred: loaded on first access, or up front with undefer()
+    financial_data = deferred(db.Column(db.Text, nullable=True))  # JSON string
+    transcript_analysis = deferred(db.Column(db.Text, nullable=True))  # JSON string
+    final_report = deferred(db.Column(db.Text, nullable=True))
+    report_data = deferred(db.Column(db.Text, nullable=True))  # JSON report model: section data, input fingerprints and rendered blocks
     current_step = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Normalized copies of financial_data and transcript_analysis for indexed cross-session queries
+    line_items = db.relationship('LineItem', cascade='all, delete-orphan', order_by='LineItem.position')
+    analysis_sections = db.relationship('AnalysisSection', cascade='all, delete-orphan', order_by='AnalysisSection.position')
 
+    @staticmethod
+    def set_step(session_id, step):
+        """Set a session's current step with a single UPDATE; returns False if the session does not exist"""
+        updated = ResearchSession.query.filter_by(session_id=session_id).update(
+            {'current_step': step}, synchronize_session=False
+        )
+        db.session.commit()
+        return bool(updated)
+    
     def set_financial_data(self, data):
-        """Store financial data as JSON"""
-        self.financial_data = json.dumps(data)
+        """Store financial data as JSON, along with one LineItem row per line item"""
+        self.financial_data = json.dumps(data) if data is not None else None
+        self.line_items = [
+            LineItem.from_dict(position, item)
+            for position, item in enumerate((data or {}).get('line_items') or [])
+        ]
     
     def get_financial_data(self):
-        """Retrieve financial data from JSON"""
-        if self.financial_data:
-            return json.loads(self.financial_data)
-        return None
+        """
+        Retrieve financial data from JSON
+        The parsed value is memoized until the column changes, so treat it as read-only
+        """
+        return self._load_json('financial_data')
     
     def set_transcript_analysis(self, data):
-        """Store transcript analysis as JSON"""
-        self.transcript_analysis = json.dumps(data)
+        """Store transcript analysis as JSON, along with one AnalysisSection row per field"""
+        self.transcript_analysis = json.dumps(data) if data is not None else None
+        self.analysis_sections = [
+            AnalysisSection.from_value(position, section, value)
+            for position, (section, value) in enumerate((data or {}).items())
+        ]
     
     def get_transcript_analysis(self):
-        """Retrieve transcript analysis from JSON"""
-        if self.transcript_analysis:
-            return json.loads(self.transcript_analysis)
+        """
+        Retrieve transcript analysis from JSON
+        The parsed value is memoized until the column changes, so treat it as read-only
+        """
+        return self._load_json('transcript_analysis')
+    
+    def _load_json(self, column):
+        """Parse a JSON column, reusing the last result while the stored text is unchanged"""
+        raw = getattr(self, column)
+        if not raw:
+            return None
+        
+        memo = getattr(self, '_json_memo', None)
+        if memo is None:
+            memo = self._json_memo = {}
+        cached = memo.get(column)
+        # Comparing the text is far cheaper than parsing it again after the row is reloaded
+        if cached is None or (cached[0] is not raw and cached[0] != raw):
+            cached = (raw, json.loads(raw))
+            memo[column] = cached
+        return cached[1]
+
+    def set_report_model(self, report_model):
+        """Store the structured report model as JSON"""
+        self.report_data = json.dumps(report_model)
+    
+    def get_report_model(self):
+        """Retrieve the structured report model, or None if absent or stored by an older version"""
+        if self.report_data:
+            report_model = json.loads(self.report_data)
+            if isinstance(report_model, dict) and 'version' in report_model:
+                return report_model
         return None
+    
+    def get_report_data(self):
+        """Retrieve the values rendered into final_report"""
+        report_model = self.get_report_model()
+        return report_model['data'] if report_model else None
 
-class PromptTemplate(db.Model):
-    """Model to store customizable prompt templates"""
+# Loaded with the row, so checks for finished steps need not load the deferred columns
+ResearchSession.has_transcript_analysis = column_property(ResearchSession.__table__.c.transcript_analysis.isnot(None))
+ResearchSession.has_final_report = column_property(ResearchSession.__table__.c.final_report.isnot(None))
+
+class LineItem(db.Model):
+    """Model to store one financial line item of a session, indexed for cross-session queries"""
+    __table_args__ = (
+        db.Index('ix_line_item_metric_session', 'metric_key', 'session_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    step_name = db.Column(db.String(100), nullable=False, unique=True)
-    prompt_text = db.Column(db.Text, nullable=False)
-    description = db.Column(db.String(255), nullable=True)
-    is_default = db.Column(db.Boolean, default=False)
+    session_id = db.Column(db.String(255), db.ForeignKey('research_session.session_id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Order within the session's line items
+    metric = db.Column(db.String(255), nullable=False)  # Line item name as found in the spreadsheet
+    metric_key = db.Column(db.String(255), nullable=False)  # Lower-cased metric used for lookups
+    previous_value = db.Column(db.Float, nullable=True)
+    estimate = db.Column(db.Float, nullable=True)
+    actual = db.Column(db.Float, nullable=True)
+    
+    @staticmethod
+    def metric_key_for(metric):
+        """Normalize a metric name for lookups"""
+        return ' '.join(str(metric).lower().split())
+    
+    @staticmethod
+    def from_dict(position, item):
+        """Build a row from a line item produced by ExcelProcessor"""
+        return LineItem(
+            position=position,
+            metric=str(item.get('line_item', ''))[:255],
+            metric_key=LineItem.metric_key_for(item.get('line_item', ''))[:255],
+            previous_value=item.get('previous_value'),
+            estimate=item.get('estimate'),
+            actual=item.get('actual')
+        )
+    
+    @staticmethod
+    def query_metric(metric, quarter=None, company_name=None):
+        """
+        Return (company_name, quarter, line item) rows for a metric across all sessions,
+        e.g. revenue estimates for every Q3 2025 report
+        """
+        query = db.session.query(ResearchSession.company_name, ResearchSession.quarter, LineItem).join(
+            ResearchSession, ResearchSession.session_id == LineItem.session_id
+        ).filter(LineItem.metric_key == LineItem.metric_key_for(metric))
+        if quarter:
+            query = query.filter(ResearchSession.quarter == quarter)
+        if company_name:
+            query = query.filter(ResearchSession.company_name == company_name)
+        return query.order_by(ResearchSession.company_name, ResearchSession.quarter).all()
+    
+    def to_dict(self):
+        """Serialize the line item"""
+        return {
+            'metric': self.metric,
+            'previous_value': self.previous_value,
+            'estimate': self.estimate,
+            'actual': self.actual
+        }
+
+class AnalysisSection(db.Model):
+    """Model to store one field of a session's transcript analysis, indexed for cross-session queries"""
+    __table_args__ = (
+        db.Index('ix_analysis_section_section_session', 'section', 'session_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), db.ForeignKey('research_session.session_id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    section = db.Column(db.String(100), nullable=False)  # e.g. management_commentary, strategic_themes
+    content = db.Column(db.Text, nullable=True)  # Text, or JSON for non-text values
+    
+    @staticmethod
+    def from_value(position, section, value):
+        """Build a row from one field of a transcript analysis"""
+        content = value if isinstance(value, str) or value is None else json.dumps(value)
+        return AnalysisSection(position=position, section=str(section)[:100], content=content)
+
+class ParsedArtifact(db.Model):
+    """Model to store results parsed from an uploaded file, keyed on the file's content hash"""
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'kind', name='uq_parsed_artifact_hash_kind'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    kind = db.Column(db.String(50), nullable=False)  # e.g. excel_financial_data, transcript_text
+    version = db.Column(db.Integer, nullable=False, default=1)  # Parser version that produced the payload
+    payload = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def get_payload(self):
+        """Retrieve the parsed payload from JSON"""
+        return json.loads(self.payload)
+
+class AnalysisJob(db.Model):
+    """Model to track background analysis jobs for a research session"""
+    __table_args__ = (
+        db.Index('ix_analysis_job_session_type', 'session_id', 'job_type'),  # Latest/active job per session
+        db.Index('ix_analysis_job_status_updated', 'status', 'updated_at'),  # Queue claims and stale job checks
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), nullable=False, index=True)
+    job_type = db.Column(db.String(50), nullable=False, default='transcript_analysis')
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    progress = db.Column(db.Integer, default=0)  # Percentage 0-100
+    message = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker_id = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    partial_result = db.Column(db.Text, nullable=True)  # JSON of analysis fields streamed so far
+
+    @property
+    def is_active(self):
+        """Whether the job is still waiting for or being processed by a worker"""
+        return self.status in ('queued', 'running')
+
+    def get_partial_result(self):
+        """Get the streamed analysis fields as a dictionary"""
+        if self.partial_result:
+            return json.loads(self.partial_result)
+        return {}
+
+    def to_dict(self):
+        """Serialize job state for the status endpoint"""
+        return {
+            'job_id': self.id,
+            'session_id': self.session_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class LLMCacheEntry(db.Model):
+    """Model to store cached LLM responses keyed on a hash of the full request"""
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest
+    model = db.Column(db.String(100), nullable=False)
+    response_text = db.Column(db.Text, nullable=False)
+    response_size = db.Column(db.Integer, default=0)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class StorageUsage(db.Model):
+    """Model to track bytes and files stored per storage area, for disk quotas"""
+    area = db.Column(db.String(50), primary_key=True)  # e.g. uploads
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     @staticmethod
-    def get_prompt(step_name):
-        """Get prompt for a specific step, return default if not found"""
-        prompt = PromptTemplate.query.filter_by(step_name=step_name).first()
-        if prompt:
-            return prompt.prompt_text
-        return PromptTemplate.get_default_prompt(step_name)
+    def get_usage(area):
+        """Return (total bytes, file count) recorded for an area"""
+        row = db.session.query(StorageUsage.total_bytes, StorageUsage.file_count).filter_by(area=area).first()
+        return (row[0], row[1]) if row else (0, 0)
     
     @staticmethod
-    def get_default_prompt(step_name):
-        """Return default prompts for each step"""
-        defaults = {
-            'earning_summary': """You are a professional equity research analyst. Analyze the following quick earning summary for {company_name} ({quarter}) and extract key financial insights.
+    def _adjusted(bytes_delta, files_delta):
+        """Column updates applying the deltas, clamped at 0 so files counted before tracking began cannot drive usage negative"""
+        total_bytes = StorageUsage.total_bytes + bytes_delta
+        file_count = StorageUsage.file_count + files_delta
+        return {
+            'total_bytes': db.case((total_bytes < 0, 0), else_=total_bytes),
+            'file_count': db.case((file_count < 0, 0), else_=file_count)
+        }
+    
+    @staticmethod
+    def record(area, bytes_delta, files_delta):
+        """Adjust an area's usage as part of the current transaction"""
+        updated = StorageUsage.query.filter_by(area=area).update(
+            StorageUsage._adjusted(bytes_delta, files_delta), synchronize_session=False
+        )
+        if not updated:
+            db.session.add(StorageUsage(area=area, total_bytes=max(0, bytes_delta), file_count=max(0, files_delta)))
+    
+    @staticmethod
+    def record_committed(area, bytes_delta, files_delta):
+        """Adjust an area's usage in a transaction of its own, leaving the current session's transaction alone"""
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                db.update(StorageUsage).where(StorageUsage.area == area).values(StorageUsage._adjusted(bytes_delta, files_delta))
+            ).rowcount
+            if not updated:
+                connection.execute(db.insert(StorageUsage).values(
+                    area=area, total_bytes=max(0, bytes_delta), file_count=max(0, files_delta), updated_at=datetime.utcnow()
+                ))
+    
+    @staticmethod
+    def reset(area, total_bytes, file_count):
+        """Replace an area's usage with a fresh count"""
+        usage = db.session.get(StorageUsage, area) or StorageUsage(area=area)
+        usage.total_bytes = total_bytes
+        usage.file_count = file_count
+        db.session.add(usage)
+
+# Prompts used for steps without a customized prompt
+DEFAULT_PROMPTS = {
+    'earning_summary': """You are a professional equity research analyst. Analyze the following quick earning summary for {company_name} ({quarter}) and extract key financial insights.
 
 Please provide a structured analysis in JSON format with the following structure:
 {{
@@ -77,8 +333,8 @@ Focus on:
 - Key business metrics and trends
 - Strategic priorities and initiatives
 - Management commentary and confidence""",
-            
-            'transcript_analysis': """You are a professional equity research analyst. Analyze the following earnings call transcript for {company_name} ({quarter}) and extract key insights.
+    
+    'transcript_analysis': """You are a professional equity research analyst. Analyze the following earnings call transcript for {company_name} ({quarter}) and extract key insights.
 
 Please provide a comprehensive analysis in JSON format with the following structure:
 {{
@@ -97,8 +353,8 @@ Focus on:
 - Market opportunities and competitive positioning
 - Management tone and confidence level
 - Key financial metrics and performance drivers""",
-            
-            'executive_summary': """Create a concise executive summary for {company_name}'s {quarter} earnings analysis.
+    
+    'executive_summary': """Create a concise executive summary for {company_name}'s {quarter} earnings analysis.
 
 Provide a 2-3 paragraph executive summary that:
 1. Highlights key financial performance vs estimates
@@ -106,8 +362,8 @@ Provide a 2-3 paragraph executive summary that:
 3. Identifies key investment considerations
 
 Write in a professional, analyst-appropriate tone.""",
-            
-            'risk_analysis': """Based on the following transcript analysis and financial data, provide a detailed risk assessment:
+    
+    'risk_analysis': """Based on the following transcript analysis and financial data, provide a detailed risk assessment:
 
 Provide analysis in JSON format:
 {{
@@ -116,7 +372,143 @@ Provide analysis in JSON format:
     "positive_factors": ["list of 3-5 positive factors/tailwinds"],
     "overall_risk_rating": "Low/Medium/High with brief explanation"
 }}""",
-            
-            'report_generation': """Generate a comprehensive equity research report combining financial data and transcript insights for {company_name} {quarter}."""
+    
+    'report_generation': """Generate a comprehensive equity research report combining financial data and transcript insights for {company_name} {quarter}."""
+}
+
+# Name of the CacheVersion counter bumped whenever stored prompts change
+PROMPT_CACHE_NAME = 'prompt_templates'
+
+# Maximum formatted prompts kept per cache snapshot
+PROMPT_CACHE_MAX_FORMATTED = 256
+
+# This process's snapshot of the stored prompts: version, prompts by step, formatted prompts, last version check
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+class CacheVersion(db.Model):
+    """Model to store version counters that tell every process when an in-memory cache is stale"""
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def get_version(name):
+        """Read the current version of a counter (0 if it was never bumped)"""
+        return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+    
+    @staticmethod
+    def bump(name):
+        """Increment a counter as part of the current transaction"""
+        updated = CacheVersion.query.filter_by(name=name).update(
+            {'version': CacheVersion.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.session.add(CacheVersion(name=name, version=1))
+
+class PromptTemplate(db.Model):
+    """Model to store customizable prompt templates"""
+    id = db.Column(db.Integer, primary_key=True)
+    step_name = db.Column(db.String(100), nullable=False, unique=True)
+    prompt_text = db.Column(db.Text, nullable=False)
+    description = db.Column(db.String(255), nullable=True)
+    is_default = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @staticmethod
+    def get_prompt(step_name):
+        """Get prompt for a specific step, return default if not found"""
+        prompts = PromptTemplate._load_prompt_cache()['prompts']
+        return prompts.get(step_name) or PromptTemplate.get_default_prompt(step_name)
+    
+    @staticmethod
+    def get_formatted_prompt(step_name, **values):
+        """Get a step's prompt formatted with the given values, memoized until the prompts change"""
+        snapshot = PromptTemplate._load_prompt_cache()
+        key = (step_name, tuple(sorted(values.items())))
+        formatted = snapshot['formatted'].get(key)
+        if formatted is None:
+            prompt = snapshot['prompts'].get(step_name) or PromptTemplate.get_default_prompt(step_name)
+            formatted = prompt.format(**values)
+            if len(snapshot['formatted']) < PROMPT_CACHE_MAX_FORMATTED:
+                snapshot['formatted'][key] = formatted
+        return formatted
+    
+    @staticmethod
+    def get_default_prompt(step_name):
+        """Return default prompts for each step"""
+        return DEFAULT_PROMPTS.get(step_name, "Default prompt not available")
+    
+    @staticmethod
+    def commit_changes():
+        """Commit prompt edits along with a version bump, so every process reloads its cached prompts"""
+        global _prompt_cache
+        CacheVersion.bump(PROMPT_CACHE_NAME)
+        db.session.commit()
+        with _prompt_cache_lock:
+            _prompt_cache = None
+    
+    @staticmethod
+    def _load_prompt_cache():
+        """
+        Return this process's prompt snapshot, reloading it when the stored version has changed
+        The version is checked at most every PROMPT_CACHE_CHECK_SECONDS, so other processes see
+        saved prompts within that interval; the saving process sees them immediately
+        """
+        global _prompt_cache
+        snapshot = _prompt_cache
+        now = time.monotonic()
+        if snapshot and now - snapshot['checked_at'] < current_app.config['PROMPT_CACHE_CHECK_SECONDS']:
+            return snapshot
+        
+        # Read the version before the prompts: a save landing in between is caught by the next check
+        version = CacheVersion.get_version(PROMPT_CACHE_NAME)
+        if snapshot and snapshot['version'] == version:
+            snapshot['checked_at'] = now
+            return snapshot
+        
+        prompts = dict(db.session.query(PromptTemplate.step_name, PromptTemplate.prompt_text).all())
+        snapshot = {'version': version, 'prompts': prompts, 'formatted': {}, 'checked_at': now}
+        with _prompt_cache_lock:
+            _prompt_cache = snapshot
+        return snapshot
+
+class BatchItem(db.Model):
+    """Model to track one company in a batch run, so interrupted batches can resume"""
+    __table_args__ = (
+        db.UniqueConstraint('batch_id', 'item_key', name='uq_batch_item_key'),
+        db.Index('ix_batch_item_batch_status', 'batch_id', 'status'),  # Claiming the next pending item
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(100), nullable=False, index=True)
+    item_key = db.Column(db.String(255), nullable=False)  # Unique per batch, e.g. "AAPL|Q3 2025"
+    company_name = db.Column(db.String(255), nullable=False)
+    quarter = db.Column(db.String(50), nullable=False)
+    excel_path = db.Column(db.String(1024), nullable=False)
+    pdf_path = db.Column(db.String(1024), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, completed, failed
+    stage = db.Column(db.String(50), nullable=True)  # Pipeline step currently running
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    session_id = db.Column(db.String(255), nullable=True)  # ResearchSession holding the results
+    pdf_report_path = db.Column(db.String(1024), nullable=True)
+    docx_report_path = db.Column(db.String(1024), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        """Serialize item state for status reports"""
+        return {
+            'company_name': self.company_name,
+            'quarter': self.quarter,
+            'status': self.status,
+            'stage': self.stage,
+            'error': self.error,
+            'attempts': self.attempts or 0,
+            'pdf_report_path': self.pdf_report_path,
+            'docx_report_path': self.docx_report_path,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
         }
-        return defaults.get(step_name, "Default prompt not available")
@@ -1,13 +1,20 @@
-import os
+import json
+import time
 import uuid
-from flask import render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, stream_with_context, g
+from sqlalchemy.orm import undefer
 from werkzeug.utils import secure_filename
 from app import app, db
 from models import ResearchSession, PromptTemplate
 from services.excel_processor import ExcelProcessor
-from services.pdf_processor import PDFProcessor
-from services.llm_analyzer import LLMAnalyzer
-from services.report_generator import ReportGenerator
+from services.llm_analyzer import AsyncLLMAnalyzer
+from services.report_generator import ReportGenerator, REPORT_LAYOUTS
+from services.job_queue import JobQueue, ensure_inline_workers
+from services.artifact_store import ArtifactStore
+from services.export_cache import ExportCache
+from services.storage_retention import RetentionManager
+from services.metrics import metrics
+from services.single_flight import single_flight
 
 # Allowed file extensions
 ALLOWED_EXCEL_EXTENSIONS = {'xlsx', 'xls'}
@@ -16,6 +23,30 @@ ALLOWED_PDF_EXTENSIONS = {'pdf'}
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def load_research_session(*columns):
+    """
+    Return the browser session's ResearchSession (or None), querying it once per request
+    columns are deferred columns to load with the row rather than on first access
+    """
+    if 'research_session' not in g:
+        session_id = session.get('research_session_id')
+        query = ResearchSession.query.options(*[undefer(column) for column in columns])
+        g.research_session = query.filter_by(session_id=session_id).first() if session_id else None
+    return g.research_session
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the response time and status of every request by route"""
+    if 'request_started' in g:
+        labels = {'route': metrics.current_route(), 'method': request.method}
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - g.request_started)
+        metrics.inc('http_requests_total', dict(labels, status=response.status_code))
+    return response
+
 @app.route('/')
 def index():
     """Step 0: Input collection"""
@@ -23,9 +54,7 @@ def index():
     if 'research_session_id' not in session:
         session['research_session_id'] = str(uuid.uuid4())
     
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session()
     
     if not research_session:
         research_session = ResearchSession(
@@ -41,29 +70,35 @@ def index():
 def upload_files():
     """Handle file uploads and basic info submission"""
     try:
-        research_session = ResearchSession.query.filter_by(
-            session_id=session['research_session_id']
-        ).first()
+        research_session = load_research_session()
         
         if not research_session:
             flash('Session expired. Please start over.', 'error')
             return redirect(url_for('index'))
         
         # Update basic info
-        research_session.company_name = request.form.get('company_name', '').strip()
-        research_session.quarter = request.form.get('quarter', '').strip()
+        company_name = request.form.get('company_name', '').strip()
+        quarter = request.form.get('quarter', '').strip()
+        if (company_name, quarter) != (research_session.company_name, research_session.quarter):
+            research_session.final_report = None
+        research_session.company_name = company_name
+        research_session.quarter = quarter
         
         if not research_session.company_name or not research_session.quarter:
             flash('Company name and quarter are required.', 'error')
             return redirect(url_for('index'))
         
-        # Handle Excel file upload
+        artifact_store = ArtifactStore()
+        
+        # Handle Excel file upload (stored by content hash so identical files are shared)
         excel_file = request.files.get('excel_file')
         if excel_file and excel_file.filename and allowed_file(excel_file.filename, ALLOWED_EXCEL_EXTENSIONS):
-            excel_filename = secure_filename(f"{research_session.session_id}_{excel_file.filename}")
-            excel_path = os.path.join(app.config['UPLOAD_FOLDER'], excel_filename)
-            excel_file.save(excel_path)
-            research_session.excel_filename = excel_filename
+            excel_hash = artifact_store.save_upload(excel_file)
+            if excel_hash != research_session.excel_hash:
+                research_session.set_financial_data(None)
+                research_session.final_report = None
+            research_session.excel_filename = secure_filename(f"{research_session.session_id}_{excel_file.filename}")
+            research_session.excel_hash = excel_hash
         elif not research_session.excel_filename:
             flash('Please upload a valid Excel file (.xlsx or .xls).', 'error')
             return redirect(url_for('index'))
@@ -71,10 +106,12 @@ def upload_files():
         # Handle PDF file upload
         pdf_file = request.files.get('pdf_file')
         if pdf_file and pdf_file.filename and allowed_file(pdf_file.filename, ALLOWED_PDF_EXTENSIONS):
-            pdf_filename = secure_filename(f"{research_session.session_id}_{pdf_file.filename}")
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-            pdf_file.save(pdf_path)
-            research_session.pdf_filename = pdf_filename
+            pdf_hash = artifact_store.save_upload(pdf_file)
+            if pdf_hash != research_session.pdf_hash:
+                research_session.set_transcript_analysis(None)
+                research_session.final_report = None
+            research_session.pdf_filename = secure_filename(f"{research_session.session_id}_{pdf_file.filename}")
+            research_session.pdf_hash = pdf_hash
         elif not research_session.pdf_filename:
             flash('Please upload a valid PDF file.', 'error')
             return redirect(url_for('index'))
@@ -92,24 +129,27 @@ def upload_files():
 @app.route('/step1')
 def step1():
     """Step 1: Process Excel and display financial data"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session(ResearchSession.financial_data)
     
     if not research_session or research_session.current_step < 1:
         flash('Please complete the previous step first.', 'error')
         return redirect(url_for('index'))
     
     try:
-        # Process Excel file if not already processed
-        if not research_session.get_financial_data():
-            excel_path = os.path.join(app.config['UPLOAD_FOLDER'], research_session.excel_filename)
+        # Process Excel file if not already processed, reusing results parsed from identical uploads
+        financial_data = research_session.get_financial_data()
+        if not financial_data:
+            artifact_store = ArtifactStore()
+            excel_path = artifact_store.resolve_path(research_session.excel_hash, research_session.excel_filename)
             excel_processor = ExcelProcessor()
-            financial_data = excel_processor.process_excel(excel_path)
+            financial_data = artifact_store.get_or_build(
+                research_session.excel_hash,
+                'excel_financial_data',
+                lambda: excel_processor.process_excel(excel_path)
+            )
             research_session.set_financial_data(financial_data)
             db.session.commit()
         
-        financial_data = research_session.get_financial_data()
         return render_template('step1.html', 
                              session_data=research_session,
                              financial_data=financial_data)
@@ -122,9 +162,7 @@ def step1():
 def upload_earning_summary():
     """Handle earning summary upload"""
     try:
-        research_session = ResearchSession.query.filter_by(
-            session_id=session['research_session_id']
-        ).first()
+        research_session = load_research_session()
         
         if not research_session:
             flash('Session expired. Please start over.', 'error')
@@ -136,12 +174,11 @@ def upload_earning_summary():
             # Define allowed extensions for summary files
             allowed_extensions = {'pdf', 'docx', 'doc', 'txt'}
             if allowed_file(summary_file.filename, allowed_extensions):
-                summary_filename = secure_filename(f"{research_session.session_id}_summary_{summary_file.filename}")
-                summary_path = os.path.join(app.config['UPLOAD_FOLDER'], summary_filename)
-                summary_file.save(summary_path)
+                summary_hash = ArtifactStore().save_upload(summary_file)
                 
-                # Store the summary filename in the database
-                research_session.summary_filename = summary_filename
+                # Store the summary filename and content hash in the database
+                research_session.summary_filename = secure_filename(f"{research_session.session_id}_summary_{summary_file.filename}")
+                research_session.summary_hash = summary_hash
                 db.session.commit()
                 
                 flash(f'Earning summary "{summary_file.filename}" uploaded successfully!', 'success')
@@ -159,64 +196,132 @@ def upload_earning_summary():
 @app.route('/approve_financial', methods=['POST'])
 def approve_financial():
     """Approve financial data and move to step 2"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
-    
-    if not research_session:
+    if not ResearchSession.set_step(session.get('research_session_id'), 2):
         flash('Session expired. Please start over.', 'error')
         return redirect(url_for('index'))
     
-    research_session.current_step = 2
-    db.session.commit()
-    
     return redirect(url_for('step2'))
 
 @app.route('/step2')
 def step2():
     """Step 2: Analyze PDF transcript"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session(ResearchSession.transcript_analysis)
     
     if not research_session or research_session.current_step < 2:
         flash('Please complete the previous steps first.', 'error')
         return redirect(url_for('index'))
     
     try:
-        # Process PDF and analyze with LLM if not already done
-        if not research_session.get_transcript_analysis():
-            # Extract text from PDF
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], research_session.pdf_filename)
-            pdf_processor = PDFProcessor()
-            transcript_text = pdf_processor.extract_text(pdf_path)
+        analysis_job = None
+        transcript_analysis = research_session.get_transcript_analysis()
+        
+        # Queue PDF extraction and LLM analysis in the background if not already done
+        if not transcript_analysis:
+            job_queue = JobQueue()
+            analysis_job = job_queue.get_latest_job(research_session.session_id)
             
-            # Analyze with LLM
-            llm_analyzer = LLMAnalyzer()
-            analysis = llm_analyzer.analyze_transcript(
-                transcript_text, 
-                research_session.company_name,
-                research_session.quarter
-            )
+            retry_requested = request.args.get('retry') == '1'
+            if not analysis_job or analysis_job.status == 'completed' or (analysis_job.status == 'failed' and retry_requested):
+                analysis_job = job_queue.enqueue(research_session.session_id)
             
-            research_session.set_transcript_analysis(analysis)
-            db.session.commit()
+            if analysis_job.is_active:
+                ensure_inline_workers(app)
         
-        transcript_analysis = research_session.get_transcript_analysis()
         return render_template('step2.html',
                              session_data=research_session,
-                             transcript_analysis=transcript_analysis)
+                             transcript_analysis=transcript_analysis,
+                             analysis_job=analysis_job)
         
     except Exception as e:
         flash(f'Error analyzing transcript: {str(e)}', 'error')
         return redirect(url_for('step1'))
 
+@app.route('/step2/status')
+def step2_status():
+    """Report progress of the background transcript analysis job"""
+    research_session = load_research_session()
+    
+    if not research_session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if research_session.has_transcript_analysis:
+        return jsonify({'status': 'completed', 'progress': 100, 'message': 'Analysis complete'})
+    
+    analysis_job = JobQueue().get_latest_job(research_session.session_id)
+    if not analysis_job:
+        return jsonify({'status': 'not_started', 'progress': 0, 'message': None})
+    
+    return jsonify(analysis_job.to_dict())
+
+@app.route('/step2/stream')
+def step2_stream():
+    """Stream transcript analysis fields to the browser as server-sent events while the job runs"""
+    research_session = load_research_session()
+    
+    if not research_session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    session_id = research_session.session_id
+    poll_interval = app.config['JOB_STREAM_POLL_INTERVAL']
+    
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        job_queue = JobQueue()
+        sent_fields = {}
+        last_status = None
+        last_keepalive = time.monotonic()
+        
+        while True:
+            # End the read transaction so each poll sees the worker's latest commit
+            db.session.rollback()
+            
+            analysis_job = job_queue.get_latest_job(session_id)
+            if not analysis_job:
+                yield format_event('failed', {'error': 'No analysis job found'})
+                return
+            db.session.refresh(analysis_job)
+            
+            if analysis_job.status == 'completed':
+                yield format_event('done', analysis_job.to_dict())
+                return
+            if analysis_job.status == 'failed':
+                yield format_event('failed', analysis_job.to_dict())
+                return
+            
+            status = (analysis_job.status, analysis_job.progress, analysis_job.message)
+            if status != last_status:
+                yield format_event('progress', analysis_job.to_dict())
+                last_status = status
+            
+            # Send only the text appended to each field since the last event
+            for field, value in analysis_job.get_partial_result().items():
+                previous = sent_fields.get(field)
+                if value == previous:
+                    continue
+                if isinstance(value, str) and isinstance(previous, str) and value.startswith(previous):
+                    yield format_event('field', {'field': field, 'append': value[len(previous):]})
+                else:
+                    yield format_event('field', {'field': field, 'value': value})
+                sent_fields[field] = value
+            
+            # Comment lines keep proxies from closing an idle connection
+            if time.monotonic() - last_keepalive > 15:
+                yield ": keep-alive\n\n"
+                last_keepalive = time.monotonic()
+            
+            time.sleep(poll_interval)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/edit_analysis', methods=['POST'])
 def edit_analysis():
     """Allow editing of transcript analysis"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session(ResearchSession.transcript_analysis)
     
     if not research_session:
         return jsonify({'error': 'Session not found'}), 404
@@ -230,6 +335,8 @@ def edit_analysis():
         analysis['qa_insights'] = request.form.get('qa_insights', '')
         
         research_session.set_transcript_analysis(analysis)
+        # The report is regenerated on the next visit to step 3, recomputing only the affected sections
+        research_session.final_report = None
         db.session.commit()
         
         flash('Analysis updated successfully!', 'success')
@@ -242,25 +349,16 @@ def edit_analysis():
 @app.route('/approve_analysis', methods=['POST'])
 def approve_analysis():
     """Approve transcript analysis and move to step 3"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
-    
-    if not research_session:
+    if not ResearchSession.set_step(session.get('research_session_id'), 3):
         flash('Session expired. Please start over.', 'error')
         return redirect(url_for('index'))
     
-    research_session.current_step = 3
-    db.session.commit()
-    
     return redirect(url_for('step3'))
 
 @app.route('/step3')
 def step3():
     """Step 3: Generate and preview final report"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session(ResearchSession.final_report)
     
     if not research_session or research_session.current_step < 3:
         flash('Please complete the previous steps first.', 'error')
@@ -269,16 +367,29 @@ def step3():
     try:
         # Generate final report if not already done
         if not research_session.final_report:
-            report_generator = ReportGenerator()
-            final_report = report_generator.generate_report(
-                company_name=research_session.company_name,
-                quarter=research_session.quarter,
-                financial_data=research_session.get_financial_data(),
-                transcript_analysis=research_session.get_transcript_analysis()
-            )
+            def generate_report():
+                report_generator = ReportGenerator()
+                # Sections whose inputs are unchanged since the last report are reused from its model
+                final_report, report_model = report_generator.generate_report_with_data(
+                    company_name=research_session.company_name,
+                    quarter=research_session.quarter,
+                    financial_data=research_session.get_financial_data(),
+                    transcript_analysis=research_session.get_transcript_analysis(),
+                    llm_analyzer=AsyncLLMAnalyzer(),
+                    report_model=research_session.get_report_model()
+                )
+                
+                research_session.final_report = final_report
+                research_session.set_report_model(report_model)
+                db.session.commit()
+                return final_report
             
-            research_session.final_report = final_report
-            db.session.commit()
+            def stored_report():
+                db.session.refresh(research_session, ['final_report'])
+                return research_session.final_report
+            
+            # A refresh or double-click while the report is generating waits for that report
+            single_flight.run(f"report:{research_session.session_id}", generate_report, lookup=stored_report)
         
         return render_template('step3.html',
                              session_data=research_session,
@@ -288,39 +399,85 @@ def step3():
         flash(f'Error generating report: {str(e)}', 'error')
         return redirect(url_for('step2'))
 
+@app.route('/report/<layout>')
+def view_report(layout):
+    """Render the session's report in another layout, streamed to the browser as it renders"""
+    research_session = load_research_session(ResearchSession.report_data)
+    
+    if not research_session or not research_session.has_final_report:
+        flash('No report available to view.', 'error')
+        return redirect(url_for('index'))
+    
+    if layout not in REPORT_LAYOUTS:
+        flash(f'Unknown report layout: {layout}', 'error')
+        return redirect(url_for('step3'))
+    
+    report_generator = ReportGenerator()
+    report_data = research_session.get_report_data()
+    if not report_data:
+        # Reports generated before report data was stored; summary and risk calls hit the LLM response cache
+        report_data = report_generator.build_report_data(
+            company_name=research_session.company_name,
+            quarter=research_session.quarter,
+            financial_data=research_session.get_financial_data(),
+            transcript_analysis=research_session.get_transcript_analysis(),
+            llm_analyzer=AsyncLLMAnalyzer()
+        )
+    
+    return Response(stream_with_context(report_generator.stream_html(report_data, layout)), mimetype='text/html')
+
 @app.route('/download_report/<format>')
 def download_report(format):
     """Download the final report in specified format"""
-    research_session = ResearchSession.query.filter_by(
-        session_id=session['research_session_id']
-    ).first()
+    research_session = load_research_session(ResearchSession.final_report)
     
     if not research_session or not research_session.final_report:
         flash('No report available for download.', 'error')
         return redirect(url_for('index'))
     
+    if format not in ('pdf', 'docx'):
+        flash('Invalid format requested.', 'error')
+        return redirect(url_for('step3'))
+    
+    # The export is fully determined by the report text, so a matching ETag needs no work at all
+    etag = ExportCache.make_key(research_session.final_report, format)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
     try:
         report_generator = ReportGenerator()
         
-        if format == 'pdf':
-            file_path = report_generator.export_to_pdf(
-                research_session.final_report,
-                research_session.company_name,
-                research_session.quarter,
-                app.config['DOWNLOAD_FOLDER']
-            )
-        elif format == 'docx':
-            file_path = report_generator.export_to_docx(
+        def export(folder):
+            if format == 'pdf':
+                return report_generator.export_to_pdf(
+                    research_session.final_report,
+                    research_session.company_name,
+                    research_session.quarter,
+                    folder
+                )
+            return report_generator.export_to_docx(
                 research_session.final_report,
                 research_session.company_name,
                 research_session.quarter,
-                app.config['DOWNLOAD_FOLDER']
+                folder,
+                report_data=research_session.get_report_data()
             )
-        else:
-            flash('Invalid format requested.', 'error')
-            return redirect(url_for('step3'))
         
-        return send_file(file_path, as_attachment=True)
+        file_path, etag = ExportCache().get_or_export(research_session.final_report, format, export)
+        
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=report_generator.export_filename(research_session.company_name, research_session.quarter, format),
+            etag=etag,
+            conditional=True
+        )
+        # Session-specific content: browsers may keep it but must revalidate with the ETag
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
         
     except Exception as e:
         flash(f'Error generating download: {str(e)}', 'error')
@@ -330,12 +487,14 @@ def download_report(format):
 def reset_session():
     """Reset the current session and start over"""
     if 'research_session_id' in session:
-        research_session = ResearchSession.query.filter_by(
-            session_id=session['research_session_id']
-        ).first()
+        research_session = load_research_session()
         if research_session:
+            JobQueue().cancel_jobs(research_session.session_id)
+            content_hashes = (research_session.excel_hash, research_session.pdf_hash, research_session.summary_hash)
             db.session.delete(research_session)
             db.session.commit()
+            # Uploads no other session shares are deleted now rather than by the next `flask storage gc`
+            RetentionManager().release_session(content_hashes)
         session.pop('research_session_id', None)
     
     flash('Session reset successfully.', 'info')
@@ -387,7 +546,7 @@ def save_prompt(step):
             )
             db.session.add(prompt)
         
-        db.session.commit()
+        PromptTemplate.commit_changes()
         flash(f'Prompt for {step} saved successfully!', 'success')
         
         return redirect(url_for('edit_prompts', step=step))
@@ -402,7 +561,7 @@ def reset_prompts():
     try:
         # Delete all custom prompts
         PromptTemplate.query.delete()
-        db.session.commit()
+        PromptTemplate.commit_changes()
         
         flash('All prompts have been reset to defaults.', 'success')
         return redirect(url_for('index'))
@@ -431,3 +590,8 @@ def preview_prompt(step):
         'formatted_prompt': formatted_prompt,
         'sample_data': sample_data
     })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Pipeline and request metrics of all worker processes in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
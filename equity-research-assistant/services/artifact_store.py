@@ -0,0 +1,357 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+from flask import current_app, Request
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import ParsedArtifact, StorageUsage
+from services.single_flight import single_flight
+
+# Bump when a parser's output format changes so stale artifacts are rebuilt
+ARTIFACT_VERSIONS = {
+    'excel_financial_data': 2,
+    'transcript_text': 1,
+    'transcript_sections': 1
+}
+
+# Read uploads in 1MB chunks while hashing
+CHUNK_SIZE = 1024 * 1024
+
+# StorageUsage area tracking the blob store
+UPLOAD_USAGE_AREA = 'uploads'
+
+# Leading bytes expected for each file type; extensions not listed (e.g. txt) are not checked
+OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_SIGNATURE = b'PK\x03\x04'
+FILE_SIGNATURES = {
+    'xlsx': ZIP_SIGNATURE,
+    'docx': ZIP_SIGNATURE,
+    'xls': OLE2_SIGNATURE,
+    'doc': OLE2_SIGNATURE,
+    'pdf': b'%PDF-'
+}
+
+# PDF readers accept a header anywhere in the first 1KB, so search that much rather than the first bytes
+PDF_HEADER_WINDOW = 1024
+
+
+class StorageQuotaExceeded(Exception):
+    """Raised when storing a new upload would take the blob store over UPLOAD_QUOTA_BYTES"""
+
+
+class InvalidUpload(Exception):
+    """Raised when an uploaded file is too large or its content does not match its extension"""
+
+
+def sniff_file_type(extension, head, complete=False):
+    """
+    Check the first bytes of a file against the signature for its extension
+    Returns True or False, or None when more bytes are needed to decide (complete=True forces a decision)
+    """
+    signature = FILE_SIGNATURES.get(extension)
+    if not signature:
+        return True
+
+    if extension == 'pdf':
+        if signature in head[:PDF_HEADER_WINDOW]:
+            return True
+        return False if complete or len(head) >= PDF_HEADER_WINDOW else None
+
+    if head.startswith(signature):
+        return True
+    return None if not complete and signature.startswith(head) else False
+
+
+class StreamedUpload:
+    """
+    Writable container for one uploaded file
+    Chunks go straight to a temporary file in the blob folder while the content is hashed, its
+    type checked against the extension and its size against the limit, so peak memory per upload
+    stays at one chunk. Once a file is rejected the rest of its data is discarded without writing
+    """
+
+    def __init__(self, blob_folder, extension, max_bytes=0, declared_length=None):
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.error = None
+        self.path = None
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._sniffed = extension not in FILE_SIGNATURES
+        self._file = None
+
+        if max_bytes and declared_length and declared_length > max_bytes:
+            self._reject(f"File is larger than the {max_bytes // (1024 * 1024)}MB upload limit")
+            return
+
+        os.makedirs(blob_folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=blob_folder, suffix='.upload')
+        self._file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        if self.error:
+            return len(data)
+
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self._reject(f"File is larger than the {self.max_bytes // (1024 * 1024)}MB upload limit")
+            return len(data)
+
+        if not self._sniffed:
+            self._head += data[:PDF_HEADER_WINDOW - len(self._head)]
+            self._check_type()
+            if self.error:
+                return len(data)
+
+        self._digest.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def finish(self):
+        """Complete the upload and return its content hash; raises InvalidUpload if it was rejected"""
+        if not self.error and not self._sniffed:
+            self._check_type(complete=True)
+        if not self.error and not self.size:
+            self._reject('File is empty')
+        if self.error:
+            raise InvalidUpload(self.error)
+
+        self._file.close()
+        return self._digest.hexdigest()
+
+    def _check_type(self, complete=False):
+        """Reject the upload once its leading bytes rule out the expected file type"""
+        matches = sniff_file_type(self.extension, self._head, complete)
+        if matches is False:
+            self._reject(f"File content is not a valid .{self.extension} file")
+        elif matches:
+            self._sniffed = True
+
+    def _reject(self, error):
+        """Record why the upload was rejected and drop what was written so far"""
+        self.error = error
+        self.close()
+
+    # File methods Werkzeug and FileStorage use once the upload has been received
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence) if self._file and not self._file.closed else 0
+
+    def tell(self):
+        return self._file.tell() if self._file and not self._file.closed else 0
+
+    def read(self, size=-1):
+        return self._file.read(size) if self._file and not self._file.closed else b''
+
+    def readline(self, size=-1):
+        return self._file.readline(size) if self._file and not self._file.closed else b''
+
+    def close(self):
+        """Close the temporary file and delete it unless it was moved into the store"""
+        if self._file:
+            self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadRequest(Request):
+    """Request class that streams uploaded files into the blob folder instead of Werkzeug's spooled temp files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return StreamedUpload(
+            os.path.join(config['UPLOAD_FOLDER'], 'blobs'),
+            ArtifactStore.file_extension(filename or ''),
+            max_bytes=config.get('MAX_UPLOAD_FILE_BYTES', 0),
+            declared_length=content_length
+        )
+
+
+class ArtifactStore:
+    """Content-addressed storage for uploaded files and the results parsed from them"""
+
+    def __init__(self, upload_folder=None, quota_bytes=None):
+        self.logger = logging.getLogger(__name__)
+        self.upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+        self.blob_folder = os.path.join(self.upload_folder, 'blobs')
+        self.quota_bytes = quota_bytes if quota_bytes is not None else current_app.config.get('UPLOAD_QUOTA_BYTES', 0)
+
+    @staticmethod
+    def file_extension(filename):
+        """Return the lowercase extension of a filename without the dot"""
+        return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+    def blob_path(self, content_hash, extension):
+        """Path of the stored file for a content hash (sharded on the first two hex digits)"""
+        blob_name = f"{content_hash}.{extension}" if extension else content_hash
+        return os.path.join(self.blob_folder, content_hash[:2], blob_name)
+
+    def save_upload(self, file_storage):
+        """
+        Save an uploaded file under its content hash
+        Identical uploads share a single file on disk
+        Returns the SHA-256 hex digest of the content
+        """
+        if isinstance(file_storage.stream, StreamedUpload):
+            # Already written to the blob folder and hashed while the request was parsed
+            try:
+                return self.adopt_upload(file_storage.stream)
+            except InvalidUpload as e:
+                raise InvalidUpload(f"{file_storage.filename}: {str(e)}")
+        return self._save_stream(file_storage.stream, self.file_extension(file_storage.filename))
+
+    def save_file(self, file_path):
+        """Copy a file from disk into the store (used by batch runs); returns its content hash"""
+        with open(file_path, 'rb') as source:
+            return self._save_stream(source, self.file_extension(file_path))
+
+    def _save_stream(self, stream, extension):
+        """Hash and check a stream while copying it to a temporary file, then move it into the store"""
+        upload = StreamedUpload(self.blob_folder, extension)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            upload.write(chunk)
+            if upload.error:
+                break
+        return self.adopt_upload(upload)
+
+    def adopt_upload(self, upload):
+        """Move a completed StreamedUpload into the store; raises InvalidUpload if it was rejected"""
+        try:
+            return self.adopt_file(upload.path, upload.finish(), upload.extension)
+        finally:
+            upload.close()
+
+    def adopt_file(self, temp_path, content_hash, extension):
+        """
+        Move an already hashed file into the store, discarding it if the content is already stored
+        New files count towards the upload quota; the usage change is committed on its own right after the
+        move, so it stays in step with the blob store whether or not the caller's transaction commits
+        """
+        final_path = self.blob_path(content_hash, extension)
+        if os.path.exists(final_path):
+            self.logger.debug(f"Upload {content_hash[:12]} already stored, skipping duplicate")
+            os.remove(temp_path)
+            # Mark the blob as recently used so garbage collection leaves it to the new upload
+            os.utime(final_path)
+            return content_hash
+
+        size = os.path.getsize(temp_path)
+        if self.quota_bytes:
+            # Reading must not flush the caller's pending changes, which would hold the database's write lock
+            with db.session.no_autoflush:
+                used_bytes, _ = StorageUsage.get_usage(UPLOAD_USAGE_AREA)
+            if used_bytes + size > self.quota_bytes:
+                os.remove(temp_path)
+                raise StorageQuotaExceeded(
+                    f"Upload storage is full ({used_bytes // (1024 * 1024)}MB of {self.quota_bytes // (1024 * 1024)}MB used)"
+                )
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        StorageUsage.record_committed(UPLOAD_USAGE_AREA, size, 1)
+        return content_hash
+
+    def iter_blobs(self):
+        """Yield os.DirEntry objects for every stored blob"""
+        if not os.path.isdir(self.blob_folder):
+            return
+        for shard in os.scandir(self.blob_folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file():
+                    yield entry
+
+    def find_blobs(self, content_hashes):
+        """Return os.DirEntry objects for the stored blobs of the given content hashes"""
+        entries = []
+        for content_hash in content_hashes:
+            shard_folder = os.path.join(self.blob_folder, content_hash[:2])
+            if os.path.isdir(shard_folder):
+                entries.extend(
+                    entry for entry in os.scandir(shard_folder)
+                    if entry.is_file() and self.blob_hash(entry.name) == content_hash
+                )
+        return entries
+
+    @staticmethod
+    def blob_hash(blob_name):
+        """Content hash of a stored blob from its file name"""
+        return blob_name.split('.', 1)[0]
+
+    def resolve_path(self, content_hash, filename):
+        """
+        Locate the file for an upload
+        Falls back to the legacy per-session file for uploads saved before hashing was added
+        """
+        if content_hash:
+            return self.blob_path(content_hash, self.file_extension(filename))
+        return os.path.join(self.upload_folder, filename)
+
+    def get_artifact(self, content_hash, kind):
+        """Return the parsed payload stored for a file, or None if it has not been parsed yet"""
+        if not content_hash:
+            return None
+
+        artifact = ParsedArtifact.query.filter_by(
+            content_hash=content_hash,
+            kind=kind,
+            version=ARTIFACT_VERSIONS.get(kind, 1)
+        ).first()
+        if not artifact:
+            return None
+
+        artifact.last_used_at = datetime.utcnow()
+        db.session.commit()
+        return artifact.get_payload()
+
+    def put_artifact(self, content_hash, kind, payload):
+        """Store (or replace) the parsed payload for a file"""
+        if not content_hash:
+            return
+
+        version = ARTIFACT_VERSIONS.get(kind, 1)
+        artifact = ParsedArtifact.query.filter_by(content_hash=content_hash, kind=kind).first()
+        if not artifact:
+            artifact = ParsedArtifact(content_hash=content_hash, kind=kind)
+            db.session.add(artifact)
+
+        artifact.version = version
+        artifact.payload = json.dumps(payload)
+        artifact.created_at = datetime.utcnow()
+        artifact.last_used_at = datetime.utcnow()
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same artifact concurrently; theirs is equivalent
+            db.session.rollback()
+
+    def get_or_build(self, content_hash, kind, builder):
+        """
+        Return the stored artifact, or build it with builder() and store the result
+        Concurrent builds of the same artifact in any process are coalesced into one
+        """
+        payload = self.get_artifact(content_hash, kind)
+        if payload is not None:
+            self.logger.info(f"Reusing parsed {kind} for upload {content_hash[:12]}")
+            return payload
+
+        def build():
+            payload = builder()
+            self.put_artifact(content_hash, kind, payload)
+            return payload
+
+        if not content_hash:
+            return build()
+        return single_flight.run(
+            f"artifact:{content_hash}:{kind}",
+            build,
+            lookup=lambda: self.get_artifact(content_hash, kind)
+        )
@@ -0,0 +1,286 @@
+import os
+import csv
+import json
+import uuid
+import time
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from app import db
+from models import BatchItem, ResearchSession
+from services.artifact_store import ArtifactStore
+from services.excel_processor import ExcelProcessor
+from services.llm_analyzer import AsyncLLMAnalyzer
+from services.report_generator import ReportGenerator
+from services.job_queue import analyze_session_transcript
+from services.metrics import metrics
+
+# Accepted manifest column names for each field
+MANIFEST_FIELDS = {
+    'company_name': ('company_name', 'company', 'ticker'),
+    'quarter': ('quarter',),
+    'excel_path': ('excel_file', 'excel', 'excel_path'),
+    'pdf_path': ('pdf_file', 'pdf', 'transcript', 'pdf_path')
+}
+
+EXPORT_FORMATS = ('pdf', 'docx')
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces operations out to at most a given number per minute"""
+
+    def __init__(self, per_minute=None):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Block until the next slot is available"""
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+class BatchRunner:
+    """Run the full research pipeline for every company in a manifest without browser interaction"""
+
+    def __init__(self, app, concurrency=None, items_per_minute=None, output_folder=None, formats=EXPORT_FORMATS):
+        self.logger = logging.getLogger(__name__)
+        self.app = app
+        self.concurrency = concurrency or app.config['BATCH_CONCURRENCY']
+        self.rate_limiter = RateLimiter(items_per_minute if items_per_minute is not None else app.config['BATCH_ITEMS_PER_MINUTE'])
+        self.output_folder = output_folder
+        self.formats = formats
+
+    @staticmethod
+    def load_manifest(manifest_path):
+        """
+        Read a CSV or JSON manifest of (company, quarter, excel, pdf) entries
+        Relative file paths are resolved against the manifest's directory
+        """
+        with open(manifest_path, newline='', encoding='utf-8') as manifest_file:
+            if manifest_path.lower().endswith('.json'):
+                rows = json.load(manifest_file)
+                if isinstance(rows, dict):
+                    rows = rows.get('items', [])
+            else:
+                rows = list(csv.DictReader(manifest_file))
+
+        base_folder = os.path.dirname(os.path.abspath(manifest_path))
+        entries = []
+        for line_number, row in enumerate(rows, start=1):
+            row = {str(key).strip().lower(): value for key, value in row.items() if key}
+            entry = {}
+            for field, aliases in MANIFEST_FIELDS.items():
+                value = next((row[alias] for alias in aliases if row.get(alias)), None)
+                if not value:
+                    raise Exception(f"Manifest entry {line_number} is missing {field}")
+                entry[field] = str(value).strip()
+
+            for field in ('excel_path', 'pdf_path'):
+                entry[field] = os.path.normpath(os.path.join(base_folder, os.path.expanduser(entry[field])))
+            entries.append(entry)
+
+        return entries
+
+    def create_batch(self, manifest_path, batch_id=None):
+        """
+        Register the manifest entries as batch items
+        Entries already in the batch are left untouched, so re-running a manifest resumes it
+        Returns (batch_id, number of new items)
+        """
+        entries = self.load_manifest(manifest_path)
+        if not batch_id:
+            manifest_name = os.path.splitext(os.path.basename(manifest_path))[0]
+            batch_id = f"{manifest_name}-{datetime.utcnow().strftime('%Y%m%d')}"
+
+        existing_keys = {
+            item_key for (item_key,) in db.session.query(BatchItem.item_key).filter_by(batch_id=batch_id)
+        }
+
+        added = 0
+        for entry in entries:
+            item_key = f"{entry['company_name']}|{entry['quarter']}"
+            if item_key in existing_keys:
+                continue
+            db.session.add(BatchItem(batch_id=batch_id, item_key=item_key, status='pending', **entry))
+            existing_keys.add(item_key)
+            added += 1
+
+        db.session.commit()
+        self.logger.info(f"Batch {batch_id}: {added} new item(s) from {manifest_path}")
+        return batch_id, added
+
+    def reset_interrupted(self, batch_id, retry_failed=False):
+        """Return items left running by an interrupted run (and optionally failed items) to the queue"""
+        statuses = ['running', 'failed'] if retry_failed else ['running']
+        reset = BatchItem.query.filter(
+            BatchItem.batch_id == batch_id,
+            BatchItem.status.in_(statuses)
+        ).update({'status': 'pending', 'stage': None, 'error': None}, synchronize_session=False)
+        db.session.commit()
+        return reset
+
+    def run(self, batch_id, retry_failed=False):
+        """
+        Process all pending items of a batch on a pool of worker threads
+        Returns the batch status counts when done
+        """
+        self.reset_interrupted(batch_id, retry_failed)
+
+        threads = []
+        for i in range(max(1, self.concurrency)):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(batch_id, f"batch-worker-{i}"),
+                name=f"batch-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        return self.status(batch_id)['counts']
+
+    def status(self, batch_id):
+        """Return status counts and per-item details for a batch"""
+        items = BatchItem.query.filter_by(batch_id=batch_id).order_by(BatchItem.id).all()
+        counts = {'pending': 0, 'running': 0, 'completed': 0, 'failed': 0}
+        for item in items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return {'batch_id': batch_id, 'counts': counts, 'items': [item.to_dict() for item in items]}
+
+    def claim_next(self, batch_id):
+        """Atomically claim the next pending item, or return None when the batch is drained"""
+        while True:
+            item = BatchItem.query.filter_by(batch_id=batch_id, status='pending').order_by(BatchItem.id).first()
+            if not item:
+                return None
+
+            claimed = BatchItem.query.filter_by(id=item.id, status='pending').update({
+                'status': 'running',
+                'started_at': datetime.utcnow(),
+                'attempts': BatchItem.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed:
+                db.session.refresh(item)
+                return item
+
+    def process_item(self, item):
+        """Run the pipeline for one item; steps already completed by an earlier attempt are skipped"""
+        research_session = None
+        if item.session_id:
+            research_session = ResearchSession.query.filter_by(session_id=item.session_id).first()
+        if not research_session:
+            research_session = ResearchSession(
+                session_id=str(uuid.uuid4()),
+                company_name=item.company_name,
+                quarter=item.quarter
+            )
+            db.session.add(research_session)
+            item.session_id = research_session.session_id
+            db.session.commit()
+
+        artifact_store = ArtifactStore()
+
+        if not research_session.excel_hash or not research_session.pdf_hash:
+            self._set_stage(item, 'ingest')
+            research_session.excel_hash = artifact_store.save_file(item.excel_path)
+            research_session.excel_filename = os.path.basename(item.excel_path)
+            research_session.pdf_hash = artifact_store.save_file(item.pdf_path)
+            research_session.pdf_filename = os.path.basename(item.pdf_path)
+            db.session.commit()
+
+        if not research_session.get_financial_data():
+            self._set_stage(item, 'process_excel')
+            excel_path = artifact_store.resolve_path(research_session.excel_hash, research_session.excel_filename)
+            excel_processor = ExcelProcessor()
+            financial_data = artifact_store.get_or_build(
+                research_session.excel_hash,
+                'excel_financial_data',
+                lambda: excel_processor.process_excel(excel_path)
+            )
+            research_session.set_financial_data(financial_data)
+            db.session.commit()
+
+        if not research_session.get_transcript_analysis():
+            analyze_session_transcript(research_session, on_stage=lambda stage: self._set_stage(item, stage))
+
+        report_generator = ReportGenerator()
+        if not research_session.final_report:
+            self._set_stage(item, 'generate_report')
+            final_report, report_model = report_generator.generate_report_with_data(
+                company_name=research_session.company_name,
+                quarter=research_session.quarter,
+                financial_data=research_session.get_financial_data(),
+                transcript_analysis=research_session.get_transcript_analysis(),
+                llm_analyzer=AsyncLLMAnalyzer(),
+                report_model=research_session.get_report_model()
+            )
+            research_session.final_report = final_report
+            research_session.set_report_model(report_model)
+            research_session.current_step = 3
+            db.session.commit()
+
+        self._set_stage(item, 'export')
+        output_folder = self.output_folder or os.path.join(
+            current_app.config['DOWNLOAD_FOLDER'], 'batches', item.batch_id
+        )
+        os.makedirs(output_folder, exist_ok=True)
+
+        if 'pdf' in self.formats:
+            # Batch items queue for a renderer rather than failing while downloads keep it busy
+            item.pdf_report_path = report_generator.export_to_pdf(
+                research_session.final_report, item.company_name, item.quarter, output_folder, fail_fast=False
+            )
+        if 'docx' in self.formats:
+            item.docx_report_path = report_generator.export_to_docx(
+                research_session.final_report, item.company_name, item.quarter, output_folder,
+                report_data=research_session.get_report_data()
+            )
+
+        item.status = 'completed'
+        item.stage = None
+        item.error = None
+        item.finished_at = datetime.utcnow()
+        db.session.commit()
+
+    def _set_stage(self, item, stage):
+        """Record the pipeline step an item is on"""
+        item.stage = stage
+        db.session.commit()
+
+    def _worker_loop(self, batch_id, worker_name):
+        """Claim and process items until the batch has no pending items left"""
+        while True:
+            self.rate_limiter.wait()
+
+            with self.app.app_context():
+                item = self.claim_next(batch_id)
+                if not item:
+                    return
+
+                try:
+                    self.logger.info(f"{worker_name} processing {item.company_name} {item.quarter}")
+                    with metrics.bind_route('batch'):
+                        self.process_item(item)
+                    self.logger.info(f"{worker_name} completed {item.company_name} {item.quarter}")
+                except Exception as e:
+                    db.session.rollback()
+                    self.logger.error(f"Batch item {item.company_name} {item.quarter} failed: {str(e)}")
+                    BatchItem.query.filter_by(id=item.id).update({
+                        'status': 'failed',
+                        'error': str(e),
+                        'finished_at': datetime.utcnow()
+                    }, synchronize_session=False)
+                    db.session.commit()
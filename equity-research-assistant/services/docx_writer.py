@@ -0,0 +1,162 @@
+import logging
+from copy import deepcopy
+from docx import Document
+from docx.oxml.ns import qn
+
+FINANCIAL_TABLE_HEADERS = ('Metric', 'Previous Quarter', 'Analyst Estimate', 'Actual', 'Variance')
+FINANCIAL_TABLE_FIELDS = ('metric', 'previous', 'estimate', 'actual', 'variance')
+
+# Transcript sections in report order, with the text used when a section is empty
+TRANSCRIPT_SECTIONS = (
+    ('management_commentary', 'Management Commentary', 'No commentary available.'),
+    ('strategic_themes', 'Strategic Themes', 'No strategic themes identified.'),
+    ('risks_and_tailwinds', 'Risks and Tailwinds', 'No risks or tailwinds identified.'),
+    ('qa_insights', 'Q&A Insights', 'No Q&A insights available.')
+)
+
+DISCLAIMER = "This research report is generated using automated analysis tools and should be used for informational purposes only. Please conduct your own due diligence before making investment decisions."
+
+def _as_text(value):
+    """Text for an LLM field that should be a string but may come back as a list, dict, number or null"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return '; '.join(f"{key}: {_as_text(item)}" for key, item in value.items() if _as_text(item))
+    if isinstance(value, (list, tuple)):
+        return '; '.join(text for text in (_as_text(item) for item in value) if text)
+    return str(value)
+
+def _as_items(value):
+    """Bullet items for an LLM field that should be a list but may come back as a string, dict or null"""
+    if isinstance(value, (list, tuple)):
+        return [text for text in (_as_text(item) for item in value) if text]
+    if isinstance(value, dict):
+        return [f"{key}: {_as_text(item)}" for key, item in value.items() if _as_text(item)]
+    text = _as_text(value)
+    return [text] if text else []
+
+# The only code touching python-docx internals. The public style setter rescans the style sheet
+# for the default style on every paragraph (about 7x slower here), and the public API builds
+# tables one cell at a time, which dominates export time for long tables.
+def _set_style_id(paragraph, style_id):
+    """Apply a pre-resolved paragraph style"""
+    paragraph._p.style = style_id
+
+def _fill_from_last_row(table, rows):
+    """Replace the table's last row with a copy of it per entry of rows, a list of cell texts"""
+    template_row = table.rows[-1]._tr
+    table._tbl.remove(template_row)
+    for cell_texts in rows:
+        row = deepcopy(template_row)
+        for text_element, text in zip(row.iter(qn('w:t')), cell_texts):
+            text_element.text = text
+        table._tbl.append(row)
+
+class DocxReportWriter:
+    """Write a Word report directly from the report data used to render the HTML report"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def write(self, report_data, file_path):
+        """Build the document in a single pass over report_data and save it to file_path"""
+        doc = Document()
+        transcript_analysis = report_data.get('transcript_analysis') or {}
+
+        # Resolving a style by name scans the whole style sheet, so look each one up once
+        self._style_ids = {name: doc.styles[name].style_id for name in ('Title', 'Heading 1', 'Heading 2', 'List Bullet')}
+
+        self._add_styled(doc, f"{report_data['company_name']} - {report_data['quarter']} Equity Research Report", 'Title')
+        doc.add_paragraph(f"Generated on: {report_data['generated_date']}")
+
+        self._add_styled(doc, 'Executive Summary', 'Heading 1')
+        self._add_text(doc, report_data.get('executive_summary'))
+
+        self._add_styled(doc, 'Financial Summary', 'Heading 1')
+        self._add_financial_table(doc, report_data.get('financial_summary') or [])
+
+        for field, title, fallback in TRANSCRIPT_SECTIONS:
+            self._add_styled(doc, title, 'Heading 1')
+            self._add_text(doc, transcript_analysis.get(field) or fallback)
+
+            # The risk assessment follows the transcript's risks, as in the HTML report
+            if field == 'risks_and_tailwinds' and report_data.get('risk_analysis'):
+                self._add_risk_assessment(doc, report_data['risk_analysis'])
+
+        if report_data.get('investment_thesis'):
+            self._add_styled(doc, 'Investment Thesis', 'Heading 1')
+            self._add_bullets(doc, report_data['investment_thesis'])
+
+        disclaimer = doc.add_paragraph()
+        disclaimer.add_run('Disclaimer: ').bold = True
+        disclaimer.add_run(DISCLAIMER)
+
+        doc.save(file_path)
+        return file_path
+
+    def _add_styled(self, doc, text, style_name):
+        """Add a paragraph with one of the pre-resolved styles"""
+        paragraph = doc.add_paragraph(text)
+        _set_style_id(paragraph, self._style_ids[style_name])
+        return paragraph
+
+    def _add_text(self, doc, text):
+        """Add text as one paragraph per blank-line separated block"""
+        if not isinstance(text, str):
+            text = str(text or '')
+        for block in text.split('\n\n'):
+            if block.strip():
+                doc.add_paragraph(block.strip())
+
+    def _add_bullets(self, doc, items):
+        """Add a bulleted list"""
+        for item in items:
+            self._add_styled(doc, str(item), 'List Bullet')
+
+    def _add_labeled(self, doc, label, value):
+        """Add a paragraph with a bold label"""
+        paragraph = doc.add_paragraph()
+        paragraph.add_run(f"{label}: ").bold = True
+        paragraph.add_run(str(value))
+
+    def _add_financial_table(self, doc, financial_summary):
+        """Add the financial summary as a real table, sized up front rather than row by row"""
+        if not financial_summary:
+            doc.add_paragraph('Financial data not available.')
+            return
+
+        column_count = len(FINANCIAL_TABLE_HEADERS)
+        table = doc.add_table(rows=2, cols=column_count)
+        table.style = 'Table Grid'
+
+        header_cells, data_cells = table.rows[0].cells, table.rows[1].cells
+        for cell, header in zip(header_cells, FINANCIAL_TABLE_HEADERS):
+            cell.paragraphs[0].add_run(header).bold = True
+
+        # Build one data row and copy it for each line item
+        for cell in data_cells:
+            cell.paragraphs[0].add_run('-')
+        _fill_from_last_row(table, [
+            [str(summary_row.get(field, '')) for field in FINANCIAL_TABLE_FIELDS] for summary_row in financial_summary
+        ])
+
+    def _add_risk_assessment(self, doc, risk_analysis):
+        """Add the LLM risk assessment under its own heading; fields may be strings, lists, dicts or null"""
+        self._add_styled(doc, 'Risk Assessment', 'Heading 2')
+        if not isinstance(risk_analysis, dict):
+            self._add_text(doc, _as_text(risk_analysis))
+            return
+
+        rating = _as_text(risk_analysis.get('overall_risk_rating'))
+        if rating:
+            self._add_labeled(doc, 'Overall Risk Rating', rating)
+        self._add_bullets(doc, _as_items(risk_analysis.get('key_risks')))
+        mitigation = _as_text(risk_analysis.get('risk_mitigation'))
+        if mitigation:
+            self._add_labeled(doc, 'Mitigation', mitigation)
+        positive_factors = _as_items(risk_analysis.get('positive_factors'))
+        if positive_factors:
+            doc.add_paragraph('Positive factors:')
+            self._add_bullets(doc, positive_factors)
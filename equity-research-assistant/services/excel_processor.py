@@ -1,13 +1,59 @@
+import os
+import re
+import numpy as np
 import pandas as pd
 import openpyxl
 from openpyxl import load_workbook
 import logging
+from services.metrics import metrics
+
+# Common financial line items to look for, grouped by the figure they report
+KEY_METRIC_GROUPS = [
+    ['revenue', 'net revenue', 'total revenue', 'sales'],
+    ['gross profit', 'gross margin'],
+    ['ebitda', 'adjusted ebitda', 'operating income'],
+    ['net income', 'net earnings'],
+    ['eps', 'earnings per share', 'diluted eps'],
+    ['free cash flow', 'operating cash flow'],
+    ['total assets', 'total debt', 'shareholders equity']
+]
+KEY_METRICS = [metric for group in KEY_METRIC_GROUPS for metric in group]
+METRIC_GROUP_INDEX = {metric: index for index, group in enumerate(KEY_METRIC_GROUPS) for metric in group}
+
+# Period indicators and common headers that identify the header row
+HEADER_INDICATORS = ['q1', 'q2', 'q3', 'q4', '2024', '2025', 'previous', 'estimate', 'actual']
+
+# Compiled once so metric and header matching is a single regex search per cell
+METRIC_PATTERN = re.compile('|'.join(re.escape(metric) for metric in KEY_METRICS))
+HEADER_PATTERN = re.compile('|'.join(re.escape(indicator) for indicator in HEADER_INDICATORS))
+
+# Drops "$", "," and ")" and turns "(" into a minus sign, so "$(1,234)" parses as -1234
+NUMBER_TRANSLATION = str.maketrans({',': None, '$': None, ')': None, '(': '-'})
+
+# Rows processed per block while searching for the header row or generic line items
+SCAN_BLOCK_ROWS = 100
+
+# Workbooks at least this large are scanned in read-only streaming mode
+STREAMING_THRESHOLD_BYTES = 5 * 1024 * 1024
+
+# Streaming mode stops after this many rows; metric rows further down are not scanned and
+# the result's metadata is marked as truncated
+STREAMING_MAX_ROWS = 20000
+
+# Once every metric group has a row, streaming stops after this many rows without another metric row
+STREAMING_METRIC_GAP_ROWS = 500
+
+# Named non-metric rows kept while streaming, for the generic fallback extraction
+STREAMING_GENERIC_ROWS = 200
 
 class ExcelProcessor:
     """Service to process Excel files containing analyst estimates and financial data"""
     
-    def __init__(self):
+    def __init__(self, streaming=None, streaming_threshold=STREAMING_THRESHOLD_BYTES):
         self.logger = logging.getLogger(__name__)
+        # None picks streaming mode automatically based on file size
+        self.streaming = streaming
+        self.streaming_threshold = streaming_threshold
     
     def process_excel(self, file_path):
         """
@@ -15,25 +61,118 @@ class ExcelProcessor:
         Returns structured data with line items, previous values, and estimates
         """
         try:
-            # Load workbook with openpyxl to handle formatting
-            workbook = load_workbook(file_path, data_only=True)
-            
-            # Try to find the most relevant worksheet
-            worksheet = self._find_financial_worksheet(workbook)
-            
-            # Convert to pandas DataFrame for easier processing
-            df = pd.DataFrame(worksheet.values)
-            
-            # Extract financial data
-            financial_data = self._extract_financial_data(df)
+            with metrics.stage('excel_processing') as stage:
+                stage.record(bytes=os.path.getsize(file_path))
+                if self._use_streaming(file_path):
+                    financial_data = self._process_excel_streaming(file_path)
+                else:
+                    # Load workbook with openpyxl to handle formatting
+                    workbook = load_workbook(file_path, data_only=True)
+                
+                    # Try to find the most relevant worksheet
+                    worksheet = self._find_financial_worksheet(workbook)
+                
+                    # Convert to pandas DataFrame for easier processing
+                    df = pd.DataFrame(worksheet.values)
+                
+                    # Extract financial data
+                    financial_data = self._extract_financial_data(df)
             
-            self.logger.info(f"Successfully processed Excel file: {file_path}")
-            return financial_data
+                stage.record(rows=financial_data['metadata'].get('total_rows'))
+                
+                self.logger.info(f"Successfully processed Excel file: {file_path}")
+                return financial_data
             
         except Exception as e:
             self.logger.error(f"Error processing Excel file {file_path}: {str(e)}")
             raise Exception(f"Failed to process Excel file: {str(e)}")
     
+    def _use_streaming(self, file_path):
+        """Decide whether to use the read-only streaming loader for a workbook"""
+        if self.streaming is not None:
+            return self.streaming
+        return os.path.getsize(file_path) >= self.streaming_threshold
+    
+    def _process_excel_streaming(self, file_path):
+        """
+        Extract financial data from a workbook opened in read-only mode
+        Only the selected sheet is parsed, rows are read lazily, and only the header row,
+        metric rows and a small buffer of generic rows are kept in memory
+        """
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            worksheet = self._find_financial_worksheet(workbook)
+            kept_rows, rows_scanned, max_width, stop_reason = self._scan_worksheet_rows(worksheet)
+            total_rows = worksheet.max_row or rows_scanned
+            total_columns = worksheet.max_column or max_width
+        finally:
+            workbook.close()
+        
+        financial_data = self._extract_financial_data(pd.DataFrame(kept_rows))
+        financial_data['metadata'].update({
+            'total_rows': total_rows,
+            'total_columns': total_columns,
+            'rows_scanned': rows_scanned,
+            'scan_stopped': stop_reason,
+            'truncated': stop_reason == 'row_limit',
+            'streamed': True
+        })
+        return financial_data
+    
+    def _scan_worksheet_rows(self, worksheet):
+        """
+        Lazily scan worksheet rows, keeping only those the extraction needs
+        Stops once the header row has been found, every metric group has a row and no further
+        metric row has appeared for STREAMING_METRIC_GAP_ROWS rows, or at STREAMING_MAX_ROWS
+        Returns the kept rows (in sheet order), the number of rows scanned, the widest row and
+        why the scan stopped early ('metrics_found' or 'row_limit'; None if it read the whole sheet)
+        """
+        kept_rows = []
+        header_found = False
+        groups_found = set()
+        generic_rows = 0
+        rows_scanned = 0
+        last_metric_row = 0
+        max_width = 0
+        
+        for row in worksheet.iter_rows(values_only=True):
+            if rows_scanned >= STREAMING_MAX_ROWS:
+                self.logger.warning(f"Stopped streaming scan after {STREAMING_MAX_ROWS} rows; later rows were not extracted")
+                return kept_rows, rows_scanned, max_width, 'row_limit'
+            if (header_found and len(groups_found) == len(KEY_METRIC_GROUPS)
+                    and rows_scanned - last_metric_row >= STREAMING_METRIC_GAP_ROWS):
+                return kept_rows, rows_scanned, max_width, 'metrics_found'
+            rows_scanned += 1
+            max_width = max(max_width, len(row))
+            
+            if not header_found and self._is_header_row(row):
+                kept_rows.append(row)
+                header_found = True
+                continue
+            
+            line_item_name = str(row[0]).strip() if row and row[0] is not None else ''
+            if not line_item_name:
+                continue
+            
+            matched_metrics = METRIC_PATTERN.findall(line_item_name.lower())
+            if matched_metrics:
+                kept_rows.append(row)
+                groups_found.update(METRIC_GROUP_INDEX[metric] for metric in matched_metrics)
+                last_metric_row = rows_scanned
+            elif generic_rows < STREAMING_GENERIC_ROWS:
+                kept_rows.append(row)
+                generic_rows += 1
+        
+        return kept_rows, rows_scanned, max_width, None
+    
+    def _is_header_row(self, row):
+        """Check whether a single row of cell values looks like the header row"""
+        return any(
+            HEADER_PATTERN.search(str(cell).lower())
+            for cell in row
+            if cell is not None
+        )
+    
     def _find_financial_worksheet(self, workbook):
         """Find the most relevant worksheet containing financial data"""
         # Common worksheet names for financial data
@@ -57,17 +196,6 @@ class ExcelProcessor:
             }
         }
         
-        # Common financial line items to look for
-        key_metrics = [
-            'revenue', 'net revenue', 'total revenue', 'sales',
-            'gross profit', 'gross margin',
-            'ebitda', 'adjusted ebitda', 'operating income',
-            'net income', 'net earnings',
-            'eps', 'earnings per share', 'diluted eps',
-            'free cash flow', 'operating cash flow',
-            'total assets', 'total debt', 'shareholders equity'
-        ]
-        
         try:
             # Find header row (usually contains 'metric', 'line item', or period indicators)
             header_row_idx = self._find_header_row(df)
@@ -77,18 +205,17 @@ class ExcelProcessor:
                 df.columns = df.iloc[header_row_idx]
                 df = df.drop(df.index[header_row_idx]).reset_index(drop=True)
             
-            # Process each row to find financial metrics
-            for idx, row in df.iterrows():
-                if pd.isna(row.iloc[0]) or str(row.iloc[0]).strip() == '':
-                    continue
-                
-                line_item_name = str(row.iloc[0]).strip()
-                
-                # Check if this row contains a key financial metric
-                if self._is_financial_metric(line_item_name, key_metrics):
-                    line_item_data = self._extract_line_item_data(row, line_item_name)
-                    if line_item_data:
-                        financial_data['line_items'].append(line_item_data)
+            # Match all line item names against the metric pattern at once, then
+            # coerce the values of the matching rows in a single vectorized pass
+            line_item_names, has_name = self._line_item_names(df)
+            is_metric = line_item_names.str.lower().str.contains(METRIC_PATTERN).to_numpy(dtype=bool)
+            metric_rows = np.flatnonzero(has_name & is_metric)
+            numeric_values = self._coerce_numeric(df.iloc[metric_rows])
+            
+            for row_values, row_idx in zip(numeric_values, metric_rows):
+                line_item_data = self._build_line_item(line_item_names.iloc[row_idx], row_values, min_values=2)
+                if line_item_data:
+                    financial_data['line_items'].append(line_item_data)
             
             # If no specific metrics found, extract first few numeric rows
             if not financial_data['line_items']:
@@ -102,45 +229,65 @@ class ExcelProcessor:
     
     def _find_header_row(self, df):
         """Find the row that likely contains column headers"""
-        for idx, row in df.iterrows():
-            # Look for rows containing period indicators or common headers
-            row_str = ' '.join([str(cell).lower() for cell in row if pd.notna(cell)])
-            if any(indicator in row_str for indicator in ['q1', 'q2', 'q3', 'q4', '2024', '2025', 'previous', 'estimate', 'actual']):
-                return idx
+        # Scan in blocks so the search stops early when the header is near the top
+        for block_start in range(0, len(df), SCAN_BLOCK_ROWS):
+            block = df.iloc[block_start:block_start + SCAN_BLOCK_ROWS]
+            cell_text = block.astype(str).apply(lambda column: column.str.lower())
+            matches = cell_text.apply(lambda column: column.str.contains(HEADER_PATTERN)) & block.notna()
+            matching_rows = np.flatnonzero(matches.any(axis=1).to_numpy(dtype=bool))
+            if len(matching_rows):
+                return block_start + int(matching_rows[0])
         return None
     
-    def _is_financial_metric(self, line_item_name, key_metrics):
-        """Check if a line item name matches known financial metrics"""
-        line_item_lower = line_item_name.lower()
-        return any(metric in line_item_lower for metric in key_metrics)
+    def _line_item_names(self, df):
+        """Return stripped line item names from column 0 and a mask of rows that have one"""
+        if df.empty:
+            return pd.Series([], dtype=object), np.zeros(0, dtype=bool)
+        
+        first_column = df.iloc[:, 0]
+        names = first_column.astype(str).str.strip()
+        has_name = (first_column.notna() & (names != '')).to_numpy(dtype=bool)
+        return names, has_name
     
-    def _extract_line_item_data(self, row, line_item_name):
-        """Extract numeric data for a specific line item"""
-        try:
-            # Get all numeric values from the row (excluding the first column which is the name)
-            numeric_values = []
-            for value in row.iloc[1:]:
-                if pd.notna(value) and str(value).strip() != '':
-                    try:
-                        # Try to convert to float, handling common formats
-                        cleaned_value = str(value).replace(',', '').replace('$', '').replace('(', '-').replace(')', '')
-                        numeric_val = float(cleaned_value)
-                        numeric_values.append(numeric_val)
-                    except (ValueError, TypeError):
-                        continue
-            
-            if len(numeric_values) >= 2:
-                return {
-                    'line_item': line_item_name,
-                    'previous_value': numeric_values[0] if len(numeric_values) > 0 else None,
-                    'estimate': numeric_values[1] if len(numeric_values) > 1 else None,
-                    'actual': None,  # Placeholder for actual values
-                    'all_values': numeric_values
-                }
-        except Exception as e:
-            self.logger.warning(f"Error extracting data for {line_item_name}: {str(e)}")
+    def _coerce_numeric(self, df):
+        """
+        Convert all value cells (every column after the first) to floats in one vectorized pass
+        Handles $, thousands separators and parenthesized negatives; non-numeric cells become NaN
+        Accepts what float() accepts, except that "nan" text is treated as an empty cell
+        Returns a 2D numpy array aligned with the DataFrame rows
+        """
+        values = df.iloc[:, 1:]
+        if values.empty:
+            return np.empty((len(df), 0))
         
-        return None
+        cells = pd.Series(values.to_numpy(dtype=object).ravel(), dtype=object)
+        cleaned = cells.astype(str).str.translate(NUMBER_TRANSLATION)
+        numeric = pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype=float, copy=True)
+        
+        # pd.to_numeric rejects some text float() reads, e.g. "1_000" or non-ASCII digits; retry only those cells
+        rejected = np.flatnonzero(np.isnan(numeric) & cells.notna().to_numpy(dtype=bool) & (cleaned.str.strip() != '').to_numpy(dtype=bool))
+        for index in rejected:
+            try:
+                value = float(cleaned.iloc[index])
+            except ValueError:
+                continue
+            numeric[index] = value
+        return numeric.reshape(values.shape)
+    
+    def _build_line_item(self, line_item_name, row_values, min_values=2):
+        """Build a line item from a row of coerced values if it has enough numeric data"""
+        numeric_values = row_values[~np.isnan(row_values)].tolist()
+        
+        if len(numeric_values) < min_values:
+            return None
+        
+        return {
+            'line_item': line_item_name,
+            'previous_value': numeric_values[0] if len(numeric_values) > 0 else None,
+            'estimate': numeric_values[1] if len(numeric_values) > 1 else numeric_values[0],
+            'actual': None,  # Placeholder for actual values
+            'all_values': numeric_values
+        }
     
     def _extract_generic_data(self, df):
         """Extract data using a generic approach when specific metrics aren't found"""
@@ -148,36 +295,19 @@ class ExcelProcessor:
         
         try:
             # Take first 20 rows that have both text and numeric data
-            count = 0
-            for idx, row in df.iterrows():
-                if count >= 20:
-                    break
-                
-                if pd.isna(row.iloc[0]) or str(row.iloc[0]).strip() == '':
-                    continue
-                
-                line_item_name = str(row.iloc[0]).strip()
-                numeric_values = []
-                
-                # Extract numeric values
-                for value in row.iloc[1:]:
-                    if pd.notna(value):
-                        try:
-                            cleaned_value = str(value).replace(',', '').replace('$', '').replace('(', '-').replace(')', '')
-                            numeric_val = float(cleaned_value)
-                            numeric_values.append(numeric_val)
-                        except (ValueError, TypeError):
-                            continue
+            line_item_names, has_name = self._line_item_names(df)
+            named_rows = np.flatnonzero(has_name)
+            
+            for block_start in range(0, len(named_rows), SCAN_BLOCK_ROWS):
+                block_rows = named_rows[block_start:block_start + SCAN_BLOCK_ROWS]
+                numeric_values = self._coerce_numeric(df.iloc[block_rows])
                 
-                if len(numeric_values) >= 1:
-                    line_items.append({
-                        'line_item': line_item_name,
-                        'previous_value': numeric_values[0] if len(numeric_values) > 0 else None,
-                        'estimate': numeric_values[1] if len(numeric_values) > 1 else numeric_values[0],
-                        'actual': None,
-                        'all_values': numeric_values
-                    })
-                    count += 1
+                for row_values, row_idx in zip(numeric_values, block_rows):
+                    line_item_data = self._build_line_item(line_item_names.iloc[row_idx], row_values, min_values=1)
+                    if line_item_data:
+                        line_items.append(line_item_data)
+                        if len(line_items) >= 20:
+                            return line_items
         
         except Exception as e:
             self.logger.error(f"Error in generic data extraction: {str(e)}")
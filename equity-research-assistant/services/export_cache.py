@@ -0,0 +1,126 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import time
+from flask import current_app
+
+# Bump when exporter output changes so previously cached files are not served
+EXPORT_VERSION = 2
+
+# Eviction scans every cached file, so each process runs it at most this often
+EVICT_INTERVAL_SECONDS = 60
+
+# Temporary export folders older than this are leftovers from interrupted exports
+STALE_WORK_FOLDER_SECONDS = 3600
+
+_last_evicted_at = 0.0
+
+class ExportCache:
+    """Disk cache of exported report files, keyed on the report HTML and export format"""
+
+    def __init__(self, download_folder=None, max_age_seconds=None, max_bytes=None):
+        self.logger = logging.getLogger(__name__)
+        config = current_app.config
+        # Absolute, because send_file resolves relative paths against the app folder rather than the working directory
+        self.cache_folder = os.path.abspath(os.path.join(download_folder or config['DOWNLOAD_FOLDER'], 'exports'))
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else config['EXPORT_CACHE_MAX_AGE_SECONDS']
+        self.max_bytes = max_bytes if max_bytes is not None else config['EXPORT_CACHE_MAX_BYTES']
+
+    @staticmethod
+    def make_key(report_html, export_format):
+        """Build the cache key (also used as the ETag) for a report export"""
+        digest = hashlib.sha256(f"{EXPORT_VERSION}:{export_format}:".encode('utf-8'))
+        digest.update(report_html.encode('utf-8'))
+        return digest.hexdigest()
+
+    def cache_path(self, cache_key, export_format):
+        """Path of the cached export for a key (sharded on the first two hex digits)"""
+        return os.path.join(self.cache_folder, cache_key[:2], f"{cache_key}.{export_format}")
+
+    def get_or_export(self, report_html, export_format, exporter):
+        """
+        Return the cached export for the report, calling exporter(folder) to create it on a miss
+        exporter must write the file into the given folder and return its path
+        Returns (file path, cache key)
+        """
+        cache_key = self.make_key(report_html, export_format)
+        cached_path = self.cache_path(cache_key, export_format)
+
+        if os.path.exists(cached_path):
+            # Refresh the modification time so eviction treats it as recently used
+            os.utime(cached_path)
+            self.logger.debug(f"Export cache hit for {export_format} {cache_key[:12]}")
+            return cached_path, cache_key
+
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        work_folder = tempfile.mkdtemp(dir=self.cache_folder, prefix='.export-')
+        try:
+            exported_path = exporter(work_folder)
+            os.replace(exported_path, cached_path)
+        finally:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+        self.evict_if_due()
+        return cached_path, cache_key
+
+    def iter_entries(self):
+        """Yield os.DirEntry objects for every cached export, including ones from the old flat layout"""
+        if not os.path.isdir(self.cache_folder):
+            return
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_file():
+                yield entry
+            elif entry.is_dir():
+                yield from (shard_entry for shard_entry in os.scandir(entry.path) if shard_entry.is_file())
+
+    def remove_stale_work_folders(self, max_age_seconds=STALE_WORK_FOLDER_SECONDS):
+        """Delete temporary export folders left behind by interrupted exports"""
+        if not os.path.isdir(self.cache_folder):
+            return 0
+
+        removed = 0
+        cutoff = time.time() - max_age_seconds
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.startswith('.export-') and entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def evict_if_due(self):
+        """Run evict() unless this process already did so within EVICT_INTERVAL_SECONDS"""
+        global _last_evicted_at
+        now = time.monotonic()
+        if now - _last_evicted_at < EVICT_INTERVAL_SECONDS:
+            return 0
+        _last_evicted_at = now
+        return self.evict()
+
+    def evict(self):
+        """Remove exports older than the maximum age, then least recently used ones over the size limit"""
+        entries = []
+        for entry in self.iter_entries():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        now = time.time()
+        total_bytes = sum(size for _, size, _ in entries)
+        evicted = 0
+
+        for modified_at, size, path in sorted(entries):
+            expired = self.max_age_seconds and now - modified_at > self.max_age_seconds
+            if not expired and total_bytes <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            evicted += 1
+
+        if evicted:
+            self.logger.info(f"Evicted {evicted} cached report export(s)")
+        return evicted
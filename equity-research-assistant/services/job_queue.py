@@ -0,0 +1,389 @@
+import os
+import json
+import socket
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from models import AnalysisJob, ResearchSession
+from services.pdf_processor import PDFProcessor
+from services.llm_analyzer import LLMAnalyzer
+from services.artifact_store import ArtifactStore
+from services.metrics import metrics
+from services.single_flight import single_flight
+
+
+def analyze_session_transcript(research_session, on_stage=None, on_progress=None, on_partial=None):
+    """
+    Extract the session transcript and analyze it with the LLM, storing the result on the session
+    Text and sections already extracted from an identical upload are reused
+    on_stage is called with 'extract_transcript' and then 'analyze_transcript'
+    """
+    if on_stage:
+        on_stage('extract_transcript')
+
+    artifact_store = ArtifactStore()
+    pdf_path = artifact_store.resolve_path(research_session.pdf_hash, research_session.pdf_filename)
+    pdf_processor = PDFProcessor(workers=current_app.config['PDF_EXTRACT_WORKERS'])
+    transcript_text = artifact_store.get_or_build(
+        research_session.pdf_hash,
+        'transcript_text',
+        lambda: pdf_processor.extract_text(pdf_path)
+    )
+    transcript_sections = artifact_store.get_or_build(
+        research_session.pdf_hash,
+        'transcript_sections',
+        lambda: pdf_processor.extract_sections(transcript_text)
+    )
+
+    if on_stage:
+        on_stage('analyze_transcript')
+
+    llm_analyzer = LLMAnalyzer()
+    analysis = llm_analyzer.analyze_transcript(
+        transcript_text,
+        research_session.company_name,
+        research_session.quarter,
+        sections=transcript_sections,
+        on_progress=on_progress,
+        on_partial=on_partial
+    )
+
+    research_session.set_transcript_analysis(analysis)
+    db.session.commit()
+    return analysis
+
+
+def run_transcript_analysis(job, report_progress):
+    """
+    Extract the session transcript and analyze it with the LLM
+    A job for a session whose analysis is already running elsewhere waits for that run instead
+    """
+    research_session = ResearchSession.query.filter_by(session_id=job.session_id).first()
+    if not research_session:
+        raise Exception("Research session no longer exists")
+
+    if research_session.get_transcript_analysis():
+        return
+
+    def stored_analysis():
+        db.session.refresh(research_session, ['transcript_analysis'])
+        return research_session.get_transcript_analysis()
+
+    single_flight.run(
+        f"session_analysis:{job.session_id}",
+        lambda: _analyze_for_job(job, research_session, report_progress),
+        lookup=stored_analysis
+    )
+
+
+def _analyze_for_job(job, research_session, report_progress):
+    """Run the analysis for a job, reporting progress and streamed fields to the step 2 page"""
+    def stage_progress(stage):
+        if stage == 'extract_transcript':
+            report_progress(10, 'Extracting transcript text')
+        else:
+            report_progress(40, 'Analyzing transcript with AI')
+
+    def chunk_progress(completed, total):
+        report_progress(40 + int(55 * completed / total), f'Analyzed {completed} of {total} transcript sections')
+
+    # Publish streamed fields for the step 2 page, throttled to limit database writes
+    job_queue = JobQueue()
+    flush_interval = current_app.config['JOB_PARTIAL_FLUSH_SECONDS']
+    last_flush = [0.0]
+
+    def publish_partial(fields):
+        now = time.monotonic()
+        if now - last_flush[0] < flush_interval:
+            return
+        last_flush[0] = now
+        job_queue.update_partial(job.id, fields)
+
+    return analyze_session_transcript(
+        research_session,
+        on_stage=stage_progress,
+        on_progress=chunk_progress,
+        on_partial=publish_partial
+    )
+
+
+# Registered job handlers, keyed on AnalysisJob.job_type
+JOB_HANDLERS = {
+    'transcript_analysis': run_transcript_analysis
+}
+
+
+class JobQueue:
+    """Database-backed queue for long-running analysis jobs (no external broker needed)"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def enqueue(self, session_id, job_type='transcript_analysis'):
+        """
+        Queue a job for a research session
+        Returns the already active job for the session if there is one, including one queued
+        concurrently by another request (e.g. a double-clicked approve or a refreshed page)
+        """
+        job = self.get_active_job(session_id, job_type)
+        if job:
+            return job
+
+        return single_flight.run(
+            f"enqueue:{session_id}:{job_type}",
+            lambda: self._insert_job(session_id, job_type),
+            lookup=lambda: self.get_active_job(session_id, job_type)
+        )
+
+    def _insert_job(self, session_id, job_type):
+        job = AnalysisJob(
+            session_id=session_id,
+            job_type=job_type,
+            status='queued',
+            progress=0,
+            message='Waiting for an available worker'
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.logger.info(f"Queued {job_type} job {job.id} for session {session_id}")
+        return job
+
+    def get_active_job(self, session_id, job_type='transcript_analysis'):
+        """Get the queued or running job for a session, if any"""
+        return AnalysisJob.query.filter(
+            AnalysisJob.session_id == session_id,
+            AnalysisJob.job_type == job_type,
+            AnalysisJob.status.in_(('queued', 'running'))
+        ).order_by(AnalysisJob.id.desc()).first()
+
+    def get_latest_job(self, session_id, job_type='transcript_analysis'):
+        """Get the most recent job for a session regardless of status"""
+        return AnalysisJob.query.filter_by(
+            session_id=session_id,
+            job_type=job_type
+        ).order_by(AnalysisJob.id.desc()).first()
+
+    def cancel_jobs(self, session_id):
+        """Remove all jobs that have not been picked up yet for a session"""
+        AnalysisJob.query.filter_by(session_id=session_id, status='queued').delete()
+        db.session.commit()
+
+    def claim_next(self, worker_id):
+        """
+        Atomically claim the oldest queued job
+        Returns the claimed job or None when the queue is empty
+        """
+        while True:
+            job = AnalysisJob.query.filter_by(status='queued').order_by(AnalysisJob.id).first()
+            if not job:
+                return None
+
+            # Conditional UPDATE so concurrent workers (threads or processes) never claim the same job
+            claimed = AnalysisJob.query.filter_by(id=job.id, status='queued').update({
+                'status': 'running',
+                'worker_id': worker_id,
+                'started_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow(),
+                'attempts': AnalysisJob.attempts + 1,
+                'message': 'Starting analysis'
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed:
+                db.session.refresh(job)
+                return job
+
+    def update_progress(self, job_id, progress, message=None):
+        """Record job progress; also acts as the worker heartbeat"""
+        AnalysisJob.query.filter_by(id=job_id).update({
+            'progress': progress,
+            'message': message,
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def update_partial(self, job_id, fields):
+        """Record the analysis fields streamed so far; also acts as the worker heartbeat"""
+        AnalysisJob.query.filter_by(id=job_id).update({
+            'partial_result': json.dumps(fields),
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def complete(self, job_id):
+        """Mark a job as successfully completed"""
+        AnalysisJob.query.filter_by(id=job_id).update({
+            'status': 'completed',
+            'progress': 100,
+            'message': 'Analysis complete',
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def fail(self, job_id, error):
+        """Mark a job as failed with the given error message"""
+        AnalysisJob.query.filter_by(id=job_id).update({
+            'status': 'failed',
+            'message': 'Analysis failed',
+            'error': error,
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def requeue_stale(self, stale_seconds, max_attempts):
+        """Requeue running jobs whose worker stopped sending heartbeats"""
+        cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+        stale_jobs = AnalysisJob.query.filter(
+            AnalysisJob.status == 'running',
+            AnalysisJob.updated_at < cutoff
+        ).all()
+
+        for job in stale_jobs:
+            if (job.attempts or 0) >= max_attempts:
+                job.status = 'failed'
+                job.error = 'Worker stopped responding'
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = 'queued'
+                job.message = 'Retrying after worker timeout'
+            self.logger.warning(f"Recovered stale job {job.id} from worker {job.worker_id}")
+
+        if stale_jobs:
+            db.session.commit()
+        return len(stale_jobs)
+
+    def run_next_job(self, worker_id):
+        """
+        Claim and execute a single job
+        Returns True if a job was processed, False if the queue was empty
+        """
+        job = self.claim_next(worker_id)
+        if not job:
+            return False
+
+        handler = JOB_HANDLERS.get(job.job_type)
+        if not handler:
+            self.fail(job.id, f"Unknown job type: {job.job_type}")
+            return True
+
+        def report_progress(progress, message=None):
+            self.update_progress(job.id, progress, message)
+
+        try:
+            self.logger.info(f"Worker {worker_id} started job {job.id} ({job.job_type})")
+            with metrics.bind_route(f"job:{job.job_type}"):
+                handler(job, report_progress)
+            self.complete(job.id)
+            self.logger.info(f"Worker {worker_id} completed job {job.id}")
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Job {job.id} failed: {str(e)}")
+            self.fail(job.id, str(e))
+
+        return True
+
+
+class JobWorkerPool:
+    """Pool of worker threads that execute queued jobs"""
+
+    def __init__(self, app, num_workers=2, poll_interval=1.0, stale_seconds=600, max_attempts=3):
+        self.logger = logging.getLogger(__name__)
+        self.app = app
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.queue = JobQueue()
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._last_sweep = 0.0
+
+    @classmethod
+    def from_config(cls, app, num_workers=None):
+        """Build a worker pool using the job settings in the app config"""
+        return cls(
+            app,
+            num_workers=num_workers if num_workers is not None else app.config['JOB_INLINE_WORKERS'],
+            poll_interval=app.config['JOB_POLL_INTERVAL'],
+            stale_seconds=app.config['JOB_STALE_SECONDS'],
+            max_attempts=app.config['JOB_MAX_ATTEMPTS']
+        )
+
+    def start(self):
+        """Start the worker threads"""
+        self._stop_event.clear()
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{base_id}:{i}",),
+                name=f"job-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(f"Started {self.num_workers} job worker(s) in process {os.getpid()}")
+
+    def stop(self, timeout=None):
+        """Signal the worker threads to stop and wait for them"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self):
+        """Start the workers and block until interrupted"""
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.logger.info("Stopping job workers")
+            self.stop()
+
+    def _worker_loop(self, worker_id):
+        """Poll the queue and run jobs until stopped"""
+        while not self._stop_event.is_set():
+            processed = False
+            try:
+                with self.app.app_context():
+                    self._maybe_requeue_stale()
+                    processed = self.queue.run_next_job(worker_id)
+            except Exception as e:
+                self.logger.error(f"Job worker {worker_id} error: {str(e)}")
+
+            if not processed:
+                self._stop_event.wait(self.poll_interval)
+
+    def _maybe_requeue_stale(self):
+        """Periodically recover jobs abandoned by crashed workers"""
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        self.queue.requeue_stale(self.stale_seconds, self.max_attempts)
+
+
+_inline_pool = None
+_inline_pool_pid = None
+_inline_pool_lock = threading.Lock()
+
+
+def ensure_inline_workers(app):
+    """Start the in-process worker pool for this process if it is enabled and not running"""
+    global _inline_pool, _inline_pool_pid
+
+    if app.config.get('JOB_INLINE_WORKERS', 0) <= 0:
+        return None
+
+    with _inline_pool_lock:
+        # Threads do not survive a fork, so each gunicorn worker starts its own pool
+        if _inline_pool is None or _inline_pool_pid != os.getpid():
+            _inline_pool = JobWorkerPool.from_config(app)
+            _inline_pool.start()
+            _inline_pool_pid = os.getpid()
+        return _inline_pool
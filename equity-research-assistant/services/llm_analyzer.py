@@ -1,56 +1,117 @@
 import json
 import os
-from openai import OpenAI
+import asyncio
 import logging
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import current_app, has_app_context
 from models import PromptTemplate
+from services.llm_cache import LLMResponseCache
+from services.transcript_chunker import TranscriptChunker
+from services.partial_json import PartialJSONObjectParser
+from services.metrics import metrics
+from services.llm_backends import llm_backends
+from services.llm_limiter import llm_limiter
+from services.single_flight import single_flight
+
+TRANSCRIPT_SYSTEM_MESSAGE = "You are a professional equity research analyst with expertise in financial analysis and earnings call interpretation. Provide detailed, actionable insights."
+
+# Process-wide clients so HTTP keep-alive connections are pooled across requests
+_client_lock = threading.Lock()
+_shared_client = None
+_shared_client_pid = None
+_async_loop = None
+_async_client = None
+_async_pid = None
+
+
+def get_openai_client():
+    """Return the shared chat completions client of the configured LLM backend for this process"""
+    global _shared_client, _shared_client_pid
+
+    with _client_lock:
+        # Pooled connections must not be shared with forked worker processes
+        if _shared_client is None or _shared_client_pid != os.getpid():
+            _shared_client = llm_backends.create_client()
+            _shared_client_pid = os.getpid()
+        return _shared_client
+
+
+def get_async_runtime():
+    """
+    Return the background event loop and the async client of the LLM backend bound to it
+    Both are created on first use and live for the lifetime of the process
+    """
+    global _async_loop, _async_client, _async_pid
+
+    with _client_lock:
+        if _async_loop is None or _async_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='llm-event-loop', daemon=True)
+            thread.start()
+            _async_loop = loop
+            _async_client = llm_backends.create_async_client()
+            _async_pid = os.getpid()
+        return _async_loop, _async_client
 
 class LLMAnalyzer:
     """Service to analyze earnings transcripts using OpenAI's GPT models"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.openai_client = get_openai_client()
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+        # do not change this unless explicitly requested by the user
+        self.model = self._get_config('LLM_MODEL', "gpt-4o")
+        self.chunk_tokens = self._get_config('LLM_CHUNK_TOKENS', 4000)
+        self.max_parallel_calls = self._get_config('LLM_MAX_PARALLEL_CALLS', 4)
     
-    def analyze_transcript(self, transcript_text, company_name, quarter):
+    def analyze_transcript(self, transcript_text, company_name, quarter, sections=None, on_progress=None, on_partial=None):
         """
         Analyze earnings transcript to extract key insights
+        Long transcripts are split into section-aware chunks that are analyzed
+        concurrently and merged back into a single analysis
+        on_partial, if given, receives the analysis fields parsed so far as the response streams in
         Returns structured analysis data
         """
         try:
-            # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            # do not change this unless explicitly requested by the user
+            with metrics.stage('transcript_analysis') as stage:
+                stage.record(bytes=len(transcript_text.encode('utf-8')))
+                # Get custom prompt (cached in memory) or use default
+                formatted_template = PromptTemplate.get_formatted_prompt('transcript_analysis', company_name=company_name, quarter=quarter)
             
-            # Get custom prompt from database or use default
-            prompt_template = PromptTemplate.get_prompt('transcript_analysis')
+                chunker = TranscriptChunker(max_tokens=self.chunk_tokens, model=self.model)
             
-            prompt = f"""
-            {prompt_template.format(company_name=company_name, quarter=quarter)}
+                if chunker.count_tokens(transcript_text) <= self.chunk_tokens:
+                    prompt = f"""
+                    {formatted_template}
 
-            Transcript:
-            {transcript_text[:15000]}  # Limit text to stay within token limits
-            """
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional equity research analyst with expertise in financial analysis and earnings call interpretation. Provide detailed, actionable insights."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=2000,
-                temperature=0.3
-            )
+                    Transcript:
+                    {transcript_text}
+                    """
+                    on_delta = None
+                    if on_partial:
+                        partial_parser = PartialJSONObjectParser()
+                        on_delta = lambda delta: on_partial(partial_parser.feed(delta))
+                
+                    analysis = json.loads(self._chat_completion(
+                        system_message=TRANSCRIPT_SYSTEM_MESSAGE,
+                        prompt=prompt,
+                        max_tokens=2000,
+                        temperature=0.3,
+                        response_format={"type": "json_object"},
+                        on_delta=on_delta
+                    ))
+                    if on_progress:
+                        on_progress(1, 1)
+                else:
+                    chunks = chunker.chunk(transcript_text, sections=sections)
+                    analysis = self._map_reduce_transcript(formatted_template, chunks, on_progress, on_partial)
             
-            analysis = json.loads(response.choices[0].message.content)
-            
-            self.logger.info(f"Successfully analyzed transcript for {company_name} {quarter}")
-            return analysis
+                self.logger.info(f"Successfully analyzed transcript for {company_name} {quarter}")
+                return analysis
             
         except json.JSONDecodeError as e:
             self.logger.error(f"Error parsing LLM response as JSON: {str(e)}")
@@ -64,36 +125,10 @@ class LLMAnalyzer:
         Generate executive summary combining financial data and transcript insights
         """
         try:
-            # Get custom prompt from database or use default
-            prompt_template = PromptTemplate.get_prompt('executive_summary')
-            
-            prompt = f"""
-            {prompt_template.format(company_name=company_name, quarter=quarter)}
-            
-            Financial Data Summary:
-            {self._format_financial_data_for_prompt(financial_data)}
-            
-            Transcript Analysis:
-            {json.dumps(transcript_analysis, indent=2)}
-            """
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a senior equity research analyst writing for institutional investors."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=800,
-                temperature=0.3
-            )
-            
-            return response.choices[0].message.content
+            with metrics.stage('executive_summary'):
+                return self._chat_completion(
+                    **self._executive_summary_request(financial_data, transcript_analysis, company_name, quarter)
+                )
             
         except Exception as e:
             self.logger.error(f"Error generating executive summary: {str(e)}")
@@ -104,37 +139,12 @@ class LLMAnalyzer:
         Generate enhanced risk analysis based on transcript and financial data
         """
         try:
-            # Get custom prompt from database or use default
-            prompt_template = PromptTemplate.get_prompt('risk_analysis')
-            
-            prompt = f"""
-            {prompt_template}
-            
-            Transcript Analysis:
-            {json.dumps(transcript_analysis, indent=2)}
-            
-            Financial Metrics:
-            {self._format_financial_data_for_prompt(financial_data)}
-            """
+            with metrics.stage('risk_analysis'):
+                response_text = self._chat_completion(
+                    **self._risk_analysis_request(transcript_analysis, financial_data)
+                )
             
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a risk assessment specialist in equity research."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=1000,
-                temperature=0.3
-            )
-            
-            return json.loads(response.choices[0].message.content)
+                return json.loads(response_text)
             
         except Exception as e:
             self.logger.error(f"Error generating risk analysis: {str(e)}")
@@ -145,6 +155,308 @@ class LLMAnalyzer:
                 "overall_risk_rating": "Unable to determine"
             }
     
+    def _executive_summary_request(self, financial_data, transcript_analysis, company_name, quarter):
+        """Build the chat completion arguments for the executive summary"""
+        # Get custom prompt (cached in memory) or use default
+        prompt_template = PromptTemplate.get_formatted_prompt('executive_summary', company_name=company_name, quarter=quarter)
+        
+        prompt = f"""
+            {prompt_template}
+            
+            Financial Data Summary:
+            {self._format_financial_data_for_prompt(financial_data)}
+            
+            Transcript Analysis:
+            {json.dumps(transcript_analysis, indent=2)}
+            """
+        
+        return {
+            "system_message": "You are a senior equity research analyst writing for institutional investors.",
+            "prompt": prompt,
+            "max_tokens": 800,
+            "temperature": 0.3
+        }
+    
+    def _risk_analysis_request(self, transcript_analysis, financial_data):
+        """Build the chat completion arguments for the risk analysis"""
+        # Get custom prompt (cached in memory) or use default
+        prompt_template = PromptTemplate.get_prompt('risk_analysis')
+        
+        prompt = f"""
+            {prompt_template}
+            
+            Transcript Analysis:
+            {json.dumps(transcript_analysis, indent=2)}
+            
+            Financial Metrics:
+            {self._format_financial_data_for_prompt(financial_data)}
+            """
+        
+        return {
+            "system_message": "You are a risk assessment specialist in equity research.",
+            "prompt": prompt,
+            "max_tokens": 1000,
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _map_reduce_transcript(self, formatted_template, chunks, on_progress=None, on_partial=None):
+        """
+        Analyze transcript chunks concurrently and merge them into one analysis
+        on_partial receives the merge of the chunks finished so far after each chunk completes
+        """
+        app = current_app._get_current_object()
+        total = len(chunks)
+        results = [None] * total
+        errors = []
+        
+        def analyze_chunk(index):
+            chunk = chunks[index]
+            prompt = f"""
+            {formatted_template}
+
+            This is part {index + 1} of {total} of the transcript, taken from the {chunk['label']}.
+            The other parts are analyzed separately and the results are combined, so analyze only this excerpt.
+            Use an empty string for any field this excerpt does not cover.
+
+            Transcript excerpt:
+            {chunk['text']}
+            """
+            # Worker threads need their own app context for prompt and cache lookups
+            with app.app_context():
+                return json.loads(self._chat_completion(
+                    system_message=TRANSCRIPT_SYSTEM_MESSAGE,
+                    prompt=prompt,
+                    max_tokens=2000,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                ))
+        
+        completed = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel_calls, total))) as executor:
+            # Copy the context so calls are attributed to the caller's stage and route
+            futures = {
+                executor.submit(contextvars.copy_context().run, analyze_chunk, index): index
+                for index in range(total)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    errors.append(str(e))
+                    self.logger.warning(f"Error analyzing transcript chunk {index + 1}/{total}: {str(e)}")
+                
+                completed += 1
+                if on_progress:
+                    on_progress(completed, total)
+                if on_partial and isinstance(results[index], dict):
+                    on_partial(self._merge_chunk_analyses([result for result in results if isinstance(result, dict)]))
+        
+        chunk_analyses = [result for result in results if isinstance(result, dict)]
+        if not chunk_analyses:
+            raise Exception(f"All {total} transcript chunks failed: {errors[0] if errors else 'no results'}")
+        if errors:
+            self.logger.warning(f"Merged transcript analysis from {len(chunk_analyses)} of {total} chunks")
+        
+        return self._merge_chunk_analyses(chunk_analyses)
+    
+    def _merge_chunk_analyses(self, chunk_analyses):
+        """Merge per-chunk analysis JSON into a single analysis with the same fields"""
+        values_by_key = {}
+        for analysis in chunk_analyses:
+            for key, value in analysis.items():
+                values_by_key.setdefault(key, []).append(value)
+        
+        return {key: self._merge_values(values) for key, values in values_by_key.items()}
+    
+    def _merge_values(self, values):
+        """Combine the values reported for one field across chunks, in transcript order"""
+        present = [value for value in values if value not in (None, '', [], {})]
+        if not present:
+            return values[0]
+        
+        if all(isinstance(value, str) for value in present):
+            unique_parts = list(dict.fromkeys(value.strip() for value in present))
+            return '\n\n'.join(unique_parts)
+        
+        if all(isinstance(value, list) for value in present):
+            merged_list = []
+            for value in present:
+                for item in value:
+                    if item not in merged_list:
+                        merged_list.append(item)
+            return merged_list
+        
+        if all(isinstance(value, dict) for value in present):
+            return self._merge_chunk_analyses(present)
+        
+        return present[0]
+    
+    def _chat_completion(self, system_message, prompt, max_tokens, temperature=0.3, response_format=None, on_delta=None):
+        """
+        Run a chat completion, serving identical requests from the response cache
+        Identical requests already in flight in any process are waited for rather than sent again
+        If on_delta is given the response is streamed and each text fragment is passed to it
+        Returns the response message content
+        """
+        cache, cache_key, cached_response = self._lookup_cache(
+            system_message, prompt, max_tokens, temperature, response_format
+        )
+        if cached_response is not None:
+            return self._serve_cached(cached_response, on_delta)
+        
+        request_kwargs = self._build_request(system_message, prompt, max_tokens, temperature, response_format)
+        call_api = lambda: self._call_api(request_kwargs, cache, cache_key, on_delta)
+        
+        # Followers read the leader's response from the cache, so coalescing needs a working cache
+        if cache is None or not cache.enabled:
+            return call_api()
+        
+        def lookup():
+            cached_response = self._get_cached(cache, cache_key)
+            return None if cached_response is None else self._serve_cached(cached_response, on_delta)
+        
+        return single_flight.run(f"llm:{cache_key}", call_api, lookup)
+    
+    def _serve_cached(self, cached_response, on_delta=None):
+        """Return a cached response, passing it to on_delta in one piece"""
+        metrics.observe_llm_call('cache')
+        if on_delta:
+            on_delta(cached_response)
+        return cached_response
+    
+    def _get_cached(self, cache, cache_key):
+        """Re-check the cache for a response after its initial miss; None if still missing or the cache fails"""
+        try:
+            return cache.get(cache_key, count_miss=False)
+        except Exception as e:
+            self.logger.warning(f"LLM cache lookup failed: {str(e)}")
+            return None
+    
+    def _call_api(self, request_kwargs, cache, cache_key, on_delta=None):
+        """Send a chat completion to the LLM backend under the rate limiter and cache the response"""
+        estimated_tokens = self._estimate_tokens(request_kwargs)
+        start = time.perf_counter()
+        try:
+            if on_delta:
+                # A stream can only be retried until its first fragment has been passed on
+                delivered = []
+                
+                def forward(delta):
+                    delivered.append(True)
+                    on_delta(delta)
+                
+                response_text, usage = llm_limiter.call(
+                    lambda: self._stream_completion(request_kwargs, forward),
+                    estimated_tokens,
+                    can_retry=lambda: not delivered
+                )
+            else:
+                response_text, usage = llm_limiter.call(
+                    lambda: self._create_completion(request_kwargs), estimated_tokens
+                )
+        except Exception:
+            metrics.observe_llm_call('error', time.perf_counter() - start)
+            raise
+        metrics.observe_llm_call('api', time.perf_counter() - start, usage)
+        
+        self._store_in_cache(cache, cache_key, response_text, request_kwargs.get('response_format'))
+        return response_text
+    
+    def _create_completion(self, request_kwargs):
+        """Run a chat completion; returns (response text, token usage)"""
+        response = self.openai_client.chat.completions.create(**request_kwargs)
+        return response.choices[0].message.content, response.usage
+    
+    def _estimate_tokens(self, request_kwargs):
+        """
+        Rough upper bound on the tokens a request uses, reserved from the rate limiter before the call
+        About four characters per token; the reservation is corrected with the real usage afterwards
+        """
+        prompt_characters = sum(len(message['content']) for message in request_kwargs['messages'])
+        return prompt_characters // 4 + request_kwargs.get('max_tokens', 0)
+    
+    def _stream_completion(self, request_kwargs, on_delta):
+        """Stream a chat completion, passing each content fragment to on_delta; returns (full text, token usage)"""
+        parts = []
+        usage = None
+        # Token usage arrives in a final chunk without choices
+        stream = self.openai_client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **request_kwargs
+        )
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        return ''.join(parts), usage
+    
+    def _build_request(self, system_message, prompt, max_tokens, temperature=0.3, response_format=None):
+        """Build the keyword arguments for a chat completions API call"""
+        request_kwargs = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if response_format:
+            request_kwargs["response_format"] = response_format
+        return request_kwargs
+    
+    def _lookup_cache(self, system_message, prompt, max_tokens, temperature=0.3, response_format=None):
+        """
+        Look up a request in the response cache
+        Returns (cache, cache_key, cached_response); cache is None if the cache is unavailable
+        """
+        cache_key = LLMResponseCache.make_key(
+            self.model, system_message, prompt, temperature, max_tokens, response_format
+        )
+        
+        try:
+            cache = LLMResponseCache()
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                self.logger.debug(f"LLM cache hit for {cache_key[:12]}")
+            return cache, cache_key, cached_response
+        except Exception as e:
+            self.logger.warning(f"LLM cache lookup failed, calling API directly: {str(e)}")
+            return None, cache_key, None
+    
+    def _store_in_cache(self, cache, cache_key, response_text, response_format=None):
+        """Store a fresh response in the cache if it is worth keeping"""
+        if cache is None or not self._is_cacheable(response_text, response_format):
+            return
+        
+        try:
+            cache.set(cache_key, self.model, response_text)
+        except Exception as e:
+            self.logger.warning(f"Failed to store LLM response in cache: {str(e)}")
+    
+    def _is_cacheable(self, response_text, response_format):
+        """Only cache non-empty responses that parse when JSON output was requested"""
+        if not response_text:
+            return False
+        if response_format and response_format.get("type") == "json_object":
+            try:
+                json.loads(response_text)
+            except json.JSONDecodeError:
+                return False
+        return True
+    
+    def _get_config(self, key, default):
+        """Read a setting from the Flask app config when running inside the app"""
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+    
     def _format_financial_data_for_prompt(self, financial_data):
         """Format financial data for inclusion in prompts"""
         if not financial_data or 'line_items' not in financial_data:
@@ -160,3 +472,118 @@ class LLMAnalyzer:
             formatted_data.append(line)
         
         return "\n".join(formatted_data)
+
+
+class AsyncLLMAnalyzer(LLMAnalyzer):
+    """LLM analyzer that runs independent completions concurrently on the shared asyncio client"""
+    
+    def generate_report_sections(self, financial_data, transcript_analysis, company_name, quarter, sections=None):
+        """
+        Generate the executive summary and risk analysis concurrently
+        sections limits generation to the named sections (default both)
+        Returns a dict with executive_summary (text) and risk_analysis (dict); a section is None if its call failed
+        """
+        sections = sections or ('executive_summary', 'risk_analysis')
+        requests = {}
+        if 'executive_summary' in sections:
+            requests['executive_summary'] = self._executive_summary_request(financial_data, transcript_analysis, company_name, quarter)
+        if 'risk_analysis' in sections:
+            requests['risk_analysis'] = self._risk_analysis_request(transcript_analysis, financial_data)
+        responses = self.run_batch(requests)
+        
+        results = {'executive_summary': None, 'risk_analysis': None}
+        
+        if 'executive_summary' in responses:
+            if isinstance(responses['executive_summary'], Exception):
+                self.logger.error(f"Error generating executive summary: {str(responses['executive_summary'])}")
+            else:
+                results['executive_summary'] = responses['executive_summary']
+        
+        if 'risk_analysis' in responses:
+            if isinstance(responses['risk_analysis'], Exception):
+                self.logger.error(f"Error generating risk analysis: {str(responses['risk_analysis'])}")
+            else:
+                try:
+                    results['risk_analysis'] = json.loads(responses['risk_analysis'])
+                except json.JSONDecodeError as e:
+                    self.logger.error(f"Error parsing risk analysis response as JSON: {str(e)}")
+        
+        return results
+    
+    def run_batch(self, requests):
+        """
+        Run several chat completions concurrently, serving cached ones without an API call
+        requests maps a name to _chat_completion keyword arguments
+        Returns a dict mapping each name to its response text, or the exception raised for it
+        """
+        results = {}
+        pending = {}
+        
+        # Cache lookups need the app context, so they stay on the calling thread
+        for name, request in requests.items():
+            cache, cache_key, cached_response = self._lookup_cache(**request)
+            if cached_response is not None:
+                metrics.observe_llm_call('cache', stage=name)
+                results[name] = cached_response
+            else:
+                pending[name] = (cache, cache_key, request)
+        
+        if not pending:
+            return results
+        
+        # Identical requests in flight in any process are waited for rather than sent again; the locks
+        # are held until the responses are cached, then followers read them from the cache
+        coalesced = {
+            f"llm:{cache_key}": cache for cache, cache_key, _ in pending.values() if cache is not None and cache.enabled
+        }
+        
+        def lookup(key):
+            return self._get_cached(coalesced[key], key.split(':', 1)[1])
+        
+        with single_flight.run_many(coalesced, lookup) as found:
+            for name, (cache, cache_key, request) in list(pending.items()):
+                if f"llm:{cache_key}" in found:
+                    metrics.observe_llm_call('cache', stage=name)
+                    results[name] = found[f"llm:{cache_key}"]
+                    del pending[name]
+            
+            if pending:
+                loop, client = get_async_runtime()
+                request_kwargs = [self._build_request(**request) for _, _, request in pending.values()]
+                future = asyncio.run_coroutine_threadsafe(self._gather_completions(client, request_kwargs), loop)
+                responses = future.result()
+                
+                for (name, (cache, cache_key, request)), (response, duration) in zip(pending.items(), responses):
+                    if isinstance(response, Exception):
+                        metrics.observe_llm_call('error', duration, stage=name)
+                        results[name] = response
+                        continue
+                    
+                    metrics.observe_llm_call('api', duration, response.usage, stage=name)
+                    response_text = response.choices[0].message.content
+                    self._store_in_cache(cache, cache_key, response_text, request.get('response_format'))
+                    results[name] = response_text
+        
+        return results
+    
+    async def _gather_completions(self, client, request_kwargs):
+        """
+        Await all completions at once, bounded by the parallel call limit
+        Returns a (response or exception, call duration) pair for each request
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel_calls))
+        
+        async def create(kwargs):
+            async def attempt():
+                response = await client.chat.completions.create(**kwargs)
+                return response, response.usage
+            
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response, _ = await llm_limiter.acall(attempt, self._estimate_tokens(kwargs))
+                    return response, time.perf_counter() - start
+                except Exception as e:
+                    return e, time.perf_counter() - start
+        
+        return await asyncio.gather(*(create(kwargs) for kwargs in request_kwargs))
@@ -0,0 +1,404 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+# Request arguments that change how a response is delivered but not what it contains
+TRANSPORT_ARGUMENTS = ('stream', 'stream_options')
+
+
+class RecordingNotFound(Exception):
+    """Raised in replay mode when no recording matches a request"""
+
+
+def _split_tokens(text):
+    """Split text into word-sized pieces that roughly resemble model tokens"""
+    return re.findall(r'\s*\S+', text) or [text]
+
+
+def _request_payload(request_kwargs):
+    """The parts of a chat completion request that determine its response"""
+    return {key: value for key, value in request_kwargs.items() if key not in TRANSPORT_ARGUMENTS}
+
+
+def _completion_from_chunks(chunks):
+    """Assemble the chat.completion a list of streamed chunks adds up to"""
+    parts = []
+    finish_reason = None
+    usage = None
+    for chunk in chunks:
+        if chunk.usage:
+            usage = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            if choice.delta.content:
+                parts.append(choice.delta.content)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+    first = chunks[0] if chunks else None
+    return {
+        "id": first.id if first else "chatcmpl-recorded",
+        "object": "chat.completion",
+        "created": first.created if first else int(time.time()),
+        "model": first.model if first else "",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ''.join(parts)},
+            "finish_reason": finish_reason or "stop"
+        }],
+        "usage": usage
+    }
+
+
+def _chunks_from_completion(completion, include_usage):
+    """Split a recorded chat.completion into the chunk payloads a streamed call would have sent"""
+    content = completion["choices"][0]["message"].get("content") or ''
+    base = {"id": completion["id"], "object": "chat.completion.chunk",
+            "created": completion["created"], "model": completion["model"]}
+
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+    for token in _split_tokens(content) if content else []:
+        chunks.append(dict(base, choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}]))
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": completion["choices"][0].get("finish_reason") or "stop"}]))
+    if include_usage and completion.get("usage"):
+        chunks.append(dict(base, choices=[], usage=completion["usage"]))
+    return chunks
+
+
+class RecordingStore:
+    """
+    Folder of recorded chat completions, one JSON file per distinct request
+    Files are named by a hash of the request, so streamed and non-streamed calls share a recording
+    """
+
+    def __init__(self, folder):
+        self.logger = logging.getLogger(__name__)
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._by_shape = None
+
+    @staticmethod
+    def make_key(request_kwargs):
+        """SHA-256 of the request arguments that determine the response"""
+        payload = json.dumps(_request_payload(request_kwargs), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_shape(request_kwargs):
+        """Model, system message and response format of a request, used for loose replay matching"""
+        messages = request_kwargs.get('messages') or []
+        system_message = next((m.get('content') for m in messages if m.get('role') == 'system'), '')
+        response_type = (request_kwargs.get('response_format') or {}).get('type', 'text')
+        return f"{request_kwargs.get('model')}|{response_type}|{system_message}"
+
+    def save(self, request_kwargs, completion, duration, first_chunk_seconds=None):
+        """Write a recording atomically, replacing any earlier one for the same request"""
+        os.makedirs(self.folder, exist_ok=True)
+        key = self.make_key(request_kwargs)
+        recording = {
+            "key": key,
+            "shape": self.make_shape(request_kwargs),
+            "recorded_at": datetime.utcnow().isoformat(),
+            "duration": duration,
+            "first_chunk_seconds": first_chunk_seconds,
+            "request": _request_payload(request_kwargs),
+            "response": completion
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(recording, temp_file, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self._by_shape = None
+        self.logger.debug(f"Recorded LLM response {key[:12]}")
+
+    def find(self, request_kwargs, loose=False):
+        """
+        Return the recording for a request
+        With loose matching a request that was never recorded gets a recording with the same
+        model, system message and response format, chosen deterministically from its key
+        """
+        key = self.make_key(request_kwargs)
+        recording = self._load(self._path(key))
+        if recording is not None:
+            return recording
+
+        if loose:
+            candidates = self._shape_index().get(self.make_shape(request_kwargs), [])
+            if candidates:
+                recording = self._load(self._path(candidates[int(key, 16) % len(candidates)]))
+                if recording is not None:
+                    return recording
+
+        raise RecordingNotFound(f"No recorded LLM response for request {key[:12]} in {self.folder}")
+
+    def _shape_index(self):
+        """Recording keys grouped by request shape, built on first use"""
+        with self._lock:
+            if self._by_shape is None:
+                by_shape = {}
+                if os.path.isdir(self.folder):
+                    for filename in sorted(os.listdir(self.folder)):
+                        if not filename.endswith('.json'):
+                            continue
+                        recording = self._load(os.path.join(self.folder, filename))
+                        if recording:
+                            by_shape.setdefault(recording.get('shape'), []).append(recording['key'])
+                self._by_shape = by_shape
+            return self._by_shape
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def _load(self, path):
+        try:
+            with open(path) as recording_file:
+                return json.load(recording_file)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Ignoring unreadable LLM recording {path}: {str(e)}")
+            return None
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class _Client:
+    """Minimal client exposing a completions object as client.chat.completions"""
+
+    def __init__(self, completions):
+        self.chat = _Chat(completions)
+
+
+class _RecordingCompletions:
+    """chat.completions wrapper that saves every successful response to a RecordingStore"""
+
+    def __init__(self, completions, store):
+        self._completions = completions
+        self._store = store
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        response = self._completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self._record_stream(kwargs, response, start)
+        self._store.save(kwargs, response.model_dump(), time.perf_counter() - start)
+        return response
+
+    def _record_stream(self, kwargs, stream, start):
+        chunks = []
+        first_chunk_seconds = None
+        for chunk in stream:
+            if first_chunk_seconds is None:
+                first_chunk_seconds = time.perf_counter() - start
+            chunks.append(chunk)
+            yield chunk
+        self._store.save(kwargs, _completion_from_chunks(chunks), time.perf_counter() - start, first_chunk_seconds)
+
+
+class _AsyncRecordingCompletions(_RecordingCompletions):
+    """Async variant of _RecordingCompletions"""
+
+    async def create(self, **kwargs):
+        start = time.perf_counter()
+        response = await self._completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self._record_stream(kwargs, response, start)
+        self._store.save(kwargs, response.model_dump(), time.perf_counter() - start)
+        return response
+
+    async def _record_stream(self, kwargs, stream, start):
+        chunks = []
+        first_chunk_seconds = None
+        async for chunk in stream:
+            if first_chunk_seconds is None:
+                first_chunk_seconds = time.perf_counter() - start
+            chunks.append(chunk)
+            yield chunk
+        self._store.save(kwargs, _completion_from_chunks(chunks), time.perf_counter() - start, first_chunk_seconds)
+
+
+class _ReplayCompletions:
+    """
+    chat.completions stand-in that answers from a RecordingStore
+    speed scales the recorded response times: 0 answers at once, 1 matches the original call
+    """
+
+    def __init__(self, store, speed=0.0, loose=False):
+        self._store = store
+        self._speed = speed
+        self._loose = loose
+
+    def create(self, **kwargs):
+        recording = self._store.find(kwargs, loose=self._loose)
+        if kwargs.get('stream'):
+            return self._replay_stream(kwargs, recording)
+        time.sleep(self._scaled(recording.get('duration')))
+        return ChatCompletion.model_validate(recording['response'])
+
+    def _replay_stream(self, kwargs, recording):
+        for chunk, delay in self._timed_chunks(kwargs, recording):
+            time.sleep(delay)
+            yield chunk
+
+    def _timed_chunks(self, kwargs, recording):
+        """Chunks of a replayed stream, each with the delay to wait before sending it"""
+        include_usage = (kwargs.get('stream_options') or {}).get('include_usage', False)
+        chunks = _chunks_from_completion(recording['response'], include_usage)
+        duration = self._scaled(recording.get('duration'))
+        first = min(self._scaled(recording.get('first_chunk_seconds')) or duration, duration)
+        interval = (duration - first) / max(1, len(chunks) - 1)
+        return [(ChatCompletionChunk.model_validate(chunk), first if index == 0 else interval)
+                for index, chunk in enumerate(chunks)]
+
+    def _scaled(self, seconds):
+        return max(0.0, (seconds or 0.0) * self._speed)
+
+
+class _AsyncReplayCompletions(_ReplayCompletions):
+    """Async variant of _ReplayCompletions"""
+
+    async def create(self, **kwargs):
+        recording = self._store.find(kwargs, loose=self._loose)
+        if kwargs.get('stream'):
+            return self._replay_stream(kwargs, recording)
+        await asyncio.sleep(self._scaled(recording.get('duration')))
+        return ChatCompletion.model_validate(recording['response'])
+
+    async def _replay_stream(self, kwargs, recording):
+        for chunk, delay in self._timed_chunks(kwargs, recording):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+class LLMBackend:
+    """Creates the chat completion clients LLMAnalyzer calls; subclasses are registered by name"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def create_client(self):
+        """Client with a synchronous chat.completions.create"""
+        raise NotImplementedError
+
+    def create_async_client(self):
+        """Client whose chat.completions.create is a coroutine"""
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    The OpenAI API, or any compatible server named by OPENAI_BASE_URL
+    The SDK's own retries are off: LLMLimiter retries with a backoff shared by all processes
+    """
+
+    def create_client(self):
+        return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), **self._client_options())
+
+    def create_async_client(self):
+        return AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), **self._client_options())
+
+    def _client_options(self):
+        options = {'max_retries': 0}
+        if self.options.get('request_timeout'):
+            options['timeout'] = self.options['request_timeout']
+        return options
+
+
+class RecordingBackend(OpenAIBackend):
+    """Calls the OpenAI API and saves each response under the recordings folder"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.store = RecordingStore(options['recordings_folder'])
+
+    def create_client(self):
+        client = super().create_client()
+        return _Client(_RecordingCompletions(client.chat.completions, self.store))
+
+    def create_async_client(self):
+        client = super().create_async_client()
+        return _Client(_AsyncRecordingCompletions(client.chat.completions, self.store))
+
+
+class ReplayBackend(LLMBackend):
+    """Answers from the recordings folder without any network access"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.store = RecordingStore(options['recordings_folder'])
+        self.speed = options.get('replay_speed', 0.0)
+        self.loose = options.get('replay_match', 'exact') == 'loose'
+
+    def create_client(self):
+        return _Client(_ReplayCompletions(self.store, self.speed, self.loose))
+
+    def create_async_client(self):
+        return _Client(_AsyncReplayCompletions(self.store, self.speed, self.loose))
+
+
+class LLMBackendRegistry:
+    """Named LLM backends and the one the app is configured to use"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._name = 'openai'
+        self._options = {}
+        self._backend = None
+
+    def register(self, name, backend_class):
+        """Make a backend available to configure by name"""
+        with self._lock:
+            self._backends[name] = backend_class
+            if name == self._name:
+                self._backend = None
+
+    def configure(self, name, **options):
+        """Select the backend used for new clients"""
+        if name not in self._backends:
+            raise ValueError(f"Unknown LLM backend '{name}' (available: {', '.join(sorted(self._backends))})")
+        with self._lock:
+            self._name = name
+            self._options = options
+            self._backend = None
+        self.logger.info(f"Using LLM backend '{name}'")
+
+    @property
+    def name(self):
+        return self._name
+
+    def backend(self):
+        """The configured backend instance, created on first use"""
+        with self._lock:
+            if self._backend is None:
+                self._backend = self._backends[self._name](**self._options)
+            return self._backend
+
+    def create_client(self):
+        return self.backend().create_client()
+
+    def create_async_client(self):
+        return self.backend().create_async_client()
+
+
+# Process-wide registry; LLMAnalyzer creates its clients through it
+llm_backends = LLMBackendRegistry()
+llm_backends.register('openai', OpenAIBackend)
+llm_backends.register('record', RecordingBackend)
+llm_backends.register('replay', ReplayBackend)
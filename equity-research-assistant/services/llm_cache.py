@@ -0,0 +1,177 @@
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import LLMCacheEntry
+from services.metrics import metrics
+
+# Label used for each process counter in the exported llm_cache_events_total metric
+CACHE_EVENT_LABELS = {'hits': 'hit', 'misses': 'miss', 'evictions': 'eviction'}
+
+class LLMResponseCache:
+    """Persistent, content-addressed cache for LLM chat completion responses"""
+
+    # Process-wide counters shared by all cache instances
+    _stats_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __init__(self, ttl_seconds=None, max_entries=None, max_bytes=None):
+        self.logger = logging.getLogger(__name__)
+        config = current_app.config
+        self.enabled = config.get('LLM_CACHE_ENABLED', True)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config['LLM_CACHE_TTL_SECONDS']
+        self.max_entries = max_entries if max_entries is not None else config['LLM_CACHE_MAX_ENTRIES']
+        self.max_bytes = max_bytes if max_bytes is not None else config['LLM_CACHE_MAX_BYTES']
+
+    @staticmethod
+    def make_key(model, system_message, prompt, temperature, max_tokens, response_format=None):
+        """Build the SHA-256 cache key for a fully rendered chat completion request"""
+        payload = json.dumps({
+            'model': model,
+            'system': system_message,
+            'prompt': prompt,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'response_format': response_format
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key, count_miss=True):
+        """
+        Return the cached response text, or None on a miss or expired entry
+        count_miss=False is for re-checks of a key whose miss was already counted
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            entry = LLMCacheEntry.query.filter_by(cache_key=cache_key).first()
+            if entry and self._is_expired(entry):
+                db.session.delete(entry)
+                db.session.commit()
+                entry = None
+
+            if not entry:
+                if count_miss:
+                    self._increment('misses')
+                return None
+
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_accessed_at = datetime.utcnow()
+            db.session.commit()
+
+            self._increment('hits')
+            return entry.response_text
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def set(self, cache_key, model, response_text):
+        """Store a response and evict entries beyond the configured bounds"""
+        if not self.enabled:
+            return
+
+        try:
+            self._write_entry(cache_key, model, response_text)
+        except IntegrityError:
+            # Another worker inserted the same key between our lookup and commit; update its row instead
+            db.session.rollback()
+            try:
+                self._write_entry(cache_key, model, response_text)
+            except Exception:
+                db.session.rollback()
+                raise
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.evict()
+
+    def _write_entry(self, cache_key, model, response_text):
+        """Insert or update the entry for a key and commit"""
+        entry = LLMCacheEntry.query.filter_by(cache_key=cache_key).first()
+        if not entry:
+            entry = LLMCacheEntry(cache_key=cache_key, model=model)
+            db.session.add(entry)
+
+        entry.response_text = response_text
+        entry.response_size = len(response_text.encode('utf-8'))
+        entry.created_at = datetime.utcnow()
+        entry.last_accessed_at = datetime.utcnow()
+        db.session.commit()
+
+    def evict(self):
+        """Remove expired entries, then least recently used entries over the size bounds"""
+        evicted = 0
+
+        try:
+            if self.ttl_seconds:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+                evicted += LLMCacheEntry.query.filter(LLMCacheEntry.created_at < cutoff).delete(synchronize_session=False)
+
+            entry_count, total_bytes = db.session.query(
+                func.count(LLMCacheEntry.id),
+                func.coalesce(func.sum(LLMCacheEntry.response_size), 0)
+            ).one()
+
+            if entry_count > self.max_entries or total_bytes > self.max_bytes:
+                lru_entries = db.session.query(
+                    LLMCacheEntry.id, LLMCacheEntry.response_size
+                ).order_by(LLMCacheEntry.last_accessed_at).all()
+
+                stale_ids = []
+                for entry_id, size in lru_entries:
+                    if entry_count <= self.max_entries and total_bytes <= self.max_bytes:
+                        break
+                    stale_ids.append(entry_id)
+                    entry_count -= 1
+                    total_bytes -= size or 0
+
+                if stale_ids:
+                    evicted += LLMCacheEntry.query.filter(LLMCacheEntry.id.in_(stale_ids)).delete(synchronize_session=False)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if evicted:
+            self._increment('evictions', evicted)
+            self.logger.debug(f"Evicted {evicted} LLM cache entries")
+        return evicted
+
+    def stats(self):
+        """Return cache counters for this process along with table size"""
+        entry_count, total_bytes = db.session.query(
+            func.count(LLMCacheEntry.id),
+            func.coalesce(func.sum(LLMCacheEntry.response_size), 0)
+        ).one()
+
+        with self._stats_lock:
+            counters = dict(self._stats)
+
+        lookups = counters['hits'] + counters['misses']
+        counters.update({
+            'entries': entry_count,
+            'total_bytes': total_bytes,
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0
+        })
+        return counters
+
+    def _is_expired(self, entry):
+        """Check whether an entry is older than the TTL"""
+        if not self.ttl_seconds or not entry.created_at:
+            return False
+        return entry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    @classmethod
+    def _increment(cls, counter, amount=1):
+        """Increment a process-wide counter and the matching exported metric"""
+        with cls._stats_lock:
+            cls._stats[counter] += amount
+        metrics.inc('llm_cache_events_total', {'route': metrics.current_route(), 'event': CACHE_EVENT_LABELS[counter]}, amount)
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import fcntl
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from openai import APIConnectionError, APIStatusError
+from services.metrics import metrics
+
+STATE_FILENAME = 'state.json'
+
+# Status codes worth retrying; 429 is a rate limit rather than a sign the API is unhealthy
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RATE_LIMITED_STATUS_CODE = 429
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call would wait longer than the limiter's maximum for its turn"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open"""
+
+
+def failure_reason(error):
+    """Short reason for a retryable error, or None if the error should not be retried"""
+    if isinstance(error, APIConnectionError):
+        # Includes APITimeoutError
+        return 'timeout' if 'timeout' in type(error).__name__.lower() else 'connection'
+    if isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES:
+        return 'rate_limited' if error.status_code == RATE_LIMITED_STATUS_CODE else 'server_error'
+    return None
+
+
+def retry_after_seconds(error):
+    """Seconds the API asked us to wait (retry-after-ms or retry-after header), or None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMLimiter:
+    """
+    Rate limiting, retries and a circuit breaker for chat completion calls
+    Request and token buckets, rate limit pauses and the breaker live in one state file under an
+    exclusive file lock, so every process (gunicorn workers, job workers) shares the same quota.
+    Calls reserve their share up front and sleep until it is available, which queues them in
+    order and keeps throughput at the configured ceiling rather than bursting into 429s.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._memory_state = {}
+        self._folder = None
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.max_wait_seconds = 300.0
+        self.max_retries = 4
+        self.retry_base_seconds = 1.0
+        self.retry_max_seconds = 60.0
+        self.failure_threshold = 5
+        self.reset_seconds = 30.0
+
+    def configure(self, folder, requests_per_minute=0, tokens_per_minute=0, max_wait_seconds=300.0, max_retries=4,
+                  retry_base_seconds=1.0, retry_max_seconds=60.0, failure_threshold=5, reset_seconds=30.0):
+        """Set the shared state folder (None keeps state in this process) and the limits; 0 disables a limit"""
+        self._folder = folder
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def call(self, attempt, estimated_tokens, can_retry=None):
+        """
+        Run attempt() under the limits, retrying transient failures with jittered exponential backoff
+        attempt returns (result, usage); usage corrects the token reservation once the real count is known
+        can_retry, if given, is checked before each retry (e.g. to stop once streamed output was delivered)
+        """
+        for attempt_number in range(self.max_retries + 1):
+            wait = self.reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result, usage = attempt()
+            except Exception as e:
+                delay = self._after_failure(e, attempt_number, can_retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._after_success(estimated_tokens, usage)
+            return result, usage
+
+    async def acall(self, attempt, estimated_tokens):
+        """Async variant of call for coroutine attempts"""
+        for attempt_number in range(self.max_retries + 1):
+            wait = self.reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result, usage = await attempt()
+            except Exception as e:
+                delay = self._after_failure(e, attempt_number)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._after_success(estimated_tokens, usage)
+            return result, usage
+
+    def reserve(self, estimated_tokens):
+        """
+        Take one request and estimated_tokens from the buckets and return how long to wait before calling
+        Buckets may go negative: later callers then wait behind the earlier reservations
+        """
+        now = time.time()
+        with self._state() as state:
+            circuit = state.setdefault('circuit', {})
+            opened_until = circuit.get('opened_until', 0)
+            if opened_until > now:
+                raise CircuitOpenError(f"LLM API circuit breaker is open; retry in {opened_until - now:.0f}s")
+            if opened_until:
+                # Half-open: let a single probe call through to test the API
+                if circuit.get('probe_until', 0) > now:
+                    raise CircuitOpenError("LLM API circuit breaker is half-open and a probe call is in flight")
+                circuit['probe_until'] = now + self.reset_seconds
+
+            wait = max(0.0, state.get('paused_until', 0) - now)
+            amounts = (('requests', self.requests_per_minute, 1),
+                       ('tokens', self.tokens_per_minute, min(estimated_tokens, self.tokens_per_minute)))
+            for name, limit, amount in amounts:
+                if not limit:
+                    continue
+                level = self._refill(state, name, limit, now) - amount
+                state[name]['level'] = level
+                if level < 0:
+                    wait = max(wait, -level / (limit / 60.0))
+
+            if wait > self.max_wait_seconds:
+                for name, limit, amount in amounts:
+                    if limit:
+                        state[name]['level'] += amount
+                raise RateLimitTimeout(f"LLM rate limit queue is {wait:.0f}s long (limit {self.max_wait_seconds:.0f}s)")
+
+        if wait > 0:
+            metrics.observe('llm_throttle_wait_seconds', {'route': metrics.current_route()}, wait)
+        return wait
+
+    def status(self):
+        """Snapshot of the shared buckets and breaker, for diagnostics"""
+        now = time.time()
+        with self._state() as state:
+            for name, limit in (('requests', self.requests_per_minute), ('tokens', self.tokens_per_minute)):
+                if limit:
+                    self._refill(state, name, limit, now)
+            return json.loads(json.dumps(state))
+
+    def _after_success(self, estimated_tokens, usage):
+        """Close the breaker and return unused reserved tokens"""
+        total_tokens = getattr(usage, 'total_tokens', None) if usage is not None else None
+        with self._state() as state:
+            state['circuit'] = {}
+            if self.tokens_per_minute and total_tokens is not None:
+                refund = min(estimated_tokens, self.tokens_per_minute) - total_tokens
+                now = time.time()
+                level = self._refill(state, 'tokens', self.tokens_per_minute, now) + refund
+                state['tokens']['level'] = min(level, self.tokens_per_minute)
+
+    def _after_failure(self, error, attempt_number, can_retry=None):
+        """Update the breaker and shared pause for a failed attempt; returns the retry delay, or None to give up"""
+        reason = failure_reason(error)
+        if reason is None:
+            # Not worth retrying, but a half-open probe is over either way; an error response such as
+            # a 400 also shows the API is reachable, so the breaker closes
+            with self._state() as state:
+                if isinstance(error, APIStatusError):
+                    state['circuit'] = {}
+                else:
+                    state.setdefault('circuit', {}).pop('probe_until', None)
+            return None
+
+        retry_after = retry_after_seconds(error)
+        now = time.time()
+        with self._state() as state:
+            circuit = state.setdefault('circuit', {})
+            if reason == 'rate_limited':
+                # Everyone backs off, not just the caller that hit the limit
+                if retry_after:
+                    state['paused_until'] = max(state.get('paused_until', 0), now + retry_after)
+                circuit.pop('probe_until', None)
+            else:
+                circuit['failures'] = circuit.get('failures', 0) + 1
+                if circuit.get('opened_until') or circuit['failures'] >= self.failure_threshold:
+                    circuit.update(opened_until=now + self.reset_seconds, failures=0)
+                    circuit.pop('probe_until', None)
+                    self.logger.warning(f"LLM API circuit breaker opened for {self.reset_seconds:.0f}s after {reason} errors")
+
+        if attempt_number >= self.max_retries or (can_retry is not None and not can_retry()):
+            return None
+
+        backoff = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt_number)
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.retry_base_seconds))
+        metrics.inc('llm_retries_total', {'route': metrics.current_route(), 'reason': reason})
+        self.logger.warning(f"LLM call failed ({reason}: {str(error)}); retry {attempt_number + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    @staticmethod
+    def _refill(state, name, limit, now):
+        """Top up a bucket for the time since it was last used; buckets hold at most one minute of quota"""
+        bucket = state.setdefault(name, {'level': limit, 'updated': now})
+        elapsed = max(0.0, now - bucket['updated'])
+        bucket['level'] = min(limit, bucket['level'] + elapsed * limit / 60.0)
+        bucket['updated'] = now
+        return bucket['level']
+
+    @contextmanager
+    def _state(self):
+        """Shared state, locked for the duration of the block and saved afterwards"""
+        if not self._folder:
+            with self._lock:
+                yield self._memory_state
+            return
+
+        with open(os.path.join(self._folder, STATE_FILENAME), 'a+') as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read() or '{}')
+                except json.JSONDecodeError:
+                    state = {}
+                yield state
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(state, state_file)
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+
+# Process-wide limiter used for every LLM call
+llm_limiter = LLMLimiter()
@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import atexit
+import fcntl
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from flask import has_request_context, request
+
+METRIC_PREFIX = 'equity_research'
+
+# Histogram bucket upper bounds for each kind of observation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (10 * 1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024, 25 * 1024 * 1024, 50 * 1024 * 1024)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# name: (type, help text, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by route', LATENCY_BUCKETS),
+    'http_requests_total': ('counter', 'Responses by route and status code', None),
+    'stage_duration_seconds': ('histogram', 'Duration of pipeline stages', LATENCY_BUCKETS),
+    'stage_runs_total': ('counter', 'Pipeline stage runs by outcome', None),
+    'stage_bytes': ('histogram', 'Bytes of input processed per stage run', BYTES_BUCKETS),
+    'stage_pages': ('histogram', 'PDF pages processed per stage run', COUNT_BUCKETS),
+    'stage_rows': ('histogram', 'Spreadsheet rows processed per stage run', COUNT_BUCKETS),
+    'llm_request_duration_seconds': ('histogram', 'Duration of chat completion API calls', LATENCY_BUCKETS),
+    'llm_requests_total': ('counter', 'Chat completions by source (api, cache or error)', None),
+    'llm_tokens': ('histogram', 'Tokens per chat completion API call, by kind (prompt or completion)', TOKEN_BUCKETS),
+    'llm_retries_total': ('counter', 'Retried chat completion attempts by reason', None),
+    'llm_cache_events_total': ('counter', 'LLM response cache lookups and evictions by event (hit, miss or eviction)', None),
+    'llm_throttle_wait_seconds': ('histogram', 'Time chat completions waited for the shared rate limiter', LATENCY_BUCKETS),
+    'single_flight_total': ('counter', 'Coalesced work by kind and role (leader, follower, stored or timeout)', None),
+}
+
+# Files of processes that have exited are folded into this one so the folder does not grow
+ARCHIVE_FILENAME = 'archived.json'
+
+_current_stage = contextvars.ContextVar('metrics_stage', default=None)
+_current_route = contextvars.ContextVar('metrics_route', default=None)
+
+
+def _label_key(labels):
+    """Render labels in Prometheus text format; also used as the series key when merging processes"""
+    parts = []
+    for name in sorted(labels):
+        value = str(labels[name]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return ','.join(parts)
+
+
+def _merge_snapshot(total, snapshot):
+    """Add one process snapshot into an aggregate snapshot in place"""
+    for name, series in snapshot.items():
+        target = total.setdefault(name, {})
+        for key, value in series.items():
+            if isinstance(value, list):
+                current = target.setdefault(key, [0] * len(value))
+                target[key] = [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+class StageTimer:
+    """Handle yielded by MetricsRegistry.stage for recording what a stage processed"""
+
+    def __init__(self):
+        self.status = 'ok'
+        self.amounts = {}
+
+    def record(self, bytes=None, pages=None, rows=None):
+        """Record the size of the stage's input"""
+        for unit, amount in (('bytes', bytes), ('pages', pages), ('rows', rows)):
+            if amount is not None:
+                self.amounts[unit] = amount
+
+
+class MetricsRegistry:
+    """
+    Process-local counters and histograms for the research pipeline
+    Each process periodically writes its totals to its own file in METRICS_FOLDER, and the
+    /metrics endpoint adds up the files of every process (e.g. all gunicorn workers)
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # Serializes flushes so an older snapshot never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        self._series = {}
+        self._folder = None
+        self._flush_seconds = 5.0
+        self._last_flush = 0.0
+        self._dirty = False
+        self._flusher_pid = None
+        self._pid = os.getpid()
+        self._file_claimed = False
+        atexit.register(self.flush)
+        # A forked worker starts from empty totals rather than repeating its parent's
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def configure(self, folder, flush_seconds=5.0):
+        """Set where per-process totals are written; with no folder metrics are only kept in memory"""
+        self._folder = folder
+        self._flush_seconds = flush_seconds
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def inc(self, name, labels, value=1):
+        """Increase a counter"""
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+            self._dirty = True
+        self._maybe_flush()
+
+    def observe(self, name, labels, value):
+        """Record a value in a histogram"""
+        buckets = METRICS[name][2]
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            key = _label_key(labels)
+            # Per-bucket counts (not cumulative), then the +Inf bucket, sum and count
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(buckets) + 3)
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+            self._dirty = True
+        self._maybe_flush()
+
+    @staticmethod
+    def current_route():
+        """Route label for observations: the bound route, the Flask endpoint, or 'background'"""
+        route = _current_route.get()
+        if route:
+            return route
+        if has_request_context():
+            return request.endpoint or 'unknown'
+        return 'background'
+
+    @staticmethod
+    def current_stage():
+        """Name of the innermost stage running in this context, or None"""
+        return _current_stage.get()
+
+    @contextmanager
+    def bind_route(self, route):
+        """Attribute observations made inside the block to route (used by background workers)"""
+        token = _current_route.set(route)
+        try:
+            yield
+        finally:
+            _current_route.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a pipeline stage and count its outcome
+        Yields a StageTimer whose record() adds the bytes, pages or rows the stage processed
+        """
+        timer = StageTimer()
+        token = _current_stage.set(name)
+        start = time.perf_counter()
+        try:
+            yield timer
+        except Exception:
+            timer.status = 'error'
+            raise
+        finally:
+            _current_stage.reset(token)
+            labels = {'stage': name, 'route': self.current_route()}
+            self.observe('stage_duration_seconds', labels, time.perf_counter() - start)
+            self.inc('stage_runs_total', dict(labels, status=timer.status))
+            for unit, amount in timer.amounts.items():
+                self.observe(f'stage_{unit}', labels, amount)
+
+    def observe_llm_call(self, source, duration=None, usage=None, stage=None):
+        """Record a chat completion served from the API, the cache, or that failed"""
+        labels = {'stage': stage or self.current_stage() or 'other', 'route': self.current_route()}
+        self.inc('llm_requests_total', dict(labels, source=source))
+        if duration is not None:
+            self.observe('llm_request_duration_seconds', labels, duration)
+        if usage is not None:
+            for kind in ('prompt', 'completion'):
+                tokens = getattr(usage, f'{kind}_tokens', None)
+                if tokens is not None:
+                    self.observe('llm_tokens', dict(labels, kind=kind), tokens)
+
+    def snapshot(self):
+        """Copy of this process's totals"""
+        with self._lock:
+            return {name: {key: list(value) if isinstance(value, list) else value for key, value in series.items()}
+                    for name, series in self._series.items()}
+
+    def flush(self):
+        """Write this process's totals to its file"""
+        if not self._folder:
+            return
+        with self._flush_lock:
+            try:
+                if not self._file_claimed:
+                    self._claim_file()
+                with self._lock:
+                    self._dirty = False
+                self._write_json(self._process_path(self._pid), self.snapshot())
+                self._last_flush = time.monotonic()
+            except OSError as e:
+                self.logger.warning(f"Failed to write metrics: {str(e)}")
+
+    def collect(self):
+        """Add up the totals of every process, folding the files of exited processes into the archive"""
+        self.flush()
+        total = {}
+        if not self._folder:
+            _merge_snapshot(total, self.snapshot())
+            return total
+
+        with self._folder_lock():
+            archive_path = os.path.join(self._folder, ARCHIVE_FILENAME)
+            archive = self._read_json(archive_path)
+            archive_changed = False
+            for entry in os.scandir(self._folder):
+                pid = self._file_pid(entry.name)
+                if pid is None:
+                    continue
+                snapshot = self._read_json(entry.path)
+                if pid != self._pid and not self._pid_alive(pid):
+                    _merge_snapshot(archive, snapshot)
+                    os.remove(entry.path)
+                    archive_changed = True
+                else:
+                    _merge_snapshot(total, snapshot)
+            if archive_changed:
+                self._write_json(archive_path, archive)
+        _merge_snapshot(total, archive)
+        return total
+
+    def render(self):
+        """Aggregated metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        lines = []
+        for name, (metric_type, help_text, buckets) in METRICS.items():
+            full_name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for key, value in sorted(totals.get(name, {}).items()):
+                if metric_type == 'counter':
+                    lines.append(f"{full_name}{{{key}}} {value}")
+                    continue
+
+                separator = ',' if key else ''
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{{{key}{separator}le="{bound}"}} {cumulative}')
+                lines.append(f"{full_name}_sum{{{key}}} {value[-2]}")
+                lines.append(f"{full_name}_count{{{key}}} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Clear this process's totals and, when configured, every saved file"""
+        with self._lock:
+            self._series = {}
+        if self._folder:
+            with self._folder_lock():
+                for entry in os.scandir(self._folder):
+                    if entry.name == ARCHIVE_FILENAME or self._file_pid(entry.name) is not None:
+                        os.remove(entry.path)
+
+    def _maybe_flush(self):
+        if not self._folder:
+            return
+        if self._flusher_pid != self._pid:
+            self._start_flusher()
+        if time.monotonic() - self._last_flush >= self._flush_seconds:
+            self.flush()
+
+    def _start_flusher(self):
+        """Start this process's background flush thread, so totals of a worker gone idle still reach the file"""
+        with self._lock:
+            if self._flusher_pid == self._pid:
+                return
+            self._flusher_pid = self._pid
+        threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def _flush_periodically(self):
+        pid = self._pid
+        while self._pid == pid:
+            time.sleep(self._flush_seconds)
+            if self._dirty and self._pid == pid:
+                self.flush()
+
+    def _claim_file(self):
+        """Archive a file left by an exited process whose pid this process has reused"""
+        path = self._process_path(self._pid)
+        with self._folder_lock():
+            if os.path.exists(path):
+                archive_path = os.path.join(self._folder, ARCHIVE_FILENAME)
+                archive = self._read_json(archive_path)
+                _merge_snapshot(archive, self._read_json(path))
+                self._write_json(archive_path, archive)
+                os.remove(path)
+        self._file_claimed = True
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._series = {}
+        self._pid = os.getpid()
+        self._file_claimed = False
+        self._last_flush = 0.0
+        self._dirty = False
+        # The parent's flush thread does not exist in the child; the first observation starts one
+        self._flusher_pid = None
+
+    def _process_path(self, pid):
+        return os.path.join(self._folder, f"process-{pid}.json")
+
+    @staticmethod
+    def _file_pid(filename):
+        if filename.startswith('process-') and filename.endswith('.json'):
+            try:
+                return int(filename[len('process-'):-len('.json')])
+            except ValueError:
+                return None
+        return None
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @contextmanager
+    def _folder_lock(self):
+        """Exclusive lock across processes for reading and folding metrics files"""
+        with open(os.path.join(self._folder, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as metrics_file:
+                return json.load(metrics_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_json(self, path, payload):
+        """Write atomically so readers never see a partial file"""
+        fd, temp_path = tempfile.mkstemp(dir=self._folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(payload, temp_file)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# Process-wide registry used by all services
+metrics = MetricsRegistry()
@@ -0,0 +1,82 @@
+import re
+import json
+
+# A JSON string body made only of complete characters and escape sequences
+_STRING_BODY_PATTERN = re.compile(r'(?:[^"\\]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*')
+_WHITESPACE_PATTERN = re.compile(r'[\s,]*')
+
+# Streamed LLM output may contain raw newlines inside strings
+_DECODER = json.JSONDecoder(strict=False)
+
+class PartialJSONObjectParser:
+    """Incrementally extract top-level fields from a JSON object that is still being streamed"""
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields = {}
+        self._resume_at = None  # Position just after the last fully parsed field
+
+    def feed(self, text):
+        """
+        Append streamed text and parse as far as possible
+        String fields that are still being written are returned with their partial value
+        Returns a dict of the fields seen so far
+        """
+        self.buffer += text
+        self._parse()
+        return dict(self.fields)
+
+    def _parse(self):
+        """Parse fields from the last complete one onwards"""
+        buffer = self.buffer
+        if self._resume_at is None:
+            start = buffer.find('{')
+            if start == -1:
+                return
+            self._resume_at = start + 1
+
+        position = self._resume_at
+        while True:
+            position = _WHITESPACE_PATTERN.match(buffer, position).end()
+            if position >= len(buffer) or buffer[position] != '"':
+                return
+
+            key, position, complete = self._read_string(buffer, position)
+            if not complete:
+                return
+
+            position = _WHITESPACE_PATTERN.match(buffer, position).end()
+            if position >= len(buffer) or buffer[position] != ':':
+                return
+            position = _WHITESPACE_PATTERN.match(buffer, position + 1).end()
+            if position >= len(buffer):
+                return
+
+            if buffer[position] == '"':
+                value, position, complete = self._read_string(buffer, position)
+                self.fields[key] = value
+                if not complete:
+                    return
+            else:
+                try:
+                    value, end = _DECODER.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    return
+                # A value is only complete once a delimiter follows it; a number cut off after
+                # "12." or "1e" decodes as a shorter number that would otherwise be kept
+                if end >= len(buffer) or not (buffer[end] in ',}]' or buffer[end].isspace()):
+                    return
+                self.fields[key] = value
+                position = end
+
+            self._resume_at = position
+
+    def _read_string(self, buffer, position):
+        """
+        Decode the JSON string starting at the opening quote
+        Returns (value, end position, whether the closing quote was reached)
+        """
+        body_end = _STRING_BODY_PATTERN.match(buffer, position + 1).end()
+        value = _DECODER.decode(f'"{buffer[position + 1:body_end]}"')
+        complete = body_end < len(buffer) and buffer[body_end] == '"'
+        return value, body_end + 1 if complete else body_end, complete
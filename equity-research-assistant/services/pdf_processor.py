@@ -1,12 +1,77 @@
 import fitz  # PyMuPDF
 import logging
+import math
+import multiprocessing
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from services.metrics import metrics
+
+# Single-pass cleaning pattern for transcript text. The leading lookahead lets the regex
+# engine skip quickly to characters that can start a rule; alternatives are then tried in
+# order, so page markers and copyright lines win over plain whitespace.
+_CLEANING_PATTERN = re.compile(
+    r'(?=[ \t\n.?!P©-])(?:'
+    r'(?P<page_marker>[ \t]*Page \d+ of \d+)'     # Remove "Page X of Y" artifacts
+    r'|(?P<copyright>[ \t]*©[^\n]*)'              # Remove copyright lines
+    r'|(?P<hyphenation>-(?<=\w-)\s*\n\s*(?=\w))'  # Fix words hyphenated across lines
+    r'|(?P<blank_lines>\n\s*\n)'                  # Normalize paragraph breaks
+    r'|(?P<whitespace>[ \t]*\t[ \t]*| {2,})'      # Collapse runs of spaces and tabs
+    r'|(?P<sentence_gap>[.?!](?=\w))'             # Ensure a space after sentence punctuation
+    r')'
+)
+
+# Removing an artifact can leave the spaces on either side of it next to each other
+_SPACE_RUN_PATTERN = re.compile(r' {2,}')
+
+def _replace_cleaning_match(match):
+    """Return the replacement for whichever cleaning rule matched"""
+    rule = match.lastgroup
+    if rule == 'sentence_gap':
+        return match.group() + ' '
+    if rule == 'blank_lines':
+        return '\n\n'
+    if rule == 'whitespace':
+        return ' '
+    return ''
+
+# Documents smaller than this are always extracted in-process
+PARALLEL_MIN_PAGES = 50
+
+_process_pool = None
+_process_pool_key = None
+_process_pool_lock = threading.Lock()
+
+def _get_process_pool(workers):
+    """Return the shared extraction process pool, creating it on first use in this process"""
+    global _process_pool, _process_pool_key
+
+    with _process_pool_lock:
+        pool_key = (os.getpid(), workers)
+        if _process_pool is None or _process_pool_key != pool_key:
+            # Spawn rather than fork: the web and job worker processes are multi-threaded
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _process_pool_key = pool_key
+        return _process_pool
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extract raw text for a range of pages using a document handle owned by this process"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [doc.load_page(page_num).get_text() for page_num in range(start, stop)]
+    finally:
+        doc.close()
 
 class PDFProcessor:
     """Service to extract text from PDF earnings transcripts"""
     
-    def __init__(self):
+    def __init__(self, workers=1):
         self.logger = logging.getLogger(__name__)
+        self.workers = workers
     
     def extract_text(self, pdf_path):
         """
@@ -14,56 +79,59 @@ class PDFProcessor:
         Returns cleaned transcript text
         """
         try:
-            # Open PDF document
-            doc = fitz.open(pdf_path)
-            full_text = ""
-            
-            # Extract text from all pages
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                full_text += text + "\n\n"
+            with metrics.stage('pdf_extraction') as stage:
+                stage.record(bytes=os.path.getsize(pdf_path))
+                page_texts = self._extract_raw_pages(pdf_path)
             
-            doc.close()
-            
-            # Clean and structure the text
-            cleaned_text = self._clean_transcript_text(full_text)
+                # Join once and clean in a single pass so cost stays linear in document size
+                cleaned_text = self._clean_transcript_text("\n\n".join(page_texts))
             
-            self.logger.info(f"Successfully extracted text from PDF: {pdf_path}")
-            self.logger.debug(f"Extracted text length: {len(cleaned_text)} characters")
+                stage.record(pages=len(page_texts))
+                
+                self.logger.info(f"Successfully extracted text from PDF: {pdf_path}")
+                self.logger.debug(f"Extracted text length: {len(cleaned_text)} characters from {len(page_texts)} pages")
             
-            return cleaned_text
+                return cleaned_text
             
         except Exception as e:
             self.logger.error(f"Error extracting text from PDF {pdf_path}: {str(e)}")
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
+    def _extract_raw_pages(self, pdf_path):
+        """Extract raw page texts, splitting page ranges across worker processes for large documents"""
+        doc = fitz.open(pdf_path)
+        try:
+            page_count = len(doc)
+            if self.workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+                return [doc.load_page(page_num).get_text() for page_num in range(page_count)]
+        finally:
+            doc.close()
+        
+        pages_per_worker = math.ceil(page_count / self.workers)
+        page_ranges = [
+            (start, min(start + pages_per_worker, page_count))
+            for start in range(0, page_count, pages_per_worker)
+        ]
+        
+        executor = _get_process_pool(self.workers)
+        futures = [
+            executor.submit(_extract_page_range, pdf_path, start, stop)
+            for start, stop in page_ranges
+        ]
+        page_texts = []
+        for future in futures:
+            page_texts.extend(future.result())
+        
+        self.logger.debug(f"Extracted {page_count} pages using {len(page_ranges)} worker processes")
+        return page_texts
+    
     def _clean_transcript_text(self, raw_text):
         """Clean and structure the extracted text"""
         try:
-            # Remove excessive whitespace and normalize line breaks
-            cleaned_text = re.sub(r'\n\s*\n', '\n\n', raw_text)
-            cleaned_text = re.sub(r'[ \t]+', ' ', cleaned_text)
-            
-            # Remove common PDF artifacts
-            cleaned_text = re.sub(r'Page \d+ of \d+', '', cleaned_text)
-            cleaned_text = re.sub(r'©.*?(?=\n)', '', cleaned_text)
-            
-            # Fix common OCR issues
-            cleaned_text = re.sub(r'(\w)-\s*\n\s*(\w)', r'\1\2', cleaned_text)  # Fix hyphenated words
-            
-            # Ensure proper spacing around sentences
-            cleaned_text = re.sub(r'\.(\w)', r'. \1', cleaned_text)
-            cleaned_text = re.sub(r'\?(\w)', r'? \1', cleaned_text)
-            cleaned_text = re.sub(r'!(\w)', r'! \1', cleaned_text)
-            
-            # Remove extra spaces
-            cleaned_text = re.sub(r' +', ' ', cleaned_text)
-            
-            # Trim and ensure consistent line endings
-            cleaned_text = cleaned_text.strip()
-            
-            return cleaned_text
+            # Whitespace normalization, PDF artifact removal, hyphenation and
+            # sentence spacing fixes are all applied in one precompiled pass
+            cleaned_text = _CLEANING_PATTERN.sub(_replace_cleaning_match, raw_text)
+            return _SPACE_RUN_PATTERN.sub(' ', cleaned_text).strip()
             
         except Exception as e:
             self.logger.warning(f"Error cleaning transcript text: {str(e)}")
@@ -106,6 +174,7 @@ class PDFProcessor:
             # Split text into potential sections
             paragraphs = text.split('\n\n')
             current_section = 'prepared_remarks'
+            section_paragraphs = {section_name: [] for section_name in sections}
             
             for paragraph in paragraphs:
                 paragraph_lower = paragraph.lower()
@@ -118,11 +187,11 @@ class PDFProcessor:
                 
                 # Add paragraph to current section
                 if paragraph.strip():
-                    sections[current_section] += paragraph + '\n\n'
+                    section_paragraphs[current_section].append(paragraph)
             
-            # Clean up sections
-            for section_name in sections:
-                sections[section_name] = sections[section_name].strip()
+            # Join and clean up sections
+            for section_name, parts in section_paragraphs.items():
+                sections[section_name] = '\n\n'.join(parts).strip()
             
             return sections
             
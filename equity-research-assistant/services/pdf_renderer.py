@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Per-process renderer state, set up once by the pool initializer
+_font_config = None
+
+def _init_renderer():
+    """Import WeasyPrint, load fonts and render a warm-up page so the first real render is fast"""
+    global _font_config
+    import weasyprint
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    weasyprint.HTML(string='<p>warm-up</p>').write_pdf(font_config=_font_config)
+
+def _render_pdf(html_content, file_path):
+    """Render HTML to a PDF file inside a renderer process"""
+    import weasyprint
+
+    weasyprint.HTML(string=html_content).write_pdf(file_path, font_config=_font_config)
+    return file_path
+
+
+class RendererBusyError(Exception):
+    """Raised when the render queue stays full for longer than the allowed wait"""
+
+
+class PDFRenderPool:
+    """Bounded pool of WeasyPrint renderer processes with a bounded queue in front of it"""
+
+    def __init__(self, workers=2, max_queued=8, queue_timeout=30.0):
+        self.logger = logging.getLogger(__name__)
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        # Renders running or waiting; submitters block (then fail) when the queue is full
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self.broken = False
+        # spawn keeps renderer processes free of the web process's threads and DB connections
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_renderer
+        )
+
+    def submit(self, html_content, file_path, fail_fast=True):
+        """
+        Queue a render and return a concurrent.futures.Future for the output path
+        While the queue is full this blocks, raising RendererBusyError after queue_timeout
+        seconds (or waiting for a free slot indefinitely when fail_fast is False)
+        The Future is how asyncio code awaits a render without blocking its event loop:
+            path = await asyncio.wrap_future(pool.submit(html_content, file_path))
+        The sync Flask routes and the batch runner wait on it through render()
+        """
+        acquired = self._slots.acquire(timeout=self.queue_timeout) if fail_fast else self._slots.acquire()
+        if not acquired:
+            raise RendererBusyError(f"PDF renderer queue is full ({self.workers} workers busy)")
+
+        try:
+            future = self._executor.submit(_render_pdf, html_content, file_path)
+        except Exception as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self.broken = True
+            raise
+        future.add_done_callback(self._on_render_done)
+        return future
+
+    def render(self, html_content, file_path, timeout=None, fail_fast=True):
+        """Render a PDF and wait for it; returns the output path"""
+        return self.submit(html_content, file_path, fail_fast=fail_fast).result(timeout)
+
+    def _on_render_done(self, future):
+        """Free the queue slot and note whether a renderer process crashed"""
+        self._slots.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self.broken = True
+
+    def shutdown(self, wait=True):
+        """Stop the renderer processes"""
+        self._executor.shutdown(wait=wait)
+
+
+_render_pool = None
+_render_pool_key = None
+_render_pool_lock = threading.Lock()
+
+def get_pdf_render_pool(workers, max_queued=8, queue_timeout=30.0):
+    """Return the shared renderer pool for this process, creating it on first use"""
+    global _render_pool, _render_pool_key
+
+    with _render_pool_lock:
+        pool_key = (os.getpid(), workers, max_queued, queue_timeout)
+        # A crashed renderer leaves the executor unusable, so replace the pool
+        if _render_pool is None or _render_pool_key != pool_key or _render_pool.broken:
+            if _render_pool is not None and _render_pool_key[0] == os.getpid():
+                _render_pool.shutdown(wait=False)
+            _render_pool = PDFRenderPool(workers, max_queued, queue_timeout)
+            _render_pool_key = pool_key
+        return _render_pool
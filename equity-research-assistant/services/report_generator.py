@@ -1,11 +1,92 @@
 import os
 import json
+import hashlib
 import logging
 from datetime import datetime
 from docx import Document
 from docx.shared import Inches
 import weasyprint
-from jinja2 import Template
+from flask import current_app, has_app_context
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, meta, nodes
+from services.pdf_renderer import get_pdf_render_pool
+from services.docx_writer import DocxReportWriter
+from services.metrics import metrics
+
+# Report layouts, rendered from templates/reports/<name>.html
+REPORT_TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'reports')
+REPORT_LAYOUTS = ('default', 'compact')
+DEFAULT_LAYOUT = 'default'
+
+# Template output events buffered into each streamed chunk
+STREAM_BUFFER_SIZE = 20
+
+# Bump when the report model or the way a section is computed changes, so stored models are rebuilt
+REPORT_MODEL_VERSION = 1
+
+# Computed report sections and the inputs each depends on ("input.field" depends on one field only).
+# A stored section is reused until the fingerprint of its inputs changes.
+REPORT_SECTION_INPUTS = {
+    'financial_summary': ('financial_data',),
+    'key_metrics': ('financial_data',),
+    'investment_thesis': (
+        'transcript_analysis.strategic_themes',
+        'transcript_analysis.market_dynamics',
+        'transcript_analysis.financial_highlights'
+    ),
+    'executive_summary': ('company_name', 'quarter', 'financial_data', 'transcript_analysis'),
+    'risk_analysis': ('financial_data', 'transcript_analysis')
+}
+
+# Sections written by the LLM when an analyzer is given, with the prompt each uses
+LLM_SECTION_PROMPTS = {
+    'executive_summary': 'executive_summary',
+    'risk_analysis': 'risk_analysis'
+}
+
+# Shared by all generators: templates are compiled once per process and the
+# compiled bytecode is cached on disk so new processes skip compilation too.
+# Autoescaping stays off because report fields may contain LLM-formatted markup.
+report_environment = Environment(
+    loader=FileSystemLoader(REPORT_TEMPLATE_FOLDER),
+    bytecode_cache=FileSystemBytecodeCache(),
+    autoescape=False
+)
+
+
+def get_report_template(layout=DEFAULT_LAYOUT):
+    """Return the compiled template for a report layout"""
+    if layout not in REPORT_LAYOUTS:
+        raise ValueError(f"Unknown report layout: {layout}")
+    return report_environment.get_template(f"{layout}.html")
+
+
+def fingerprint(value):
+    """SHA-256 of a JSON-serializable value, used to detect changed report inputs"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Per layout: (template, {block name: variables the block reads}), refreshed when the template reloads
+_block_variables = {}
+
+def get_block_variables(layout=DEFAULT_LAYOUT):
+    """Return the top-level template variables read by each block of a report layout"""
+    template = get_report_template(layout)
+    cached = _block_variables.get(layout)
+    if cached and cached[0] is template:
+        return cached[1]
+
+    source, _, _ = report_environment.loader.get_source(report_environment, f"{layout}.html")
+    template_hash = fingerprint(source)
+    block_variables = {}
+    for block in report_environment.parse(source).find_all(nodes.Block):
+        block_ast = nodes.Template(block.body).set_environment(report_environment)
+        # The template source is part of every block's inputs, so editing a layout re-renders it
+        block_variables[block.name] = (template_hash, tuple(sorted(meta.find_undeclared_variables(block_ast))))
+
+    _block_variables[layout] = (template, block_variables)
+    return block_variables
+
 
 class ReportGenerator:
     """Service to generate final equity research reports"""
@@ -13,78 +94,195 @@ class ReportGenerator:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
-    def generate_report(self, company_name, quarter, financial_data, transcript_analysis):
+    def generate_report(self, company_name, quarter, financial_data, transcript_analysis, llm_analyzer=None, layout=DEFAULT_LAYOUT):
         """
         Generate complete equity research report
+        When an AsyncLLMAnalyzer is given, the executive summary and risk analysis
+        are written by the LLM concurrently
         Returns HTML report content
         """
+        html_report, _ = self.generate_report_with_data(
+            company_name, quarter, financial_data, transcript_analysis, llm_analyzer, layout
+        )
+        return html_report
+    
+    def generate_report_with_data(self, company_name, quarter, financial_data, transcript_analysis, llm_analyzer=None, layout=DEFAULT_LAYOUT, report_model=None):
+        """
+        Generate the report as in generate_report
+        When the report model stored with an earlier report is given, only sections whose
+        inputs changed are recomputed and only template blocks reading them are re-rendered
+        Returns (HTML report content, updated report model)
+        """
         try:
-            # Prepare report data
-            report_data = {
-                'company_name': company_name,
-                'quarter': quarter,
-                'generated_date': datetime.now().strftime('%B %d, %Y'),
-                'financial_data': financial_data,
-                'transcript_analysis': transcript_analysis,
-                'executive_summary': self._generate_executive_summary(
-                    company_name, quarter, financial_data, transcript_analysis
-                ),
-                'financial_summary': self._create_financial_summary_table(financial_data),
-                'key_metrics': self._extract_key_metrics(financial_data),
-                'investment_thesis': self._generate_investment_thesis(transcript_analysis)
-            }
+            with metrics.stage('report_generation'):
+                report_model = self.update_report_model(
+                    report_model, company_name, quarter, financial_data, transcript_analysis, llm_analyzer
+                )
             
-            # Generate HTML report
-            html_report = self._generate_html_report(report_data)
+                # Generate HTML report
+                fragments = report_model['fragments'].setdefault(layout, {})
+                html_report = self.render_html(report_model['data'], layout, fragments)
             
-            self.logger.info(f"Successfully generated report for {company_name} {quarter}")
-            return html_report
+                self.logger.info(f"Successfully generated report for {company_name} {quarter}")
+                return html_report, report_model
             
         except Exception as e:
             self.logger.error(f"Error generating report: {str(e)}")
             raise Exception(f"Failed to generate report: {str(e)}")
     
-    def export_to_pdf(self, html_content, company_name, quarter, download_folder):
-        """Export report to PDF format"""
+    def build_report_data(self, company_name, quarter, financial_data, transcript_analysis, llm_analyzer=None):
+        """Assemble the values rendered by the report templates"""
+        return self.update_report_model(None, company_name, quarter, financial_data, transcript_analysis, llm_analyzer)['data']
+    
+    def update_report_model(self, report_model, company_name, quarter, financial_data, transcript_analysis, llm_analyzer=None):
+        """
+        Bring a report model up to date with its inputs
+        The model holds the report data, the input fingerprint each section was computed from
+        and rendered template blocks; sections whose fingerprint still matches are reused
+        """
+        if not report_model or report_model.get('version') != REPORT_MODEL_VERSION:
+            report_model = {'version': REPORT_MODEL_VERSION, 'sections': {}, 'data': {}, 'fragments': {}}
+        
+        transcript_analysis = transcript_analysis or {}
+        inputs = {
+            'company_name': company_name,
+            'quarter': quarter,
+            'financial_data': financial_data,
+            'transcript_analysis': transcript_analysis
+        }
+        
+        section_fingerprints = {}
+        for section, dependencies in REPORT_SECTION_INPUTS.items():
+            values = [self._resolve_input(inputs, dependency) for dependency in dependencies]
+            # LLM sections also depend on their (user-editable) prompt
+            if llm_analyzer is not None and section in LLM_SECTION_PROMPTS:
+                from models import PromptTemplate
+                values.append(PromptTemplate.get_prompt(LLM_SECTION_PROMPTS[section]))
+            section_fingerprints[section] = fingerprint(values)
+        
+        data = dict(report_model['data'])
+        sections = dict(report_model['sections'])
+        stale = [
+            section for section, section_fingerprint in section_fingerprints.items()
+            if sections.get(section) != section_fingerprint or section not in data
+        ]
+        
+        data.update(inputs)
+        if stale or 'generated_date' not in data:
+            data['generated_date'] = datetime.now().strftime('%B %d, %Y')
+        
+        llm_sections = {}
+        stale_llm_sections = [section for section in stale if section in LLM_SECTION_PROMPTS]
+        if llm_analyzer is not None and stale_llm_sections:
+            llm_sections = llm_analyzer.generate_report_sections(
+                financial_data, transcript_analysis, company_name, quarter, sections=stale_llm_sections
+            )
+        
+        for section in stale:
+            if section == 'financial_summary':
+                data[section] = self._create_financial_summary_table(financial_data)
+            elif section == 'key_metrics':
+                data[section] = self._extract_key_metrics(financial_data)
+            elif section == 'investment_thesis':
+                data[section] = self._generate_investment_thesis(transcript_analysis)
+            elif section == 'executive_summary':
+                data[section] = llm_sections.get(section) or self._generate_executive_summary(
+                    company_name, quarter, financial_data, transcript_analysis
+                )
+            elif section == 'risk_analysis':
+                data[section] = llm_sections.get(section)
+            
+            # A failed LLM section keeps no fingerprint, so the next update retries it
+            if llm_analyzer is not None and section in LLM_SECTION_PROMPTS and llm_sections.get(section) is None:
+                sections.pop(section, None)
+            else:
+                sections[section] = section_fingerprints[section]
+        
+        if stale:
+            self.logger.info(f"Recomputed report sections for {company_name} {quarter}: {', '.join(stale)}")
+        
+        return {
+            'version': REPORT_MODEL_VERSION,
+            'sections': sections,
+            'data': data,
+            'fragments': report_model.get('fragments') or {}
+        }
+    
+    def _resolve_input(self, inputs, dependency):
+        """Look up a report input, or one field of it for "input.field" dependencies"""
+        name, _, field = dependency.partition('.')
+        value = inputs.get(name)
+        if field:
+            return (value or {}).get(field)
+        return value
+    
+    def export_filename(self, company_name, quarter, extension):
+        """File name used for exported reports"""
+        return f"{company_name}_{quarter}_Research_Report_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    
+    def export_to_pdf(self, html_content, company_name, quarter, download_folder, fail_fast=True):
+        """
+        Export report to PDF format
+        fail_fast=False waits for a free renderer however long the queue is (for batch exports)
+        instead of raising RendererBusyError
+        """
         try:
-            filename = f"{company_name}_{quarter}_Research_Report_{datetime.now().strftime('%Y%m%d')}.pdf"
-            file_path = os.path.join(download_folder, filename)
+            with metrics.stage('pdf_export') as stage:
+                filename = self.export_filename(company_name, quarter, 'pdf')
+                file_path = os.path.join(download_folder, filename)
             
-            # Convert HTML to PDF using weasyprint
-            weasyprint.HTML(string=html_content).write_pdf(file_path)
+                # Convert HTML to PDF using weasyprint, in the renderer pool when one is configured
+                render_pool = self._get_render_pool()
+                if render_pool:
+                    render_pool.render(html_content, file_path, fail_fast=fail_fast)
+                else:
+                    weasyprint.HTML(string=html_content).write_pdf(file_path)
             
-            self.logger.info(f"Successfully exported PDF report: {file_path}")
-            return file_path
+                stage.record(bytes=os.path.getsize(file_path))
+                self.logger.info(f"Successfully exported PDF report: {file_path}")
+                return file_path
             
         except Exception as e:
             self.logger.error(f"Error exporting to PDF: {str(e)}")
             raise Exception(f"Failed to export PDF: {str(e)}")
     
-    def export_to_docx(self, html_content, company_name, quarter, download_folder):
-        """Export report to Word document format"""
+    def export_to_docx(self, html_content, company_name, quarter, download_folder, report_data=None):
+        """
+        Export report to Word document format
+        When the report data is available the document is built from it directly,
+        with real tables and bullets; otherwise the HTML is converted
+        """
         try:
-            filename = f"{company_name}_{quarter}_Research_Report_{datetime.now().strftime('%Y%m%d')}.docx"
-            file_path = os.path.join(download_folder, filename)
+            with metrics.stage('docx_export') as stage:
+                filename = self.export_filename(company_name, quarter, 'docx')
+                file_path = os.path.join(download_folder, filename)
+            
+                if report_data:
+                    DocxReportWriter().write(report_data, file_path)
+                    stage.record(bytes=os.path.getsize(file_path))
+                    self.logger.info(f"Successfully exported Word document: {file_path}")
+                    return file_path
             
-            # Create Word document
-            doc = Document()
+                # Create Word document
+                doc = Document()
             
-            # Add title
-            title = doc.add_heading(f'{company_name} - {quarter} Equity Research Report', 0)
+                # Add title
+                title = doc.add_heading(f'{company_name} - {quarter} Equity Research Report', 0)
             
-            # Add generation date
-            doc.add_paragraph(f'Generated on: {datetime.now().strftime("%B %d, %Y")}')
-            doc.add_paragraph('')
+                # Add generation date
+                doc.add_paragraph(f'Generated on: {datetime.now().strftime("%B %d, %Y")}')
+                doc.add_paragraph('')
             
-            # Parse HTML content and add to document
-            # This is a simplified conversion - in production, you might want a more sophisticated HTML to DOCX converter
-            self._add_html_content_to_docx(doc, html_content)
+                # Parse HTML content and add to document
+                # This is a simplified conversion - in production, you might want a more sophisticated HTML to DOCX converter
+                self._add_html_content_to_docx(doc, html_content)
             
-            # Save document
-            doc.save(file_path)
+                # Save document
+                doc.save(file_path)
+                stage.record(bytes=os.path.getsize(file_path))
             
-            self.logger.info(f"Successfully exported Word document: {file_path}")
-            return file_path
+                self.logger.info(f"Successfully exported Word document: {file_path}")
+                return file_path
             
         except Exception as e:
             self.logger.error(f"Error exporting to Word: {str(e)}")
@@ -116,6 +314,20 @@ class ReportGenerator:
             self.logger.warning(f"Error generating executive summary: {str(e)}")
             return f"Executive summary for {company_name} {quarter} earnings analysis."
     
+    def _get_render_pool(self):
+        """Return the shared PDF renderer pool, or None to render in this process"""
+        if not has_app_context():
+            return None
+        
+        config = current_app.config
+        if config.get('PDF_RENDER_WORKERS', 0) <= 0:
+            return None
+        return get_pdf_render_pool(
+            config['PDF_RENDER_WORKERS'],
+            config['PDF_RENDER_MAX_QUEUED'],
+            config['PDF_RENDER_QUEUE_TIMEOUT']
+        )
+    
     def _create_financial_summary_table(self, financial_data):
         """Create formatted financial summary table"""
         if not financial_data or 'line_items' not in financial_data:
@@ -157,113 +369,41 @@ class ReportGenerator:
         
         return thesis_points
     
-    def _generate_html_report(self, report_data):
-        """Generate HTML report using template"""
-        template_str = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>{{ company_name }} - {{ quarter }} Research Report</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 40px; color: #333; }
-                .header { border-bottom: 2px solid #007bff; padding-bottom: 20px; margin-bottom: 30px; }
-                .company-name { font-size: 28px; font-weight: bold; color: #007bff; }
-                .quarter { font-size: 20px; color: #666; }
-                .section { margin-bottom: 30px; }
-                .section-title { font-size: 18px; font-weight: bold; color: #007bff; margin-bottom: 15px; border-bottom: 1px solid #ddd; padding-bottom: 5px; }
-                .financial-table { width: 100%; border-collapse: collapse; margin-bottom: 20px; }
-                .financial-table th, .financial-table td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-                .financial-table th { background-color: #f8f9fa; font-weight: bold; }
-                .content { line-height: 1.6; }
-                .metric-item { margin-bottom: 10px; }
-                .metric-label { font-weight: bold; }
-                .footer { margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <div class="company-name">{{ company_name }}</div>
-                <div class="quarter">{{ quarter }} Equity Research Report</div>
-                <div style="margin-top: 10px; color: #666;">Generated on {{ generated_date }}</div>
-            </div>
-
-            <div class="section">
-                <div class="section-title">Executive Summary</div>
-                <div class="content">{{ executive_summary }}</div>
-            </div>
-
-            <div class="section">
-                <div class="section-title">Financial Summary</div>
-                {% if financial_summary %}
-                <table class="financial-table">
-                    <thead>
-                        <tr>
-                            <th>Metric</th>
-                            <th>Previous Quarter</th>
-                            <th>Analyst Estimate</th>
-                            <th>Actual</th>
-                            <th>Variance</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {% for row in financial_summary %}
-                        <tr>
-                            <td>{{ row.metric }}</td>
-                            <td>{{ row.previous }}</td>
-                            <td>{{ row.estimate }}</td>
-                            <td>{{ row.actual }}</td>
-                            <td>{{ row.variance }}</td>
-                        </tr>
-                        {% endfor %}
-                    </tbody>
-                </table>
-                {% else %}
-                <p>Financial data not available.</p>
-                {% endif %}
-            </div>
-
-            <div class="section">
-                <div class="section-title">Management Commentary</div>
-                <div class="content">{{ transcript_analysis.management_commentary or 'No commentary available.' }}</div>
-            </div>
-
-            <div class="section">
-                <div class="section-title">Strategic Themes</div>
-                <div class="content">{{ transcript_analysis.strategic_themes or 'No strategic themes identified.' }}</div>
-            </div>
-
-            <div class="section">
-                <div class="section-title">Risks and Tailwinds</div>
-                <div class="content">{{ transcript_analysis.risks_and_tailwinds or 'No risks or tailwinds identified.' }}</div>
-            </div>
-
-            <div class="section">
-                <div class="section-title">Q&A Insights</div>
-                <div class="content">{{ transcript_analysis.qa_insights or 'No Q&A insights available.' }}</div>
-            </div>
-
-            {% if investment_thesis %}
-            <div class="section">
-                <div class="section-title">Investment Thesis</div>
-                <div class="content">
-                    {% for point in investment_thesis %}
-                    <div class="metric-item">• {{ point }}</div>
-                    {% endfor %}
-                </div>
-            </div>
-            {% endif %}
-
-            <div class="footer">
-                <p><strong>Disclaimer:</strong> This research report is generated using automated analysis tools and should be used for informational purposes only. Please conduct your own due diligence before making investment decisions.</p>
-                <p>Report generated on {{ generated_date }} using AI-powered equity research tools.</p>
-            </div>
-        </body>
-        </html>
+    def render_html(self, report_data, layout=DEFAULT_LAYOUT, fragments=None):
+        """
+        Render report data to HTML with the given layout
+        With a fragments dict (block name -> [fingerprint, html]) from an earlier render, blocks
+        whose variables are unchanged are reused; re-rendered blocks are stored back into it
         """
+        template = get_report_template(layout)
+        if fragments is None:
+            return template.render(**report_data)
         
-        template = Template(template_str)
-        return template.render(**report_data)
+        context = template.new_context(report_data)
+        block_variables = get_block_variables(layout)
+        for name in set(fragments) - set(block_variables):
+            del fragments[name]
+        
+        rendered = {}
+        for name, (template_hash, variables) in block_variables.items():
+            block_fingerprint = fingerprint([template_hash, [report_data.get(variable) for variable in variables]])
+            cached = fragments.get(name)
+            if cached and cached[0] == block_fingerprint:
+                rendered[name] = cached[1]
+            else:
+                rendered[name] = ''.join(template.blocks[name](context))
+                fragments[name] = [block_fingerprint, rendered[name]]
+        
+        # Render the page around the blocks, splicing in the stored block output
+        for name, html in rendered.items():
+            context.blocks[name] = [lambda block_context, html=html: iter((html,))]
+        return ''.join(template.root_render_func(context))
+    
+    def stream_html(self, report_data, layout=DEFAULT_LAYOUT, buffer_size=STREAM_BUFFER_SIZE):
+        """Render report data to HTML as a generator of chunks, for streaming responses"""
+        stream = get_report_template(layout).stream(**report_data)
+        stream.enable_buffering(buffer_size)
+        return stream
     
     def _add_html_content_to_docx(self, doc, html_content):
         """Add simplified HTML content to Word document"""
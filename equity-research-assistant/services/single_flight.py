@@ -0,0 +1,142 @@
+import os
+import time
+import fcntl
+import errno
+import hashlib
+import logging
+from contextlib import contextmanager
+from services.metrics import metrics
+
+# Followers poll the leader's lock at this interval, backing off to the maximum
+POLL_INITIAL_SECONDS = 0.05
+POLL_MAX_SECONDS = 0.5
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work across threads and worker processes
+    The first caller for a key (the leader) takes an exclusive lock file and does the work; callers
+    arriving meanwhile (followers) wait for the lock and then read the result the leader stored,
+    e.g. in the database or the LLM response cache, instead of repeating the work
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._folder = None
+        self._wait_seconds = 900.0
+
+    def configure(self, folder, wait_seconds=900.0):
+        """Set the lock folder (None disables coalescing) and how long followers wait for a leader"""
+        self._folder = folder
+        self._wait_seconds = wait_seconds
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def run(self, key, compute, lookup):
+        """
+        Return lookup() if a result for key is already stored, else compute() under the key's lock
+        Followers call lookup() once the leader finishes; if it still returns None (the leader failed)
+        they compute themselves. A follower that waits longer than the configured limit computes too.
+        """
+        kind = key.split(':', 1)[0]
+        if not self._folder:
+            return compute()
+
+        lock_fd, waited = self._acquire(key)
+        if lock_fd is None:
+            self.logger.warning(f"Gave up waiting for in-flight {kind} after {self._wait_seconds:.0f}s; computing it again")
+            metrics.inc('single_flight_total', {'kind': kind, 'role': 'timeout'})
+            return compute()
+
+        try:
+            result = lookup()
+            if result is not None:
+                metrics.inc('single_flight_total', {'kind': kind, 'role': 'follower' if waited else 'stored'})
+                return result
+            metrics.inc('single_flight_total', {'kind': kind, 'role': 'leader'})
+            return compute()
+        finally:
+            self._release(key, lock_fd)
+
+    @contextmanager
+    def run_many(self, keys, lookup):
+        """
+        Hold the locks of several keys at once, for work that is computed as one batch
+        Yields a dict of the keys lookup(key) now finds a result for, stored before the call or by a
+        leader it waited for; the caller computes and stores the others before leaving the block.
+        Locks are taken in sorted order, so batches that share keys cannot deadlock.
+        """
+        held = []
+        found = {}
+        try:
+            for key in (sorted(set(keys)) if self._folder else ()):
+                kind = key.split(':', 1)[0]
+                lock_fd, waited = self._acquire(key)
+                if lock_fd is None:
+                    self.logger.warning(f"Gave up waiting for in-flight {kind} after {self._wait_seconds:.0f}s; computing it again")
+                    metrics.inc('single_flight_total', {'kind': kind, 'role': 'timeout'})
+                    continue
+                held.append((key, lock_fd))
+                result = lookup(key)
+                if result is not None:
+                    found[key] = result
+                    metrics.inc('single_flight_total', {'kind': kind, 'role': 'follower' if waited else 'stored'})
+                else:
+                    metrics.inc('single_flight_total', {'kind': kind, 'role': 'leader'})
+            yield found
+        finally:
+            for key, lock_fd in held:
+                self._release(key, lock_fd)
+
+    def _lock_path(self, key):
+        return os.path.join(self._folder, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.lock")
+
+    def _acquire(self, key):
+        """
+        Lock the key's file, waiting up to the configured limit
+        Returns (file descriptor or None on timeout, whether another caller held the lock)
+        """
+        path = self._lock_path(key)
+        deadline = time.monotonic() + self._wait_seconds
+        waited = False
+        delay = POLL_INITIAL_SECONDS
+        while True:
+            lock_fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except OSError as e:
+                        if e.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                        waited = True
+                        if time.monotonic() >= deadline:
+                            os.close(lock_fd)
+                            return None, waited
+                        time.sleep(delay)
+                        delay = min(POLL_MAX_SECONDS, delay * 2)
+            except Exception:
+                os.close(lock_fd)
+                raise
+
+            # The previous holder removes the file on release; a lock on a removed file protects nothing
+            try:
+                if os.fstat(lock_fd).st_ino == os.stat(path).st_ino:
+                    return lock_fd, waited
+            except FileNotFoundError:
+                pass
+            os.close(lock_fd)
+
+    def _release(self, key, lock_fd):
+        """Remove the lock file while still holding it, so lock files do not accumulate"""
+        try:
+            os.unlink(self._lock_path(key))
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(lock_fd)
+
+
+# Process-wide coordinator used by the analysis pipeline
+single_flight = SingleFlight()
@@ -0,0 +1,277 @@
+import os
+import shutil
+import logging
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from models import (
+    ResearchSession, LineItem, AnalysisSection, AnalysisJob, ParsedArtifact, StorageUsage
+)
+from services.artifact_store import ArtifactStore, UPLOAD_USAGE_AREA
+from services.export_cache import ExportCache
+
+# Sessions deleted per statement while expiring old sessions
+DELETE_BATCH_SIZE = 500
+
+class RetentionManager:
+    """
+    Garbage collection for research data on disk and in the database
+    Upload blobs are reference counted from ResearchSession: a blob no session points to is an
+    orphan, and orphans are deleted once they have not been touched for the grace period
+    """
+
+    def __init__(self, session_retention_days=None, orphan_grace_seconds=None, artifact_retention_days=None,
+                 batch_output_retention_days=None):
+        self.logger = logging.getLogger(__name__)
+        config = current_app.config
+        self.session_retention_days = session_retention_days if session_retention_days is not None else config['SESSION_RETENTION_DAYS']
+        self.orphan_grace_seconds = orphan_grace_seconds if orphan_grace_seconds is not None else config['UPLOAD_ORPHAN_GRACE_SECONDS']
+        self.artifact_retention_days = artifact_retention_days if artifact_retention_days is not None else config['ARTIFACT_RETENTION_DAYS']
+        self.batch_output_retention_days = batch_output_retention_days if batch_output_retention_days is not None else config['BATCH_OUTPUT_RETENTION_DAYS']
+        self.artifact_store = ArtifactStore()
+        self.export_cache = ExportCache()
+        self.batch_folder = os.path.join(config['DOWNLOAD_FOLDER'], 'batches')
+
+    def referenced_hashes(self):
+        """Content hashes of every upload still referenced by a session"""
+        hashes = set()
+        rows = db.session.query(ResearchSession.excel_hash, ResearchSession.pdf_hash, ResearchSession.summary_hash)
+        for row in rows:
+            hashes.update(content_hash for content_hash in row if content_hash)
+        return hashes
+
+    def referenced_legacy_files(self):
+        """File names of uploads saved before content hashing that sessions still use"""
+        names = set()
+        rows = db.session.query(
+            ResearchSession.excel_filename, ResearchSession.excel_hash,
+            ResearchSession.pdf_filename, ResearchSession.pdf_hash,
+            ResearchSession.summary_filename, ResearchSession.summary_hash
+        )
+        for row in rows:
+            for filename, content_hash in zip(row[::2], row[1::2]):
+                if filename and not content_hash:
+                    names.add(filename)
+        return names
+
+    def collect(self, dry_run=False):
+        """Run every retention step; returns counts of what was (or would be) removed"""
+        stats = {'sessions': self.expire_sessions(dry_run)}
+        stats['upload_files'], stats['upload_bytes'] = self.sweep_uploads(dry_run)
+        stats['artifacts'] = self.sweep_artifacts(dry_run)
+        stats['download_files'], stats['download_bytes'] = self.sweep_downloads(dry_run)
+        if not dry_run:
+            # Sweeps subtract what they delete, including blobs stored before usage was tracked, so
+            # replace the running total with a fresh count rather than let it drift
+            total_bytes, file_count = self.count_usage()
+            StorageUsage.reset(UPLOAD_USAGE_AREA, total_bytes, file_count)
+            db.session.commit()
+        return stats
+
+    def expire_sessions(self, dry_run=False):
+        """Delete sessions (and their rows in child tables) not updated for SESSION_RETENTION_DAYS"""
+        if not self.session_retention_days:
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(days=self.session_retention_days)
+        session_ids = [
+            session_id for (session_id,) in
+            db.session.query(ResearchSession.session_id).filter(ResearchSession.updated_at < cutoff)
+        ]
+        if dry_run or not session_ids:
+            return len(session_ids)
+
+        for start in range(0, len(session_ids), DELETE_BATCH_SIZE):
+            batch = session_ids[start:start + DELETE_BATCH_SIZE]
+            for model in (LineItem, AnalysisSection, AnalysisJob, ResearchSession):
+                model.query.filter(model.session_id.in_(batch)).delete(synchronize_session=False)
+            db.session.commit()
+
+        self.logger.info(f"Expired {len(session_ids)} research session(s) older than {self.session_retention_days} days")
+        return len(session_ids)
+
+    def sweep_uploads(self, dry_run=False):
+        """
+        Delete upload blobs no session references, plus legacy per-session files and
+        interrupted upload temp files, once older than the grace period
+        Returns (files removed, bytes removed)
+        """
+        referenced = self.referenced_hashes()
+        referenced_legacy = self.referenced_legacy_files()
+        cutoff = time.time() - self.orphan_grace_seconds
+
+        orphans = [
+            entry for entry in self.artifact_store.iter_blobs()
+            if self.artifact_store.blob_hash(entry.name) not in referenced
+        ]
+        removed_blobs, removed_blob_bytes = self._remove_files(orphans, cutoff, dry_run)
+
+        # Legacy uploads and temp files live directly in the upload and blob folders
+        loose_files = []
+        for folder in (self.artifact_store.upload_folder, self.artifact_store.blob_folder):
+            if os.path.isdir(folder):
+                loose_files.extend(
+                    entry for entry in os.scandir(folder)
+                    if entry.is_file() and not entry.name.startswith('.') and entry.name not in referenced_legacy
+                )
+        removed_loose, removed_loose_bytes = self._remove_files(loose_files, cutoff, dry_run)
+
+        if removed_blobs and not dry_run:
+            StorageUsage.record(UPLOAD_USAGE_AREA, -removed_blob_bytes, -removed_blobs)
+            db.session.commit()
+        if removed_blobs or removed_loose:
+            self.logger.info(f"Removed {removed_blobs + removed_loose} orphaned upload file(s)")
+        return removed_blobs + removed_loose, removed_blob_bytes + removed_loose_bytes
+
+    def sweep_artifacts(self, dry_run=False):
+        """Delete parsed artifacts of unreferenced uploads not used for ARTIFACT_RETENTION_DAYS"""
+        if not self.artifact_retention_days:
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(days=self.artifact_retention_days)
+        referenced = self.referenced_hashes()
+        stale_ids = [
+            artifact_id for artifact_id, content_hash in
+            db.session.query(ParsedArtifact.id, ParsedArtifact.content_hash).filter(ParsedArtifact.last_used_at < cutoff)
+            if content_hash not in referenced
+        ]
+        if dry_run or not stale_ids:
+            return len(stale_ids)
+
+        for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+            batch = stale_ids[start:start + DELETE_BATCH_SIZE]
+            ParsedArtifact.query.filter(ParsedArtifact.id.in_(batch)).delete(synchronize_session=False)
+            db.session.commit()
+        return len(stale_ids)
+
+    def sweep_downloads(self, dry_run=False):
+        """
+        Evict expired report exports, remove interrupted export folders and, when
+        BATCH_OUTPUT_RETENTION_DAYS is set, batch output folders older than that
+        Returns (files removed, bytes removed)
+        """
+        removed, removed_bytes = 0, 0
+        # The export cache evicts on its own size and age limits, so a dry run only reports batch outputs
+        if not dry_run:
+            removed += self.export_cache.evict()
+            self.export_cache.remove_stale_work_folders()
+
+        if self.batch_output_retention_days and os.path.isdir(self.batch_folder):
+            cutoff = time.time() - self.batch_output_retention_days * 24 * 3600
+            for entry in os.scandir(self.batch_folder):
+                if not entry.is_dir() or entry.stat().st_mtime >= cutoff:
+                    continue
+                for root, _, files in os.walk(entry.path):
+                    removed += len(files)
+                    removed_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        return removed, removed_bytes
+
+    def release_session(self, content_hashes):
+        """
+        Delete the upload blobs of a removed session that no other session references
+        Blobs touched within the grace period are left to the next sweep, as a concurrent
+        upload of the same content may not have been committed yet
+        """
+        content_hashes = {content_hash for content_hash in content_hashes if content_hash}
+        if not content_hashes:
+            return 0
+
+        still_referenced = self.referenced_hashes()
+        released = self.artifact_store.find_blobs(content_hashes - still_referenced)
+        removed, removed_bytes = self._remove_files(released, time.time() - self.orphan_grace_seconds)
+        if removed:
+            StorageUsage.record(UPLOAD_USAGE_AREA, -removed_bytes, -removed)
+            db.session.commit()
+        return removed
+
+    def compact(self):
+        """
+        Move legacy per-session uploads and flat-layout exports into the sharded layouts,
+        remove empty shard folders and recount upload usage
+        Returns counts of what was changed
+        """
+        stats = {'migrated_uploads': 0, 'migrated_exports': 0, 'removed_folders': 0}
+
+        # Legacy uploads still used by a session are hashed into the blob store
+        legacy_sessions = ResearchSession.query.filter(db.or_(
+            db.and_(ResearchSession.excel_filename.isnot(None), ResearchSession.excel_hash.is_(None)),
+            db.and_(ResearchSession.pdf_filename.isnot(None), ResearchSession.pdf_hash.is_(None)),
+            db.and_(ResearchSession.summary_filename.isnot(None), ResearchSession.summary_hash.is_(None))
+        )).all()
+        for research_session in legacy_sessions:
+            for kind in ('excel', 'pdf', 'summary'):
+                filename = getattr(research_session, f"{kind}_filename")
+                legacy_path = os.path.join(self.artifact_store.upload_folder, filename) if filename else None
+                if getattr(research_session, f"{kind}_hash") or not legacy_path or not os.path.isfile(legacy_path):
+                    continue
+                setattr(research_session, f"{kind}_hash", self.artifact_store.save_file(legacy_path))
+                db.session.commit()
+                os.remove(legacy_path)
+                stats['migrated_uploads'] += 1
+
+        # Exports cached before sharding are moved into their shard
+        cache_folder = self.export_cache.cache_folder
+        if os.path.isdir(cache_folder):
+            for entry in os.scandir(cache_folder):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    shard_path = os.path.join(cache_folder, entry.name[:2], entry.name)
+                    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+                    os.replace(entry.path, shard_path)
+                    stats['migrated_exports'] += 1
+
+        for folder in (self.artifact_store.blob_folder, cache_folder):
+            if not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                if entry.is_dir() and not entry.name.startswith('.') and not os.listdir(entry.path):
+                    os.rmdir(entry.path)
+                    stats['removed_folders'] += 1
+
+        total_bytes, file_count = self.count_usage()
+        StorageUsage.reset(UPLOAD_USAGE_AREA, total_bytes, file_count)
+        db.session.commit()
+        stats['upload_bytes'], stats['upload_files'] = total_bytes, file_count
+        return stats
+
+    def count_usage(self):
+        """Walk the blob store and return (total bytes, file count)"""
+        total_bytes, file_count = 0, 0
+        for entry in self.artifact_store.iter_blobs():
+            total_bytes += entry.stat().st_size
+            file_count += 1
+        return total_bytes, file_count
+
+    def usage(self):
+        """Disk usage summary for the upload and download areas"""
+        upload_bytes, upload_files = StorageUsage.get_usage(UPLOAD_USAGE_AREA)
+        export_bytes, export_files = 0, 0
+        for entry in self.export_cache.iter_entries():
+            export_bytes += entry.stat().st_size
+            export_files += 1
+        return {
+            'upload_bytes': upload_bytes,
+            'upload_files': upload_files,
+            'upload_quota_bytes': self.artifact_store.quota_bytes,
+            'export_bytes': export_bytes,
+            'export_files': export_files,
+            'export_max_bytes': self.export_cache.max_bytes
+        }
+
+    def _remove_files(self, entries, cutoff, dry_run=False):
+        """Delete the given files last modified before cutoff; returns (files, bytes)"""
+        removed, removed_bytes = 0, 0
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                if stat.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            removed_bytes += stat.st_size
+        return removed, removed_bytes
@@ -0,0 +1,121 @@
+import re
+import logging
+from services.pdf_processor import PDFProcessor
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency; fall back to a character-based estimate
+    tiktoken = None
+
+# Human readable labels for the sections produced by PDFProcessor.extract_sections
+SECTION_LABELS = {
+    'prepared_remarks': 'prepared remarks',
+    'management_discussion': 'management discussion',
+    'qa_session': 'Q&A session',
+    'forward_looking_statements': 'forward-looking statements'
+}
+
+class TranscriptChunker:
+    """Split earnings transcripts into token-bounded chunks that follow section boundaries"""
+
+    def __init__(self, max_tokens=4000, model="gpt-4o"):
+        self.logger = logging.getLogger(__name__)
+        self.max_tokens = max_tokens
+        self._encoding = None
+
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                self.logger.debug(f"tiktoken encoding unavailable for {model}, estimating tokens: {str(e)}")
+
+    def count_tokens(self, text):
+        """Count (or estimate, roughly 4 characters per token) the tokens in a piece of text"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def chunk(self, text, sections=None):
+        """
+        Split transcript text into chunks of at most max_tokens
+        Accepts sections already produced by PDFProcessor.extract_sections to avoid re-splitting
+        Returns a list of dicts with section, label and text. Chunks are grouped by section, in the
+        order extract_sections lists them, so a Q&A that returns to an earlier topic is not kept in
+        transcript order; paragraphs keep their order within each section
+        """
+        if sections is None:
+            pdf_processor = PDFProcessor()
+            sections = pdf_processor.extract_sections(text)
+
+        chunks = []
+        for section_name, section_text in sections.items():
+            if not section_text:
+                continue
+            for window in self._split_into_windows(section_text):
+                chunks.append({
+                    'section': section_name,
+                    'label': SECTION_LABELS.get(section_name, section_name.replace('_', ' ')),
+                    'text': window
+                })
+
+        # Fall back to the raw text if section extraction produced nothing usable
+        if not chunks and text.strip():
+            chunks = [
+                {'section': 'prepared_remarks', 'label': SECTION_LABELS['prepared_remarks'], 'text': window}
+                for window in self._split_into_windows(text)
+            ]
+
+        self.logger.debug(f"Split transcript into {len(chunks)} chunk(s) of up to {self.max_tokens} tokens")
+        return chunks
+
+    def _split_into_windows(self, text):
+        """Greedily pack paragraphs into windows that fit the token budget"""
+        windows = []
+        current_parts = []
+        current_tokens = 0
+
+        for paragraph in self._bounded_paragraphs(text):
+            paragraph_tokens = self.count_tokens(paragraph)
+            if current_parts and current_tokens + paragraph_tokens > self.max_tokens:
+                windows.append('\n\n'.join(current_parts))
+                current_parts = []
+                current_tokens = 0
+            current_parts.append(paragraph)
+            current_tokens += paragraph_tokens
+
+        if current_parts:
+            windows.append('\n\n'.join(current_parts))
+        return windows
+
+    def _bounded_paragraphs(self, text):
+        """Yield paragraphs, splitting any paragraph larger than the token budget by sentence"""
+        for paragraph in text.split('\n\n'):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if self.count_tokens(paragraph) <= self.max_tokens:
+                yield paragraph
+                continue
+
+            piece = ''
+            for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+                candidate = f"{piece} {sentence}" if piece else sentence
+                if piece and self.count_tokens(candidate) > self.max_tokens:
+                    yield from self._hard_split(piece)
+                    piece = sentence
+                else:
+                    piece = candidate
+            if piece:
+                yield from self._hard_split(piece)
+
+    def _hard_split(self, text):
+        """Split text with no usable sentence boundaries into fixed-size pieces"""
+        if self.count_tokens(text) <= self.max_tokens:
+            yield text
+            return
+
+        # Approximate the character budget from the observed characters-per-token ratio
+        chars_per_token = max(1, len(text) // max(1, self.count_tokens(text)))
+        step = max(1, self.max_tokens * chars_per_token)
+        for start in range(0, len(text), step):
+            yield text[start:start + step]
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Tests import the app's modules the way the app does, from the project folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database and scratch folders before any test module imports it
+WORK_FOLDER = tempfile.mkdtemp(prefix='equity-research-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORK_FOLDER, 'test.db')}",
+    'METRICS_FOLDER': os.path.join(WORK_FOLDER, 'metrics'),
+    'LLM_LIMITER_FOLDER': os.path.join(WORK_FOLDER, 'llm_limiter'),
+    'SINGLE_FLIGHT_FOLDER': os.path.join(WORK_FOLDER, 'single_flight'),
+    'LLM_RECORDINGS_FOLDER': os.path.join(WORK_FOLDER, 'llm_recordings'),
+    'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'test-key'),
+    'JOB_INLINE_WORKERS': '0',
+    'PDF_RENDER_WORKERS': '0'
+})
+
+
+def import_app():
+    """
+    Import the application, skipping the calling test module when it cannot load
+    The app imports the routes and so WeasyPrint, whose system libraries must be installed
+    """
+    # The app creates its upload and download folders relative to the working directory
+    previous_folder = os.getcwd()
+    os.chdir(WORK_FOLDER)
+    try:
+        from app import app
+    except OSError as e:
+        pytest.skip(f"The app cannot be imported here: {str(e).splitlines()[0]}", allow_module_level=True)
+    finally:
+        os.chdir(previous_folder)
+    app.config.update(
+        TESTING=True,
+        UPLOAD_FOLDER=os.path.join(WORK_FOLDER, 'uploads'),
+        DOWNLOAD_FOLDER=os.path.join(WORK_FOLDER, 'downloads')
+    )
+    return app
+
+
+@pytest.fixture
+def app_context():
+    """An application context with empty tables"""
+    app = import_app()
+    from app import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
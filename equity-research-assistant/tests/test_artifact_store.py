@@ -0,0 +1,113 @@
+import os
+import time
+import pytest
+from conftest import import_app
+
+import_app()
+
+from app import db
+from models import ResearchSession, StorageUsage
+from services.artifact_store import ArtifactStore, StorageQuotaExceeded, UPLOAD_USAGE_AREA
+from services.storage_retention import RetentionManager
+
+
+@pytest.fixture
+def upload_folder(app_context, tmp_path, monkeypatch):
+    """A fresh upload folder used by the store and retention manager"""
+    folder = str(tmp_path / 'uploads')
+    monkeypatch.setitem(app_context.config, 'UPLOAD_FOLDER', folder)
+    monkeypatch.setitem(app_context.config, 'DOWNLOAD_FOLDER', str(tmp_path / 'downloads'))
+    return folder
+
+
+def write_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def make_old(path, seconds=3600):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_identical_files_share_one_blob(upload_folder, tmp_path):
+    store = ArtifactStore(quota_bytes=0)
+    first = store.save_file(write_file(tmp_path, 'a.txt', b'same content'))
+    second = store.save_file(write_file(tmp_path, 'b.txt', b'same content'))
+
+    assert first == second
+    assert [entry.name for entry in store.iter_blobs()] == [f"{first}.txt"]
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (len(b'same content'), 1)
+
+
+def test_usage_survives_a_caller_rollback(upload_folder, tmp_path):
+    store = ArtifactStore(quota_bytes=0)
+    db.session.add(ResearchSession(session_id='rolled-back'))
+    store.save_file(write_file(tmp_path, 'a.txt', b'12345'))
+    db.session.rollback()
+
+    # The blob is on disk whether or not the caller commits, so its usage must be too
+    assert ResearchSession.query.count() == 0
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (5, 1)
+
+
+def test_upload_over_quota_is_rejected_and_discarded(upload_folder, tmp_path):
+    store = ArtifactStore(quota_bytes=8)
+    first = store.save_file(write_file(tmp_path, 'a.txt', b'12345'))
+
+    with pytest.raises(StorageQuotaExceeded):
+        store.save_file(write_file(tmp_path, 'b.txt', b'67890'))
+
+    # Only the first blob's shard is left; the rejected temp file is gone
+    assert [entry.name for entry in store.iter_blobs()] == [f"{first}.txt"]
+    assert os.listdir(store.blob_folder) == [first[:2]]
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (5, 1)
+
+
+def test_usage_is_clamped_at_zero(app_context):
+    StorageUsage.record(UPLOAD_USAGE_AREA, 10, 1)
+    db.session.commit()
+    StorageUsage.record(UPLOAD_USAGE_AREA, -25, -3)
+    db.session.commit()
+    StorageUsage.record_committed(UPLOAD_USAGE_AREA, -5, -1)
+
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (0, 0)
+
+
+def test_collect_removes_old_orphans_and_recounts_usage(upload_folder, tmp_path):
+    store = ArtifactStore(quota_bytes=0)
+    kept = store.save_file(write_file(tmp_path, 'kept.txt', b'referenced'))
+    old_orphan = store.save_file(write_file(tmp_path, 'old.txt', b'old orphan'))
+    new_orphan = store.save_file(write_file(tmp_path, 'new.txt', b'new orphan'))
+    db.session.add(ResearchSession(session_id='kept', summary_filename='kept.txt', summary_hash=kept))
+    db.session.commit()
+    make_old(store.blob_path(kept, 'txt'))
+    make_old(store.blob_path(old_orphan, 'txt'))
+    # Usage that drifted from the blob store is replaced by a fresh count
+    StorageUsage.record_committed(UPLOAD_USAGE_AREA, 1000, 5)
+
+    stats = RetentionManager(session_retention_days=0, orphan_grace_seconds=600, artifact_retention_days=0,
+                             batch_output_retention_days=0).collect()
+
+    assert stats['upload_files'] == 1
+    assert {store.blob_hash(entry.name) for entry in store.iter_blobs()} == {kept, new_orphan}
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (len(b'referenced') + len(b'new orphan'), 2)
+
+
+def test_release_session_keeps_shared_and_recent_blobs(upload_folder, tmp_path):
+    store = ArtifactStore(quota_bytes=0)
+    released = store.save_file(write_file(tmp_path, 'a.txt', b'released'))
+    shared = store.save_file(write_file(tmp_path, 'b.txt', b'shared'))
+    recent = store.save_file(write_file(tmp_path, 'c.txt', b'recent'))
+    db.session.add(ResearchSession(session_id='other', summary_filename='b.txt', summary_hash=shared))
+    db.session.commit()
+    make_old(store.blob_path(released, 'txt'))
+    make_old(store.blob_path(shared, 'txt'))
+
+    manager = RetentionManager(orphan_grace_seconds=600)
+    removed = manager.release_session([released, shared, recent, None])
+
+    assert removed == 1
+    assert {store.blob_hash(entry.name) for entry in store.iter_blobs()} == {shared, recent}
+    assert StorageUsage.get_usage(UPLOAD_USAGE_AREA) == (len(b'shared') + len(b'recent'), 2)
@@ -0,0 +1,61 @@
+import pytest
+from docx import Document
+from services.docx_writer import DocxReportWriter
+
+REPORT_DATA = {
+    'company_name': 'Example Corp',
+    'quarter': 'Q3 2025',
+    'generated_date': '2025-10-01',
+    'executive_summary': 'Strong quarter.\n\nGuidance raised.',
+    'financial_summary': [
+        {'metric': 'Revenue', 'previous': '1,000', 'estimate': '1,100', 'actual': 'N/A', 'variance': 'N/A'},
+        {'metric': 'EPS', 'previous': '1.20', 'estimate': '1.25', 'actual': 'N/A', 'variance': 'N/A'}
+    ],
+    'transcript_analysis': {'risks_and_tailwinds': 'FX headwinds.'},
+    'investment_thesis': ['Margin expansion']
+}
+
+
+def write_report(tmp_path, risk_analysis):
+    path = tmp_path / 'report.docx'
+    DocxReportWriter().write(dict(REPORT_DATA, risk_analysis=risk_analysis), str(path))
+    return Document(str(path))
+
+
+def risk_paragraphs(document):
+    texts = [paragraph.text for paragraph in document.paragraphs]
+    start = texts.index('Risk Assessment') + 1
+    return texts[start:texts.index('Q&A Insights')]
+
+
+def test_financial_table_has_a_row_per_line_item(tmp_path):
+    table = write_report(tmp_path, None).tables[0]
+    assert [cell.text for cell in table.rows[0].cells][0] == 'Metric'
+    assert [[cell.text for cell in row.cells] for row in table.rows[1:]] == [
+        ['Revenue', '1,000', '1,100', 'N/A', 'N/A'],
+        ['EPS', '1.20', '1.25', 'N/A', 'N/A']
+    ]
+
+
+def test_well_formed_risk_assessment(tmp_path):
+    document = write_report(tmp_path, {
+        'overall_risk_rating': 'Medium',
+        'key_risks': ['FX', 'Supply chain'],
+        'risk_mitigation': 'Hedging',
+        'positive_factors': ['Pricing power']
+    })
+    assert risk_paragraphs(document) == [
+        'Overall Risk Rating: Medium', 'FX', 'Supply chain', 'Mitigation: Hedging', 'Positive factors:', 'Pricing power'
+    ]
+    assert document.paragraphs[[p.text for p in document.paragraphs].index('FX')].style.name == 'List Bullet'
+
+
+@pytest.mark.parametrize('risk_analysis, expected', [
+    ({'key_risks': 'FX exposure', 'positive_factors': None}, ['FX exposure']),
+    ({'key_risks': None, 'risk_mitigation': ['Hedging', 'Dual sourcing']}, ['Mitigation: Hedging; Dual sourcing']),
+    ({'key_risks': [{'risk': 'FX', 'impact': 'High'}], 'overall_risk_rating': 3}, ['Overall Risk Rating: 3', 'risk: FX; impact: High']),
+    ({'key_risks': {'FX': 'High'}}, ['FX: High']),
+    ('Risks are moderate overall.', ['Risks are moderate overall.']),
+])
+def test_risk_fields_of_any_shape_render_as_text(tmp_path, risk_analysis, expected):
+    assert risk_paragraphs(write_report(tmp_path, risk_analysis)) == expected
@@ -0,0 +1,40 @@
+import math
+import pandas as pd
+import pytest
+from services.excel_processor import ExcelProcessor
+
+
+def first_values(cell):
+    """all_values of a Revenue row whose first value cell holds cell"""
+    frame = pd.DataFrame([['Revenue', cell, 1.0, 2.0]])
+    return ExcelProcessor()._extract_financial_data(frame)['line_items'][0]['all_values']
+
+
+@pytest.mark.parametrize('cell, expected', [
+    ('$(1,234)', -1234.0),
+    (' 12 ', 12.0),
+    ('1_000', 1000.0),  # float() accepts digit separators; pd.to_numeric does not
+    ('1e3', 1000.0),
+    ('١٢', 12.0),  # non-ASCII digits
+    (5, 5.0),
+])
+def test_value_cells_parse_like_float(cell, expected):
+    assert first_values(cell) == [expected, 1.0, 2.0]
+
+
+@pytest.mark.parametrize('cell', ['inf', '-Infinity'])
+def test_infinite_text_is_kept_like_float(cell):
+    assert math.isinf(first_values(cell)[0])
+
+
+@pytest.mark.parametrize('cell', ['nan', 'NaN', 'n/a', '', None])
+def test_nan_text_and_non_numbers_are_skipped(cell):
+    # The row-by-row version kept float('nan') from "nan" text, which then serialized as invalid JSON
+    assert first_values(cell) == [1.0, 2.0]
+
+
+def test_numeric_line_item_names_keep_their_own_text():
+    # iterrows upcast the whole row of an all-numeric sheet, so 2024 used to become "2024.0"
+    frame = pd.DataFrame([[2024, 1.5, 2.5], [7, 1.0, 2.0]])
+    names = [item['line_item'] for item in ExcelProcessor()._extract_generic_data(frame)]
+    assert names == ['2024', '7']
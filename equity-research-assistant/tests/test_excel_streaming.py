@@ -0,0 +1,38 @@
+from openpyxl import Workbook
+from services import excel_processor
+from services.excel_processor import ExcelProcessor, KEY_METRIC_GROUPS
+
+
+def write_workbook(path, filler_rows):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['Metric', 'Q1 2024', 'Q2 2024'])
+    for group in KEY_METRIC_GROUPS:
+        worksheet.append([group[0].title(), 1, 2])
+    for number in range(filler_rows):
+        worksheet.append([f'Other {number}', 1, 2])
+    workbook.save(path)
+
+
+def test_stops_once_every_metric_group_is_found(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_processor, 'STREAMING_METRIC_GAP_ROWS', 10)
+    write_workbook(tmp_path / 'model.xlsx', filler_rows=100)
+    metadata = ExcelProcessor(streaming=True).process_excel(str(tmp_path / 'model.xlsx'))['metadata']
+    assert metadata['scan_stopped'] == 'metrics_found'
+    assert metadata['rows_scanned'] < 100
+    assert not metadata['truncated']
+
+
+def test_row_limit_is_recorded_as_truncation(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_processor, 'STREAMING_MAX_ROWS', 5)
+    write_workbook(tmp_path / 'model.xlsx', filler_rows=0)
+    result = ExcelProcessor(streaming=True).process_excel(str(tmp_path / 'model.xlsx'))
+    assert result['metadata']['truncated']
+    assert result['metadata']['rows_scanned'] == 5
+    assert len(result['line_items']) == 4
+
+
+def test_whole_sheet_scan_is_not_marked_truncated(tmp_path):
+    write_workbook(tmp_path / 'model.xlsx', filler_rows=20)
+    metadata = ExcelProcessor(streaming=True).process_excel(str(tmp_path / 'model.xlsx'))['metadata']
+    assert metadata['scan_stopped'] is None and not metadata['truncated']
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from conftest import import_app
+
+import_app()
+
+from app import db
+from models import AnalysisJob
+from services import job_queue as job_queue_module
+from services.job_queue import JobQueue
+
+
+def add_job(session_id, status='queued', **fields):
+    job = AnalysisJob(session_id=session_id, job_type='transcript_analysis', status=status, **fields)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_enqueue_returns_the_active_job(app_context):
+    queue = JobQueue()
+    first = queue.enqueue('session-1')
+    second = queue.enqueue('session-1')
+
+    assert first.id == second.id
+    assert AnalysisJob.query.count() == 1
+
+
+def test_claim_takes_the_oldest_queued_job_once(app_context):
+    queue = JobQueue()
+    first_id = add_job('session-1')
+    second_id = add_job('session-2')
+
+    first = queue.claim_next('worker-a')
+    second = queue.claim_next('worker-b')
+
+    assert (first.id, first.status, first.worker_id, first.attempts) == (first_id, 'running', 'worker-a', 1)
+    assert (second.id, second.worker_id) == (second_id, 'worker-b')
+    assert queue.claim_next('worker-c') is None
+
+
+def test_claim_skips_a_job_another_worker_claimed_first(app_context):
+    queue = JobQueue()
+    first_id = add_job('session-1')
+    second_id = add_job('session-2')
+    raced = []
+
+    def claim_elsewhere(conn, cursor, statement, parameters, context, executemany):
+        # Another process claims the job this worker has just read, before its UPDATE runs
+        if statement.startswith('UPDATE analysis_job') and not raced:
+            raced.append(True)
+            with db.engine.begin() as other:
+                other.execute(
+                    db.update(AnalysisJob).where(AnalysisJob.id == first_id).values(status='running', worker_id='other')
+                )
+
+    event.listen(db.engine, 'before_cursor_execute', claim_elsewhere)
+    try:
+        job = queue.claim_next('worker-a')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', claim_elsewhere)
+
+    assert raced
+    assert job.id == second_id
+    assert db.session.get(AnalysisJob, first_id).worker_id == 'other'
+
+
+def test_stale_jobs_are_requeued_until_attempts_run_out(app_context):
+    queue = JobQueue()
+    stale = datetime.utcnow() - timedelta(seconds=120)
+    retried_id = add_job('session-1', status='running', attempts=1, updated_at=stale)
+    exhausted_id = add_job('session-2', status='running', attempts=3, updated_at=stale)
+    alive_id = add_job('session-3', status='running', attempts=1)
+
+    assert queue.requeue_stale(stale_seconds=60, max_attempts=3) == 2
+
+    statuses = {job.id: job.status for job in AnalysisJob.query}
+    assert statuses == {retried_id: 'queued', exhausted_id: 'failed', alive_id: 'running'}
+    assert db.session.get(AnalysisJob, exhausted_id).error == 'Worker stopped responding'
+
+
+def test_run_next_job_records_handler_failures(app_context, monkeypatch):
+    def failing_handler(job, report_progress):
+        report_progress(10, 'Started')
+        raise Exception('LLM unavailable')
+
+    monkeypatch.setitem(job_queue_module.JOB_HANDLERS, 'transcript_analysis', failing_handler)
+    job_id = add_job('session-1')
+
+    assert JobQueue().run_next_job('worker-a') is True
+    job = db.session.get(AnalysisJob, job_id)
+    db.session.refresh(job)
+    assert (job.status, job.error, job.progress) == ('failed', 'LLM unavailable', 10)
+    assert JobQueue().run_next_job('worker-a') is False
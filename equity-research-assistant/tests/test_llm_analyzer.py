@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from conftest import import_app
+
+app = import_app()
+
+from services.llm_analyzer import AsyncLLMAnalyzer
+
+
+def completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def test_overlapping_batches_send_each_request_once(app_context, monkeypatch):
+    calls = []
+
+    async def gather_completions(self, client, request_kwargs):
+        calls.append(len(request_kwargs))
+        await asyncio.sleep(0.3)
+        return [(completion(f"response {index}"), 0.3) for index in range(len(request_kwargs))]
+
+    monkeypatch.setattr(AsyncLLMAnalyzer, '_gather_completions', gather_completions)
+    requests = {
+        'summary': {'system_message': 'system', 'prompt': 'summarize', 'max_tokens': 100},
+        'risks': {'system_message': 'system', 'prompt': 'list risks', 'max_tokens': 100}
+    }
+    results = []
+
+    def run_session():
+        with app.app_context():
+            results.append(AsyncLLMAnalyzer().run_batch(requests))
+
+    sessions = [threading.Thread(target=run_session) for _ in range(3)]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+
+    assert calls == [2]
+    assert results == [results[0]] * 3
+    assert results[0] == {'summary': 'response 0', 'risks': 'response 1'}
+
+
+def test_map_reduce_workers_run_inside_an_app_context(app_context, monkeypatch):
+    from flask import has_app_context
+    contexts = []
+
+    def chat_completion(self, system_message, prompt, **kwargs):
+        contexts.append(has_app_context())
+        return '{"management_commentary": "part"}'
+
+    monkeypatch.setattr(AsyncLLMAnalyzer, '_chat_completion', chat_completion)
+    chunks = [{'section': 'qa_session', 'label': 'Q&A session', 'text': f"excerpt {index}"} for index in range(3)]
+    analysis = AsyncLLMAnalyzer()._map_reduce_transcript('Analyze this.', chunks)
+
+    assert contexts == [True] * 3
+    assert analysis['management_commentary'] == 'part'
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from conftest import import_app
+
+import_app()
+
+from app import db
+from models import LLMCacheEntry
+from services.llm_cache import LLMResponseCache
+from services.metrics import metrics
+
+
+def test_set_updates_a_row_another_writer_inserted(app_context, monkeypatch):
+    cache = LLMResponseCache(ttl_seconds=0, max_entries=10, max_bytes=10 ** 6)
+    write_entry = cache._write_entry
+    calls = []
+
+    def racing_write(cache_key, model, response_text):
+        calls.append(cache_key)
+        if len(calls) == 1:
+            # Both writers saw no row; the other one commits first
+            db.session.add(LLMCacheEntry(cache_key=cache_key, model=model, response_text='other writer'))
+            db.session.commit()
+            db.session.add(LLMCacheEntry(cache_key=cache_key, model=model, response_text=response_text))
+            db.session.commit()
+        write_entry(cache_key, model, response_text)
+
+    monkeypatch.setattr(cache, '_write_entry', racing_write)
+    cache.set('k' * 64, 'gpt-4o', 'ours')
+
+    assert len(calls) == 2
+    assert [entry.response_text for entry in LLMCacheEntry.query.all()] == ['ours']
+
+
+def test_expired_entries_miss_and_are_removed(app_context):
+    cache = LLMResponseCache(ttl_seconds=60, max_entries=10, max_bytes=10 ** 6)
+    cache.set('a' * 64, 'gpt-4o', 'old')
+    LLMCacheEntry.query.update({'created_at': datetime.utcnow() - timedelta(seconds=120)})
+    db.session.commit()
+
+    assert cache.get('a' * 64) is None
+    assert LLMCacheEntry.query.count() == 0
+
+
+def test_least_recently_used_entries_are_evicted_first(app_context):
+    cache = LLMResponseCache(ttl_seconds=0, max_entries=2, max_bytes=10 ** 6)
+    cache.set('a' * 64, 'gpt-4o', 'first')
+    cache.set('b' * 64, 'gpt-4o', 'second')
+    LLMCacheEntry.query.filter_by(cache_key='a' * 64).update({'last_accessed_at': datetime.utcnow() + timedelta(seconds=5)})
+    db.session.commit()
+    cache.set('c' * 64, 'gpt-4o', 'third')
+
+    assert sorted(entry.cache_key[0] for entry in LLMCacheEntry.query.all()) == ['a', 'c']
+
+
+def test_size_bound_evicts_until_under_the_limit(app_context):
+    cache = LLMResponseCache(ttl_seconds=0, max_entries=10, max_bytes=10)
+    cache.set('a' * 64, 'gpt-4o', '123456')
+    cache.set('b' * 64, 'gpt-4o', '123456')
+
+    assert [entry.cache_key[0] for entry in LLMCacheEntry.query.all()] == ['b']
+
+
+def test_hits_and_misses_are_exported(app_context):
+    cache = LLMResponseCache(ttl_seconds=0, max_entries=10, max_bytes=10 ** 6)
+    before = dict(metrics.snapshot().get('llm_cache_events_total', {}))
+    cache.get('z' * 64)
+    cache.set('z' * 64, 'gpt-4o', 'cached')
+    cache.get('z' * 64)
+
+    after = metrics.snapshot()['llm_cache_events_total']
+    for event in ('hit', 'miss'):
+        key = f'event="{event}",route="background"'
+        assert after[key] == before.get(key, 0) + 1
+    assert 'equity_research_llm_cache_events_total{event="hit",route="background"}' in metrics.render()
@@ -0,0 +1,130 @@
+import pytest
+from types import SimpleNamespace
+from openai import APIConnectionError, BadRequestError, RateLimitError
+from services.llm_limiter import LLMLimiter, CircuitOpenError, RateLimitTimeout
+
+# The errors only read these attributes, so tests need not build real HTTP responses
+REQUEST = SimpleNamespace(method='POST', url='http://llm.test/v1/chat/completions')
+
+
+def status_error(error_class, status_code, headers=None):
+    response = SimpleNamespace(request=REQUEST, status_code=status_code, headers=headers or {})
+    return error_class('error', response=response, body=None)
+
+
+def make_limiter(folder=None, **limits):
+    limiter = LLMLimiter()
+    settings = dict(max_retries=0, retry_base_seconds=0.01, failure_threshold=2, reset_seconds=30.0)
+    settings.update(limits)
+    limiter.configure(folder, **settings)
+    return limiter
+
+
+def fail_with(error):
+    def attempt():
+        raise error
+    return attempt
+
+
+def open_breaker(limiter):
+    for _ in range(limiter.failure_threshold):
+        with pytest.raises(APIConnectionError):
+            limiter.call(fail_with(APIConnectionError(request=REQUEST)), 10)
+
+
+def test_breaker_opens_after_consecutive_failures_and_fails_fast():
+    limiter = make_limiter()
+    open_breaker(limiter)
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        limiter.call(lambda: calls.append(1) or ('ok', None), 10)
+    assert calls == []
+
+
+def test_half_open_breaker_lets_one_probe_through_and_closes_on_success():
+    limiter = make_limiter()
+    open_breaker(limiter)
+    limiter._memory_state['circuit']['opened_until'] = 1  # reset period over
+
+    assert limiter.call(lambda: ('ok', None), 10) == ('ok', None)
+    assert limiter.status()['circuit'] == {}
+
+
+def test_probe_in_flight_blocks_other_callers():
+    limiter = make_limiter()
+    open_breaker(limiter)
+    limiter._memory_state['circuit']['opened_until'] = 1
+    limiter.reserve(10)  # the probe
+
+    with pytest.raises(CircuitOpenError, match='probe call is in flight'):
+        limiter.reserve(10)
+
+
+def test_probe_answered_with_a_client_error_closes_the_breaker():
+    limiter = make_limiter()
+    open_breaker(limiter)
+    limiter._memory_state['circuit']['opened_until'] = 1
+
+    with pytest.raises(BadRequestError):
+        limiter.call(fail_with(status_error(BadRequestError, 400)), 10)
+    assert limiter.status()['circuit'] == {}
+    assert limiter.call(lambda: ('ok', None), 10) == ('ok', None)
+
+
+def test_probe_failing_before_the_api_frees_the_probe_slot():
+    limiter = make_limiter()
+    open_breaker(limiter)
+    limiter._memory_state['circuit']['opened_until'] = 1
+
+    with pytest.raises(ValueError):
+        limiter.call(fail_with(ValueError('bad request body')), 10)
+    assert 'probe_until' not in limiter.status()['circuit']
+    assert limiter.call(lambda: ('ok', None), 10) == ('ok', None)
+
+
+def test_rate_limit_pauses_every_caller_for_retry_after():
+    limiter = make_limiter()
+    with pytest.raises(RateLimitError):
+        limiter.call(fail_with(status_error(RateLimitError, 429, {'retry-after': '20'})), 10)
+
+    assert 19 < limiter.reserve(10) <= 20
+    assert limiter.status()['circuit'] == {}
+
+
+def test_request_bucket_queues_callers_beyond_the_quota():
+    limiter = make_limiter(requests_per_minute=60)
+    waits = [limiter.reserve(10) for _ in range(62)]
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0, abs=0.05)
+    assert waits[61] == pytest.approx(2.0, abs=0.05)
+
+
+def test_queue_longer_than_the_maximum_wait_is_refused_and_refunded():
+    limiter = make_limiter(requests_per_minute=60, max_wait_seconds=1.5)
+    for _ in range(61):
+        limiter.reserve(10)
+    with pytest.raises(RateLimitTimeout):
+        limiter.reserve(10)
+    assert limiter.status()['requests']['level'] == pytest.approx(-1, abs=0.05)
+
+
+def test_retries_transient_errors_then_succeeds():
+    limiter = make_limiter(max_retries=2)
+    attempts = []
+
+    def attempt():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise status_error(RateLimitError, 429)
+        return 'ok', None
+
+    assert limiter.call(attempt, 10) == ('ok', None)
+    assert len(attempts) == 3
+
+
+def test_state_is_shared_through_the_folder(tmp_path):
+    first = make_limiter(str(tmp_path))
+    second = make_limiter(str(tmp_path))
+    open_breaker(first)
+    with pytest.raises(CircuitOpenError):
+        second.reserve(10)
@@ -0,0 +1,33 @@
+import json
+import os
+import time
+from services.metrics import MetricsRegistry
+
+
+def saved_totals(folder):
+    with open(os.path.join(folder, f"process-{os.getpid()}.json")) as metrics_file:
+        return json.load(metrics_file)
+
+
+def test_idle_process_flushes_its_last_observations(tmp_path):
+    registry = MetricsRegistry()
+    registry.configure(str(tmp_path), flush_seconds=0.1)
+    registry.inc('http_requests_total', {'route': 'index', 'status': 200})
+    registry.inc('http_requests_total', {'route': 'index', 'status': 200})
+
+    # No further observation arrives; the background thread writes the second one
+    time.sleep(0.5)
+    assert saved_totals(str(tmp_path))['http_requests_total'] == {'route="index",status="200"': 2}
+
+
+def test_collect_adds_up_saved_processes_and_archives_exited_ones(tmp_path):
+    registry = MetricsRegistry()
+    registry.configure(str(tmp_path), flush_seconds=60)
+    registry.inc('http_requests_total', {'route': 'index', 'status': 200})
+    exited_pid = 2 ** 22 + 1  # above the default pid_max, so never a live process
+    with open(os.path.join(str(tmp_path), f"process-{exited_pid}.json"), 'w') as metrics_file:
+        json.dump({'http_requests_total': {'route="index",status="200"': 3}}, metrics_file)
+
+    assert registry.collect()['http_requests_total'] == {'route="index",status="200"': 4}
+    assert not os.path.exists(os.path.join(str(tmp_path), f"process-{exited_pid}.json"))
+    assert registry.collect()['http_requests_total'] == {'route="index",status="200"': 4}
@@ -0,0 +1,25 @@
+import json
+import pytest
+from services.partial_json import PartialJSONObjectParser
+
+DOCUMENT = '{"rating": 12.5, "growth": 1e3, "delta": -4, "summary": "ok"}'
+
+
+@pytest.mark.parametrize('split_after', ['12.', '1e', '-'])
+def test_number_split_mid_token_waits_for_the_rest(split_after):
+    cut = DOCUMENT.index(split_after) + len(split_after)
+    parser = PartialJSONObjectParser()
+    parser.feed(DOCUMENT[:cut])
+    assert parser.feed(DOCUMENT[cut:]) == json.loads(DOCUMENT)
+
+
+def test_every_split_point_gives_the_full_object():
+    for cut in range(len(DOCUMENT) + 1):
+        parser = PartialJSONObjectParser()
+        partial = parser.feed(DOCUMENT[:cut])
+        # Fields seen early must never disagree with the final value
+        final = json.loads(DOCUMENT)
+        for key, value in partial.items():
+            if not isinstance(value, str):
+                assert value == final[key], (cut, key, value)
+        assert parser.feed(DOCUMENT[cut:]) == final
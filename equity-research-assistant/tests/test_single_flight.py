@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+import pytest
+from services.single_flight import SingleFlight
+
+
+@pytest.fixture
+def flight(tmp_path):
+    flight = SingleFlight()
+    flight.configure(str(tmp_path), wait_seconds=5)
+    return flight
+
+
+def run_threads(count, target):
+    results = [None] * count
+    errors = []
+
+    def worker(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_callers_compute_once(flight, tmp_path):
+    stored = {}
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.2)
+        stored['result'] = 'computed'
+        return 'computed'
+
+    results, errors = run_threads(4, lambda: flight.run('artifact:a', compute, lambda: stored.get('result')))
+
+    assert errors == []
+    assert len(calls) == 1
+    assert results == ['computed'] * 4
+    # Lock files are removed on release
+    assert os.listdir(tmp_path) == []
+
+
+def test_stored_result_is_returned_without_computing(flight):
+    def compute():
+        raise AssertionError('compute should not run')
+
+    assert flight.run('artifact:a', compute, lambda: 'stored') == 'stored'
+
+
+def test_follower_computes_when_the_leader_fails(flight):
+    leader_started = threading.Event()
+
+    def failing_compute():
+        leader_started.set()
+        time.sleep(0.2)
+        raise Exception('parse failed')
+
+    def leader():
+        with pytest.raises(Exception, match='parse failed'):
+            flight.run('artifact:a', failing_compute, lambda: None)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_started.wait()
+    assert flight.run('artifact:a', lambda: 'follower result', lambda: None) == 'follower result'
+    thread.join()
+
+
+def test_follower_computes_after_waiting_too_long(flight):
+    flight.configure(flight._folder, wait_seconds=0.2)
+    leader_started = threading.Event()
+    release_leader = threading.Event()
+
+    def slow_compute():
+        leader_started.set()
+        release_leader.wait(5)
+        return 'leader result'
+
+    thread = threading.Thread(target=lambda: flight.run('artifact:a', slow_compute, lambda: None))
+    thread.start()
+    leader_started.wait()
+    try:
+        started = time.monotonic()
+        assert flight.run('artifact:a', lambda: 'timed out', lambda: None) == 'timed out'
+        assert time.monotonic() - started < 2
+    finally:
+        release_leader.set()
+        thread.join()
+
+
+def test_run_without_a_folder_computes_directly():
+    flight = SingleFlight()
+    assert flight.run('artifact:a', lambda: 'computed', lambda: 'stored') == 'computed'
+
+
+def test_run_many_waits_for_a_leader_and_returns_its_result(flight):
+    stored = {}
+    leader_started = threading.Event()
+
+    def leader():
+        with flight.run_many(['llm:a'], stored.get) as found:
+            assert found == {}
+            leader_started.set()
+            time.sleep(0.2)
+            stored['llm:a'] = 'from leader'
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_started.wait()
+    with flight.run_many(['llm:b', 'llm:a'], stored.get) as found:
+        assert found == {'llm:a': 'from leader'}
+    thread.join()
+
+
+def test_run_many_without_a_folder_locks_nothing():
+    flight = SingleFlight()
+    with flight.run_many(['llm:a'], lambda key: 'stored') as found:
+        assert found == {}
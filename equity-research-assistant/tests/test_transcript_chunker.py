@@ -0,0 +1,19 @@
+from services.transcript_chunker import TranscriptChunker
+
+
+def test_windows_stay_within_the_token_budget():
+    chunker = TranscriptChunker(max_tokens=50)
+    text = '\n\n'.join(f"Paragraph {index}. " + 'Revenue grew strongly this quarter. ' * 5 for index in range(20))
+    chunks = chunker.chunk(text, sections={'prepared_remarks': text})
+    assert len(chunks) > 1
+    assert all(chunker.count_tokens(chunk['text']) <= 50 for chunk in chunks)
+
+
+def test_chunks_are_grouped_by_section_in_section_order():
+    chunker = TranscriptChunker(max_tokens=1000)
+    sections = {'prepared_remarks': 'Opening.\n\nGuidance.', 'qa_session': 'First question.', 'forward_looking_statements': ''}
+    chunks = chunker.chunk('unused', sections=sections)
+    assert [(chunk['section'], chunk['text']) for chunk in chunks] == [
+        ('prepared_remarks', 'Opening.\n\nGuidance.'),
+        ('qa_session', 'First question.')
+    ]
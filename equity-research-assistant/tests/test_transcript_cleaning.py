@@ -0,0 +1,53 @@
+import random
+import re
+import pytest
+from services.pdf_processor import PDFProcessor
+
+
+def clean_multi_pass(raw_text):
+    """The original one-substitution-per-rule cleaner the single-pass pattern replaced"""
+    cleaned_text = re.sub(r'\n\s*\n', '\n\n', raw_text)
+    cleaned_text = re.sub(r'[ \t]+', ' ', cleaned_text)
+    cleaned_text = re.sub(r'Page \d+ of \d+', '', cleaned_text)
+    cleaned_text = re.sub(r'©.*?(?=\n)', '', cleaned_text)
+    cleaned_text = re.sub(r'(\w)-\s*\n\s*(\w)', r'\1\2', cleaned_text)
+    cleaned_text = re.sub(r'\.(\w)', r'. \1', cleaned_text)
+    cleaned_text = re.sub(r'\?(\w)', r'? \1', cleaned_text)
+    cleaned_text = re.sub(r'!(\w)', r'! \1', cleaned_text)
+    cleaned_text = re.sub(r' +', ' ', cleaned_text)
+    return cleaned_text.strip()
+
+
+@pytest.mark.parametrize('raw_text', [
+    'Revenue  \tgrew 10%',
+    'Revenue\t  grew',
+    'a \t \t b',
+    'end of sentence.Next one?Yes!Done',
+])
+def test_matches_multi_pass_cleaner(raw_text):
+    assert PDFProcessor()._clean_transcript_text(raw_text) == clean_multi_pass(raw_text)
+
+
+def test_random_space_and_tab_runs_match_multi_pass_cleaner():
+    rng = random.Random(0)
+    processor = PDFProcessor()
+    for _ in range(5000):
+        raw_text = ''.join(rng.choice(['a', 'b', ' ', ' ', '\t', '.', '!']) for _ in range(rng.randint(0, 20)))
+        assert processor._clean_transcript_text(raw_text) == clean_multi_pass(raw_text), repr(raw_text)
+
+
+@pytest.mark.parametrize('raw_text, expected', [
+    ('end of remarks.Page 3 of 40 Next speaker', 'end of remarks. Next speaker'),
+    ('revenue  Page 3 of 40  grew', 'revenue grew'),
+    ('growth.Page 3 of 40\tmargins', 'growth. margins'),
+])
+def test_page_markers_between_words_leave_one_space(raw_text, expected):
+    assert PDFProcessor()._clean_transcript_text(raw_text) == expected
+
+
+def test_random_page_markers_never_leave_double_spaces():
+    rng = random.Random(0)
+    processor = PDFProcessor()
+    for _ in range(5000):
+        raw_text = ''.join(rng.choice(['a', ' ', '\t', '\n', '.', 'Page 1 of 2', 'Page 3 of 4 ']) for _ in range(rng.randint(0, 12)))
+        assert '  ' not in processor._clean_transcript_text(raw_text), repr(raw_text)
@@ -0,0 +1,211 @@
+"""
+Minimal OpenAI-compatible chat completions server for local testing
+
+Serves canned responses for POST /v1/chat/completions, including token
+streaming, so the app can be exercised without an API key:
+
+    python tools/fake_openai_server.py --port 8089 --token-delay 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test python main.py
+
+For load tests, --latency and --latency-jitter set the time to the first token and
+--tokens-per-second the generation rate; non-streamed responses wait for the whole
+generation before answering, like the real API. --requests-per-minute enforces a quota
+with 429 responses and Retry-After headers, and --error-rate fails a share of requests
+with a 500.
+"""
+import re
+import random
+import json
+import time
+import uuid
+import signal
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned transcript analysis, also accepted as a risk analysis by the report generator
+FAKE_ANALYSIS = {
+    "management_commentary": "Management described the quarter as a period of steady execution, with demand holding up across core segments and guidance reiterated for the full year.",
+    "strategic_themes": "Continued investment in product development, expansion into adjacent markets and a focus on operating efficiency.",
+    "risks_and_tailwinds": "Risks include input cost inflation and foreign exchange headwinds; tailwinds include pricing actions and a growing recurring revenue base.",
+    "qa_insights": "Analysts focused on margin trajectory and capital allocation; management signalled continued buybacks.",
+    "financial_highlights": "Revenue grew year over year with gross margin expansion.",
+    "market_dynamics": "Competitive intensity remains elevated but the company continues to gain share.",
+    "key_risks": ["Input cost inflation", "Foreign exchange headwinds"],
+    "risk_mitigation": "Pricing actions and hedging programs offset part of the cost pressure.",
+    "positive_factors": ["Recurring revenue growth", "Strong balance sheet"],
+    "overall_risk_rating": "Medium"
+}
+
+FAKE_SUMMARY = "The company delivered a solid quarter with revenue growth and margin expansion, while management reiterated full-year guidance and highlighted continued investment in growth initiatives."
+
+
+def split_tokens(text):
+    """Split text into word-sized pieces that roughly resemble model tokens"""
+    return re.findall(r'\s*\S+', text) or [text]
+
+
+class RequestQuota:
+    """Requests-per-minute token bucket; take() returns None when a request is allowed, else seconds to wait"""
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(requests_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level >= 1:
+                self.level -= 1
+                return None
+            self.rejected += 1
+            return (1 - self.level) / self.rate
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the chat completions endpoint"""
+
+    token_delay = 0.0
+    latency = 0.0
+    latency_jitter = 0.0
+    error_rate = 0.0
+    quota = None
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        retry_after = self.quota.take() if self.quota else None
+        if retry_after is not None:
+            self._send_json(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                            "code": "rate_limit_exceeded"}},
+                            {'Retry-After': f"{retry_after:.3f}", 'retry-after-ms': str(int(retry_after * 1000))})
+            return
+        if random.random() < self.error_rate:
+            self._send_json(500, {"error": {"message": "The server had an error processing your request", "type": "server_error"}})
+            return
+
+        response_format = request.get('response_format') or {}
+        if response_format.get('type') == 'json_object':
+            content = json.dumps(FAKE_ANALYSIS, indent=2)
+        else:
+            content = FAKE_SUMMARY
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get('model', 'gpt-4o')
+        usage = self._usage(request, content)
+
+        if request.get('stream'):
+            include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+            self._stream_completion(completion_id, model, content, usage if include_usage else None)
+        else:
+            time.sleep(self.token_delay * usage["completion_tokens"])
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+    @staticmethod
+    def _usage(request, content):
+        """Approximate token counts for the request and the canned response"""
+        prompt_tokens = sum(len(split_tokens(message.get('content') or '')) for message in request.get('messages', []))
+        completion_tokens = len(split_tokens(content))
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _stream_completion(self, completion_id, model, content, usage=None):
+        """Send the content as chat.completion.chunk server-sent events"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None, usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if usage:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        send_chunk({"role": "assistant", "content": ""})
+        for token in split_tokens(content):
+            time.sleep(self.token_delay)
+            send_chunk({"content": token})
+        send_chunk({}, finish_reason="stop")
+        if usage:
+            send_chunk({}, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before the first token')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='Random +/- seconds added to --latency')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds between generated tokens')
+    parser.add_argument('--tokens-per-second', type=float, help='Generation rate; overrides --token-delay')
+    parser.add_argument('--requests-per-minute', type=float, help='Quota above which requests get a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.latency = args.latency
+    FakeOpenAIHandler.latency_jitter = args.latency_jitter
+    FakeOpenAIHandler.token_delay = 1.0 / args.tokens_per_second if args.tokens_per_second else args.token_delay
+    FakeOpenAIHandler.error_rate = args.error_rate
+    if args.requests_per_minute:
+        FakeOpenAIHandler.quota = RequestQuota(args.requests_per_minute)
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    print(f"Fake OpenAI server listening on http://{args.host}:{args.port}/v1")
+    # Stop cleanly (and report rejected requests) on SIGTERM as well as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    if FakeOpenAIHandler.quota:
+        print(f"Rejected {FakeOpenAIHandler.quota.rejected} requests over the quota")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Load test the research workflow against a running instance of the app
+
+Each simulated user starts a session, uploads a workbook and a transcript, approves the
+financial data, waits for the transcript analysis job, generates the report and downloads
+it. Sessions run concurrently and the response times of every request are reported by
+route as p50/p95/p99:
+
+    LLM_BACKEND=replay LLM_REPLAY_MATCH=loose python main.py
+    python tools/load_test.py --base-url http://127.0.0.1:5000 --sessions 20 --concurrency 5
+
+Point the app at tools/fake_openai_server.py (OPENAI_BASE_URL) or at recordings made with
+LLM_BACKEND=record so no load test ever reaches the OpenAI API. Without --excel/--pdf the
+inputs are generated with benchmarks/synthetic.py.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PERCENTILES = (50, 95, 99)
+
+
+class WorkflowError(Exception):
+    """Raised when a step of a session does not end where the workflow expects"""
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Return redirects to the caller so each request is timed on its own"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def encode_multipart(fields, files):
+    """Body and content type of a multipart/form-data request; files maps a field to (filename, path)"""
+    boundary = f"----loadtest{uuid.uuid4().hex}"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, path) in files.items():
+        with open(path, 'rb') as upload:
+            content = upload.read()
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Results:
+    """Response times by route, shared by all sessions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+        self.failures = []
+
+    def add(self, route, seconds, ok=True):
+        with self._lock:
+            self.timings.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def fail(self, session_number, message):
+        with self._lock:
+            self.failures.append({'session': session_number, 'error': message})
+
+    def summary(self):
+        """Count, errors and latency percentiles in milliseconds for each route"""
+        routes = {}
+        for route, values in sorted(self.timings.items()):
+            values = sorted(values)
+            stats = {'count': len(values), 'errors': self.errors.get(route, 0),
+                     'mean_ms': round(1000 * sum(values) / len(values), 1),
+                     'max_ms': round(1000 * values[-1], 1)}
+            for pct in PERCENTILES:
+                stats[f'p{pct}_ms'] = round(1000 * percentile(values, pct), 1)
+            routes[route] = stats
+        return routes
+
+
+class Session:
+    """One simulated user walking through the workflow with its own cookie jar"""
+
+    def __init__(self, number, args, inputs, results):
+        self.number = number
+        self.args = args
+        self.inputs = inputs
+        self.results = results
+        self.base_url = args.base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            excel_path, pdf_path = self.inputs
+            self.request('GET', '/')
+            body, content_type = encode_multipart(
+                {'company_name': f"Load Test {self.number}" if self.args.unique_inputs else "Load Test",
+                 'quarter': 'Q1 2025'},
+                {'excel_file': ('model.xlsx', excel_path), 'pdf_file': ('transcript.pdf', pdf_path)}
+            )
+            self.request('POST', '/upload', body, content_type, expect_redirect='/step1')
+            self.request('GET', '/step1')
+            self.request('POST', '/approve_financial', expect_redirect='/step2')
+            self.wait_for_analysis()
+            self.request('POST', '/approve_analysis', expect_redirect='/step3')
+            self.request('GET', '/step3')
+            for export_format in self.args.formats:
+                self.request('GET', f'/download_report/{export_format}', route='GET /download_report/<format>')
+            self.results.add('session', time.perf_counter() - start)
+        except (WorkflowError, OSError) as e:
+            self.results.add('session', time.perf_counter() - start, ok=False)
+            self.results.fail(self.number, str(e))
+
+    def wait_for_analysis(self):
+        """Open step 2, which queues the analysis job, and poll its status until it finishes"""
+        start = time.perf_counter()
+        self.request('GET', '/step2')
+        deadline = start + self.args.analysis_timeout
+        while True:
+            status = json.loads(self.request('GET', '/step2/status'))
+            if status.get('status') == 'completed':
+                self.results.add('analysis job (queued to completed)', time.perf_counter() - start)
+                return
+            if status.get('status') == 'failed':
+                self.results.add('analysis job (queued to completed)', time.perf_counter() - start, ok=False)
+                raise WorkflowError(f"Analysis failed: {status.get('error') or status.get('message')}")
+            if time.perf_counter() > deadline:
+                raise WorkflowError(f"Analysis not finished after {self.args.analysis_timeout:.0f}s")
+            time.sleep(self.args.poll_interval)
+
+    def request(self, method, path, body=None, content_type=None, expect_redirect=None, route=None):
+        """
+        Send one request and record its time under route (default "METHOD path")
+        A redirect anywhere but expect_redirect means the app flashed an error and sent the user back
+        """
+        route = route or f"{method} {path}"
+        headers = {'Content-Type': content_type} if content_type else {}
+        request = urllib.request.Request(self.base_url + path, data=body if body is not None else (b'' if method == 'POST' else None),
+                                         headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.args.request_timeout) as response:
+                status, location, content = response.status, None, response.read()
+        except urllib.error.HTTPError as e:
+            status, location, content = e.code, e.headers.get('Location'), e.read()
+        except OSError:
+            self.results.add(route, time.perf_counter() - start, ok=False)
+            raise
+        elapsed = time.perf_counter() - start
+
+        ok = (300 <= status < 400 and urllib.parse.urlparse(location or '').path == expect_redirect) \
+            if expect_redirect else status == 200
+        self.results.add(route, elapsed, ok)
+        if not ok:
+            where = f" to {location}" if location else ''
+            raise WorkflowError(f"{method} {path} returned {status}{where}")
+        return content
+
+
+def prepare_inputs(args, work_folder):
+    """(excel, pdf) paths for each session: the given files, or generated ones"""
+    if args.excel and args.pdf:
+        return [(args.excel, args.pdf)] * args.sessions
+
+    sys.path.insert(0, PROJECT_FOLDER)
+    sys.path.insert(0, os.path.join(PROJECT_FOLDER, 'benchmarks'))
+    import synthetic
+
+    seeds = range(args.sessions) if args.unique_inputs else [0]
+    generated = {}
+    for seed in seeds:
+        excel_path = args.excel or os.path.join(work_folder, f'model-{seed}.xlsx')
+        pdf_path = args.pdf or os.path.join(work_folder, f'transcript-{seed}.pdf')
+        if not args.excel:
+            synthetic.make_workbook(excel_path, rows=args.rows, seed=seed)
+        if not args.pdf:
+            synthetic.make_transcript_pdf(pdf_path, pages=args.pages, seed=seed)
+        generated[seed] = (excel_path, pdf_path)
+    return [generated[number if args.unique_inputs else 0] for number in range(args.sessions)]
+
+
+def print_summary(summary, failures, wall_seconds, sessions):
+    header = f"{'route':<40} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for route, stats in summary.items():
+        print(f"{route:<40} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>9} "
+              f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    completed = sessions - len(failures)
+    print(f"\n{completed}/{sessions} sessions completed in {wall_seconds:.1f}s "
+          f"({completed / wall_seconds * 60:.1f} sessions/minute)")
+    for failure in failures[:10]:
+        print(f"  session {failure['session']}: {failure['error']}")
+    if len(failures) > 10:
+        print(f"  ... and {len(failures) - 10} more failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--sessions', type=int, default=10, help='Number of sessions to run')
+    parser.add_argument('--concurrency', type=int, default=5, help='Sessions in flight at once')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='Seconds over which to spread session starts')
+    parser.add_argument('--excel', help='Workbook to upload (default: generated)')
+    parser.add_argument('--pdf', help='Transcript PDF to upload (default: generated)')
+    parser.add_argument('--rows', type=int, default=500, help='Rows per generated workbook')
+    parser.add_argument('--pages', type=int, default=20, help='Pages per generated transcript')
+    parser.add_argument('--unique-inputs', action='store_true',
+                        help='Give every session its own company name and generated files, defeating the upload, '
+                             'artifact and LLM caches')
+    parser.add_argument('--formats', type=lambda value: value.split(','), default=['pdf'],
+                        help='Comma-separated report formats to download (pdf, docx)')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between analysis status checks')
+    parser.add_argument('--analysis-timeout', type=float, default=600.0)
+    parser.add_argument('--request-timeout', type=float, default=300.0)
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    work_folder = tempfile.mkdtemp(prefix='load-test-')
+    try:
+        print(f"Preparing inputs for {args.sessions} sessions...")
+        inputs = prepare_inputs(args, work_folder)
+        results = Results()
+
+        def run_session(number):
+            if args.ramp_up and args.sessions > 1:
+                time.sleep(args.ramp_up * number / (args.sessions - 1) + random.uniform(0, 0.05))
+            Session(number, args, inputs[number], results).run()
+
+        print(f"Running {args.sessions} sessions against {args.base_url} with concurrency {args.concurrency}...\n")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            list(executor.map(run_session, range(args.sessions)))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    summary = results.summary()
+    print_summary(summary, results.failures, wall_seconds, args.sessions)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'base_url': args.base_url, 'sessions': args.sessions, 'concurrency': args.concurrency,
+                       'wall_seconds': round(wall_seconds, 3), 'routes': summary, 'failures': results.failures},
+                      output_file, indent=2)
+            output_file.write('\n')
+
+    sys.exit(1 if results.failures else 0)
+
+
+if __name__ == '__main__':
+    main()